@@ -1,35 +1,134 @@
 import os
-from crewai import Agent, Task, Crew, Process, LLM
-from models import Specification # Ensure this import is correct
+import json
+import time
+import queue
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import lru_cache
+import tracing
+import model_router
+from model_router import ROUTER, RunRouting
+from models import Specification, SpecReview # Ensure this import is correct
+from rate_limiter import gemini_limiter, estimate_tokens
+from hedging import HEDGER, deadline_for
+from spec_sections import PARALLEL_SECTIONS, SPEC_SECTIONS, merge_sections
+from spec_patch import PATCH_REVIEW, REVIEW_FAILED, review_to_spec
+from crew_context import TaskContext, extract_stories, output_text, with_shared_prefix
+from json_extract import parse_json
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# CrewAI is imported on first use, not at module import: pulling it in costs
+# seconds, and most Streamlit reruns never generate anything.
+
+
 # ---------------------------------------------
 #  VALIDATE API KEY
 # ---------------------------------------------
-if "GEMINI_API_KEY" not in os.environ:
-    # This check is redundant with the one in app.py, but essential for CLI runs.
-    raise ValueError("ERROR: GEMINI_API_KEY is missing from environment variables.")
+def _require_api_key() -> str:
+    if "GEMINI_API_KEY" not in os.environ:
+        # This check is redundant with the one in app.py, but essential for CLI runs.
+        raise ValueError("ERROR: GEMINI_API_KEY is missing from environment variables.")
+    return os.environ["GEMINI_API_KEY"]
+
 
 # ---------------------------------------------
-#  LLM CONFIGURATION (Gemini 2.5 Flash - stable and reliable)
+#  RATE-LIMITED LLM (shares the Gemini budget with specgen_core)
 # ---------------------------------------------
-my_llm = LLM(
-    model="gemini-2.5-flash",     # Use the latest, stable model name
-    api_key=os.environ["GEMINI_API_KEY"],
-    temperature=0.4,
-    verbose=True, # Set to True for debugging agent thought process
-)
+@lru_cache(maxsize=None)
+def _rate_limited_llm_class():
+    from crewai import LLM
+
+    class RateLimitedLLM(LLM):
+        """
+        CrewAI LLM whose calls queue behind the process-wide Gemini rate
+        limiter and start with the shared, cacheable instruction prefix.
+        route is the agent it serves: its deadline is passed as the LLM
+        timeout and its calls are hedged on that route's p90.
+        """
+
+        def __init__(self, *args, route: str = None, **kwargs):
+            super().__init__(*args, timeout=deadline_for(route), **kwargs)
+            self.route = route
+
+        def call(self, messages, *args, **kwargs):
+            messages = with_shared_prefix(messages)
+            with tracing.span("llm.crew", **{tracing.MODEL: self.model}) as span:
+                text = HEDGER.call(
+                    lambda: gemini_limiter.call(
+                        lambda: super(RateLimitedLLM, self).call(messages, *args, **kwargs),
+                        estimated_tokens=estimate_tokens(messages),
+                    ),
+                    key=(self.route, self.model),
+                )
+                # CrewAI returns only the text: cost is estimated from the message sizes
+                span.record_usage({"prompt_tokens": estimate_tokens(messages, 0),
+                                   "completion_tokens": estimate_tokens(str(text), 0)})
+                span.set("specgen.usage_estimated", True)
+            model_router.record_call(span)
+            return text
+
+    return RateLimitedLLM
+
 
 # ---------------------------------------------
-#  CREW FACTORY
+#  LLM CONFIGURATION (per-agent models from model_router; Gemini 2.5 Flash by default)
+# ---------------------------------------------
+@lru_cache(maxsize=None)
+def get_llm(model: str = None, route: str = None):
+    """The shared LLM client for a model and route (crew agent), created on first use and reused by every crew."""
+    return _rate_limited_llm_class()(
+        route=route,
+        model=model or ROUTER.default,     # LiteLLM id, e.g. "gemini/gemini-2.5-flash"
+        api_key=_require_api_key(),
+        temperature=0.4,
+        verbose=True, # Set to True for debugging agent thought process
+    )
+
+
+def __getattr__(name):
+    # Backwards compatibility: `from agents import my_llm` still works, lazily.
+    if name == "my_llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 # ---------------------------------------------
-def create_spec_crew(goal_text: str):
+#  AGENT POOL (each set is used by one crew run at a time)
+# ---------------------------------------------
+# Agents carry executor and memory state, so concurrent crews (batch.py
+# --engine crew, job workers) must not share them; only the LLM clients are
+# shared. stream_spec_crew runs every crew on a new thread, so sets are
+# checked out for a run and returned afterwards instead of kept per thread.
+class AgentPool:
+    """Idle (analyst, writer, reviewer) sets per escalation level; a set is built when none is idle."""
+
+    def __init__(self):
+        self._idle = {False: queue.LifoQueue(), True: queue.LifoQueue()}
+
+    @contextmanager
+    def checkout(self, escalated: bool = False):
+        try:
+            agents = self._idle[escalated].get_nowait()
+        except queue.Empty:
+            agents = _build_agents(escalated)
+        yield agents
+        # Not reached when the run raised: a set left mid-task is dropped
+        self._idle[escalated].put(agents)
+
+
+AGENT_POOL = AgentPool()
+
+
+def _build_agents(escalated: bool):
     """
-    Creates the complete CrewAI pipeline (analyst → writer → reviewer)
-    and outputs a Specification pydantic object.
+    Creates the (analyst, writer, reviewer) agents.
+    Each agent runs on the model routed to it; escalated agents use the
+    escalation model where model_router says so.
     """
+    from crewai import Agent
 
     # ---------------------------
     #  Agent 1 — Analyst (Goal Decomposition Agent)
@@ -37,12 +136,10 @@ def create_spec_crew(goal_text: str):
     analyst = Agent(
         role="Product Analyst",
         goal="Break down high-level feature goals into specific user stories, identify risks, and gather strategic insights.",
-        backstory="""You are an experienced product analyst who excels at understanding
-        user needs and decomposing complex features into clear, actionable user stories.
-        You always think from the user's perspective and perform strategic analysis.""",
+        backstory="You think from the user's perspective and decompose features into clear, actionable user stories.",
         allow_delegation=False,
         verbose=True,
-        llm=my_llm,
+        llm=get_llm(ROUTER.model_for("analyst", escalated), "analyst"),
     )
 
     # ---------------------------
@@ -51,11 +148,10 @@ def create_spec_crew(goal_text: str):
     writer = Agent(
         role="Lead Technical Writer",
         goal="Transform analysis into a complete, structured Software Requirement Specification (SRS) in Markdown.",
-        backstory="""You are a precision technical writer. You produce clean,
-        well-structured SRS documents using standard FR-XXX and NFR-XXX conventions.""",
+        backstory="You are a precision technical writer who follows the team's SRS layout and conventions exactly.",
         allow_delegation=False,
         verbose=True,
-        llm=my_llm,
+        llm=get_llm(ROUTER.model_for("writer", escalated), "writer"),
     )
 
     # ---------------------------
@@ -64,13 +160,88 @@ def create_spec_crew(goal_text: str):
     reviewer = Agent(
         role="QA Engineering Lead",
         goal="Validate the specification for clarity, testability, and produce the final, perfectly structured JSON output matching the Specification model.",
-        backstory="""You rigorously verify requirement quality. You ensure every item is testable,
-        clear, and formatted properly. You produce the final structured output, and nothing else.""",
+        backstory="You rigorously verify that every requirement is testable, clear and properly formatted.",
         allow_delegation=False,
         verbose=True,
-        llm=my_llm,
+        llm=get_llm(ROUTER.model_for("reviewer", escalated), "reviewer"),
     )
 
+    return analyst, writer, reviewer
+
+
+# ---------------------------------------------
+#  CREW FACTORY
+# ---------------------------------------------
+def _task_callback(task_context: TaskContext, task_callback, name: str):
+    """Records the task's output, reports it, then trims what downstream tasks see."""
+    def callback(output):
+        task_context.task_done(name, output)
+        if task_callback is not None:
+            task_callback(name, output)
+        task_context.trim(name, output)
+    return callback
+
+
+# Patches name their section by title: the reviewer sees the draft without
+# [S<n>] ids (unlike specgen_core's annotated draft), and spec_patch matches titles
+SECTION_ID_GUIDE = ("Use the title of the section's '## ' heading, without its number "
+                    "(e.g. 'Functional Requirements'), as the section_id of its patch.")
+
+
+def _review_task(reviewer, context, callback, section_guide: str):
+    """Patch-mode reviewer: returns a SpecReview (verdict + changed sections), never the whole SRS."""
+    from crewai import Task
+
+    return Task(
+        description=f"""
+        Review the drafted SRS for completeness and quality. Do NOT re-emit the document.
+
+        {section_guide}
+
+        Produce a SpecReview JSON object with ALL fields:
+        - high_level_stories: The user stories listed in the draft, if any.
+        - patches: One entry per section that needs fixing, with its section_id and the complete corrected body of that section as replacement. Leave correct sections out; use the id "new" and a '## ' heading to add a missing section.
+        - validation_status: Set to 'Validated' or 'Needs Revision'.
+        - validation_critique: A short summary of your quality check.
+        """,
+        expected_output="A JSON object strictly matching the SpecReview model.",
+        agent=reviewer,
+        context=context,
+        output_pydantic=SpecReview,
+        callback=callback,
+    )
+
+
+def create_spec_crew(goal_text: str, task_callback=None, parallel_sections: bool = PARALLEL_SECTIONS,
+                     patch_review: bool = PATCH_REVIEW, task_context: TaskContext = None, escalated: bool = False,
+                     agents: tuple = None):
+    """
+    Creates the complete CrewAI pipeline (analyst → writer → reviewer)
+    and outputs a Specification pydantic object.
+
+    Only the per-goal Tasks and the Crew are built here; the LLM clients are
+    shared across runs. agents is an (analyst, writer, reviewer) set checked
+    out of AGENT_POOL for this run (stream_spec_crew does this); without it
+    a new set is built.
+
+    task_callback, if given, is called as task_callback(task_name, output) as
+    soon as each task finishes. With parallel_sections the writer drafts every
+    SRS section as its own async task ("section:<key>"); merge the outputs with
+    spec_sections.merge_sections (stream_spec_crew does this).
+
+    With patch_review (and always with parallel_sections) the reviewer outputs
+    a SpecReview to be applied to the draft with crew_output_text().
+
+    task_context (a crew_context.TaskContext) trims the context each task
+    receives and keeps the analyst's stories and per-task prompt estimates.
+    escalated switches the agents to model_router's escalation models.
+    """
+    from crewai import Task, Crew, Process
+
+    analyst, writer, reviewer = agents or _build_agents(escalated)
+    task_context = task_context or TaskContext()
+    trim = task_context.trim_enabled
+
     # ---------------------------
     #  Task 1 — Analysis & Story Breakdown
     # ---------------------------
@@ -81,59 +252,64 @@ def create_spec_crew(goal_text: str):
         "{goal_text}"
 
         Your output must contain:
-        - 3–5 high-level user stories following the 'As a [role], I want [action] so that [benefit]' format.
+        - 3–5 high-level user stories.
         - Strategic notes on potential risks, missing workflows, and key features derived from the strategic context in the goal.
         """,
         expected_output="A structured analysis summary containing high-level user stories, risks, and strategic notes.",
         agent=analyst,
+        callback=_task_callback(task_context, task_callback, "analysis"),
     )
+    task_context.register("analysis", analysis_task)
+
+    if parallel_sections:
+        return _create_section_crew(analysis_task, task_context, (analyst, writer, reviewer), task_callback)
 
     # ---------------------------
-    #  Task 2 — Draft the SRS
+    #  Task 2 — Draft the SRS (from the user stories only)
     # ---------------------------
     drafting_task = Task(
         description="""
-        Create a full Software Requirements Specification (SRS) in clean Markdown using the Analyst's output.
-
-        The document MUST be structured with clear headings:
-        # Title
-        ## Introduction
-        ## User Stories
-        ## Functional Requirements (FR-001…)
-        ## Non-Functional Requirements (NFR-001…)
-        ## API Requirements (if applicable)
-        ## Data Requirements (if applicable)
-        ## Risks & Mitigation
-        
-        Do NOT output JSON. Only the full Markdown text.
+        Write the full Software Requirements Specification (SRS) for the Analyst's user stories,
+        with every heading of the SRS layout. Output only the Markdown document.
         """,
         agent=writer,
         context=[analysis_task],
         expected_output="A complete, well-formatted SRS document in Markdown.",
+        callback=_task_callback(task_context, task_callback, "draft"),
     )
+    task_context.register("draft", drafting_task, before=["analysis"], after=["analysis"])
 
     # ---------------------------
     #  Task 3 — Validate & Output JSON
     # ---------------------------
-    validation_task = Task(
-        description="""
-        Review the drafted SRS for completeness and quality.
+    if patch_review:
+        # The reviewer needs the draft only; the stories are added back in code
+        review_context = ["draft"] if trim else ["analysis", "draft"]
+        validation_task = _review_task(
+            reviewer,
+            [drafting_task] if trim else [analysis_task, drafting_task],
+            _task_callback(task_context, task_callback, "validation"),
+            SECTION_ID_GUIDE,
+        )
+    else:
+        review_context = ["draft"]
+        validation_task = Task(
+            description="""
+            Review the drafted SRS for completeness and quality.
 
-        You MUST produce a JSON object that strictly matches the Pydantic model: Specification.
-
-        Fill ALL fields:
-        - high_level_stories: Extract the list of user stories from the SRS.
-        - detailed_spec_markdown: Place the full SRS Markdown document here (as a single string).
-        - validation_status: Set to 'Validated' or 'Needs Revision'.
-        - validation_critique: A short summary of your quality check.
-
-        Return ONLY the raw JSON object, no Markdown code blocks or commentary.
-        """,
-        expected_output="A final validated JSON object strictly matching the Specification model.",
-        agent=reviewer,
-        context=[drafting_task],
-        output_pydantic=Specification,
-    )
+            Produce a Specification JSON object with ALL fields:
+            - high_level_stories: Extract the list of user stories from the SRS.
+            - detailed_spec_markdown: Place the full SRS Markdown document here (as a single string).
+            - validation_status: Set to 'Validated' or 'Needs Revision'.
+            - validation_critique: A short summary of your quality check.
+            """,
+            expected_output="A final validated JSON object strictly matching the Specification model.",
+            agent=reviewer,
+            context=[drafting_task],
+            output_pydantic=Specification,
+            callback=_task_callback(task_context, task_callback, "validation"),
+        )
+    task_context.register("validation", validation_task, before=["analysis", "draft"], after=review_context)
 
     # ---------------------------
     #  Assemble Crew
@@ -145,4 +321,166 @@ def create_spec_crew(goal_text: str):
         verbose=True,
     )
 
-    return crew
\ No newline at end of file
+    return crew
+
+
+def _create_section_crew(analysis_task, task_context: TaskContext, agents: tuple, task_callback=None):
+    """Crew variant where the writer drafts each SRS section as a concurrent async task."""
+    from crewai import Task, Crew, Process
+
+    analyst, writer, reviewer = agents
+
+    # ---------------------------
+    #  Task 2 — Draft each SRS section concurrently
+    # ---------------------------
+    section_tasks = []
+    for key, heading, instruction in SPEC_SECTIONS:
+        task = Task(
+            description=f"""
+            For the Analyst's user stories, write ONLY the '{heading}' section of the SRS in Markdown.
+
+            {instruction}
+
+            Output only the body of this section: no section heading, no other sections, no JSON.
+            """,
+            agent=writer,
+            context=[analysis_task],
+            expected_output=f"The body of the '{heading}' section in Markdown.",
+            async_execution=True,
+            callback=_task_callback(task_context, task_callback, f"section:{key}"),
+        )
+        task_context.register(f"section:{key}", task, before=["analysis"], after=["analysis"])
+        section_tasks.append(task)
+
+    # ---------------------------
+    #  Task 3 — Review as patches (sections are merged in code, not re-typed)
+    # ---------------------------
+    section_names = [f"section:{key}" for key, _, _ in SPEC_SECTIONS]
+    section_titles = ", ".join(f"'{heading[3:].split('. ', 1)[-1]}'" for _, heading, _ in SPEC_SECTIONS)
+    trim = task_context.trim_enabled
+    validation_task = _review_task(
+        reviewer,
+        section_tasks if trim else [analysis_task, *section_tasks],
+        _task_callback(task_context, task_callback, "validation"),
+        f"The sections are assembled in this order: {section_titles}. {SECTION_ID_GUIDE}",
+    )
+    task_context.register("validation", validation_task, before=["analysis", *section_names],
+                          after=section_names if trim else ["analysis", *section_names])
+
+    return Crew(
+        agents=[analyst, writer, reviewer],
+        tasks=[analysis_task, *section_tasks, validation_task],
+        process=Process.sequential,
+        verbose=True,
+    )
+
+
+def crew_output_text(result, draft: str = None, stories: list = None) -> str:
+    """
+    Final JSON text of a crew run. When draft is given the reviewer's output
+    is a SpecReview, and its patches are applied to the draft; stories (the
+    analyst's, when known) replace the reviewer's copy.
+    """
+    if getattr(result, "pydantic", None) is not None:
+        raw_output = result.pydantic.model_dump_json()
+    else:
+        raw_output = str(result.raw if hasattr(result, "raw") else result)
+    if draft is None:
+        return raw_output
+
+    try:
+        review = SpecReview.model_validate(parse_json(raw_output, "{"))
+    except ValueError as e:
+        # Keep the draft rather than lose the run to an unreadable review
+        review = SpecReview(validation_status=REVIEW_FAILED, validation_critique=f"Review output could not be parsed: {e}")
+    return json.dumps(review_to_spec(review, draft, stories=stories or extract_stories(draft) or None))
+
+
+# ---------------------------------------------
+#  STREAMING CREW RUN
+# ---------------------------------------------
+def _validation_status(raw_output: str) -> str:
+    try:
+        return parse_json(raw_output, "{").get("validation_status", "")
+    except (ValueError, AttributeError):
+        return ""
+
+
+def stream_spec_crew(goal_text: str, parallel_sections: bool = PARALLEL_SECTIONS,
+                     patch_review: bool = PATCH_REVIEW):
+    """
+    Runs the crew in a background thread and yields progress events on the
+    caller's thread as each task finishes:
+      {"type": "task_output", "task": "analysis" | "draft" | "section:<key>" | "validation", "text": ...}
+    followed by {"type": "result", "result": <crew result>, "raw": <final JSON text>,
+    "routing": <model_router summary>}. Crew errors are re-raised.
+
+    A 'Needs Refinement' verdict reruns the crew once on the escalation
+    models, after an {"type": "escalation"} event; task events then start over.
+
+    Each task is traced as a "crew.<task>" span: it starts when the task it
+    depends on finished (sections all start when the analysis is done), and
+    carries its estimated prompt tokens with and without context trimming.
+    """
+    events = queue.Queue()
+    routing = RunRouting()
+
+    def run_crew(escalated: bool):
+        """One crew attempt; returns (crew result, final JSON text)."""
+        task_context = TaskContext()
+        sections = {}
+        marks = {}
+
+        def on_task_complete(name, output):
+            now = time.time_ns()
+            is_section = name.startswith("section:")
+            marks["crew"].record_child(f"crew.{name}", marks["ready" if is_section else "last"], now,
+                                       **task_context.report.get(name, {}))
+            marks["last"] = now
+            if not is_section:
+                marks["ready"] = now
+
+            text = output_text(output)
+            if is_section:
+                sections[name.split(":", 1)[1]] = text
+            events.put({"type": "task_output", "task": name, "text": text})
+
+        models = {role: ROUTER.model_for(role, escalated) for role in ("analyst", "writer", "reviewer")}
+        with AGENT_POOL.checkout(escalated) as agents, routing.stage("crew", model=models), \
+                tracing.span("crew", parallel_sections=parallel_sections, escalated=escalated) as crew_span:
+            marks.update(crew=crew_span, ready=crew_span.start_ns, last=crew_span.start_ns)
+            crew = create_spec_crew(goal_text, task_callback=on_task_complete, parallel_sections=parallel_sections,
+                                    patch_review=patch_review, task_context=task_context, escalated=escalated,
+                                    agents=agents)
+            result = crew.kickoff()
+        if parallel_sections:
+            draft = merge_sections(sections)
+        else:
+            draft = task_context.full_text("draft") if patch_review else None
+        return result, crew_output_text(result, draft, task_context.stories)
+
+    def run():
+        try:
+            result, raw = run_crew(escalated=False)
+            if routing.escalate(_validation_status(raw)):
+                events.put({"type": "escalation", "reason": routing.reason, "model": routing.router.escalation_model})
+                with tracing.span("escalation", reason=routing.reason):
+                    try:
+                        result, raw = run_crew(escalated=True)
+                    except Exception as e:
+                        # Keep the first attempt rather than lose the run
+                        routing.reason += f"; escalation failed, first attempt kept ({e})"
+            events.put({"type": "result", "result": result, "raw": raw, "routing": routing.summary()})
+        except Exception as e:
+            events.put({"type": "error", "error": e})
+
+    # The copied context makes the crew span a child of the caller's span (e.g. the job)
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+
+    while True:
+        event = events.get()
+        if event["type"] == "error":
+            raise event["error"]
+        yield event
+        if event["type"] == "result":
+            return
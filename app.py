@@ -1,10 +1,9 @@
 import streamlit as st
-import json
 import os
+import json
 import time
 import base64
-import re
-from datetime import datetime
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -12,11 +11,17 @@ load_dotenv()
 
 # Import local modules
 try:
-    from agents import create_spec_crew
+    import jobs
     from models import Specification
+    from prompt_builder import request_key, INDUSTRIES, TEAM_SIZES
+    from similarity import find_similar_specs
+    from spec_analytics import analyze_markdown
+    import db
+    import tracing
+    from model_router import ROUTER
 except ImportError as e:
     st.error(f"⚠️ Error importing modules: {e}")
-    st.info("Make sure agents.py and models.py are in the same folder as app.py")
+    st.info("Make sure agents.py, models.py and prompt_builder.py are in the same folder as app.py")
     st.stop()
 
 def download_link(text, filename):
@@ -25,9 +30,110 @@ def download_link(text, filename):
     b64 = base64.b64encode(text.encode()).decode()
     return f'<a href="data:file/text;base64,{b64}" download="{filename}_{timestamp}.md" class="download-btn">📥 Download Specification</a>'
 
+# Generated results kept per browser session, keyed by the normalized goal + options
+RESULT_HISTORY_SIZE = 10
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def cached_analytics(markdown, story_count):
+    """Requirement analytics shared across sessions and reruns."""
+    return analyze_markdown(markdown, story_count)
+
+def remember_result(key, result):
+    """Keep a result in session state (bounded) and make it the one on screen."""
+    results = st.session_state.setdefault("results", {})
+    results.pop(key, None)
+    results[key] = result
+    while len(results) > RESULT_HISTORY_SIZE:
+        results.pop(next(iter(results)))
+    st.session_state.current_result = key
+
+# Seconds between status checks while a background job runs
+JOB_POLL_SECONDS = 1.0
+
+ENGINE_CREW = "🤖 CrewAI Agents (analyst → writer → reviewer)"
+ENGINE_STREAMING = "⚡ Streaming Pipeline (live draft preview)"
+
+def show_generation_error(error_msg):
+    """Explain a failed generation, with hints for the common API errors."""
+    if "429" in error_msg or "quota" in error_msg.lower() or "rate limit" in error_msg.lower():
+        st.error("⚠️ **API Rate Limit Reached**")
+        st.info("Requests were queued and retried automatically, but the Gemini quota is still exhausted. Please wait a minute and try again.")
+
+    elif "404" in error_msg or "not found" in error_msg.lower():
+        st.error("⚠️ **Model Not Available**")
+        st.info("The AI model is temporarily unavailable. Please try again in a moment.")
+
+    elif "401" in error_msg or "unauthorized" in error_msg.lower() or "invalid" in error_msg.lower():
+        st.error("⚠️ **Invalid API Key**")
+        st.info("""
+        Your API key may be invalid or expired. Please:
+        1. Go to https://aistudio.google.com/app/apikey
+        2. Generate a new API key
+        3. Update your `.env` file with the new key
+        4. Restart the app
+        """)
+
+    elif "JSON" in error_msg or "validation error" in error_msg:
+        st.error(f"❌ **JSON Parsing Error**")
+        st.info("The AI generated invalid JSON and automatic repair did not fix it. Please try again.")
+
+    else:
+        st.error(f"❌ **Generation Failed**")
+        st.info("An unexpected error occurred. Please try again.")
+
+    with st.expander("🔍 Error Details (for debugging)"):
+        st.code(error_msg)
+
+# Window of the sidebar latency panel
+PERF_WINDOW_SECONDS = 24 * 3600
+
+@st.cache_data(show_spinner=False, ttl=30)
+def cached_stage_stats():
+    """p50/p95/p99 per stage over the last day, refreshed at most every 30 seconds."""
+    return tracing.stage_stats(PERF_WINDOW_SECONDS)
+
+@st.cache_data(show_spinner=False, ttl=30)
+def cached_trace_export():
+    return json.dumps(tracing.export_otlp(since_seconds=PERF_WINDOW_SECONDS))
+
+def trace_breakdown(trace_id):
+    """One row per span of a run, indented under its parent."""
+    spans = db.get_spans(trace_id=trace_id)
+    depth = {}
+    rows = []
+    for span in spans:
+        depth[span["span_id"]] = depth.get(span["parent_id"], -1) + 1
+        attrs = span["attributes"]
+        rows.append({
+            "span": "  " * depth[span["span_id"]] + span["name"],
+            "model": attrs.get(tracing.MODEL),
+            "ms": round((span["end_ns"] - span["start_ns"]) / 1e6),
+            "ttft ms": attrs.get(tracing.TTFT_MS),
+            "tokens in": attrs.get(tracing.INPUT_TOKENS),
+            "tokens out": attrs.get(tracing.OUTPUT_TOKENS),
+            "cache hit": attrs.get(tracing.CACHE_HIT),
+            "retries": attrs.get(tracing.RETRIES),
+            "hedged": attrs.get(tracing.HEDGED),
+            "cost $": attrs.get(tracing.COST_USD),
+            # Crew tasks: estimated prompt tokens after / before context trimming
+            "prompt est.": attrs.get(tracing.PROMPT_ESTIMATE),
+            "untrimmed est.": attrs.get(tracing.UNTRIMMED_ESTIMATE),
+        })
+    return rows
+
+@st.cache_resource
+def job_worker_pool():
+    """One background worker pool per Streamlit server."""
+    return jobs.start_pool()
+
 # Page config
 st.set_page_config(layout="wide", page_title="SpecGen AI", page_icon="✨")
 
+# Background workers that run the agents (no-op when SPECGEN_JOB_WORKERS=0)
+job_worker_pool()
+
+HISTORY_PAGE_SIZE = 20
+
 # --- CSS Styling (New Dark Mode Theme for High Contrast) ---
 st.markdown("""
 <style>
@@ -259,6 +365,85 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Sidebar: full-text search and stored specification history (keyset-paginated, one page per rerun)
+with st.sidebar:
+    st.markdown("### 🔎 Search Specifications")
+    search_query = st.text_input("Search", key="spec_search", placeholder="e.g. refund fraud detection", label_visibility="collapsed")
+    # Created-date range for both search and history (to-date inclusive)
+    date_from_col, date_to_col = st.columns(2)
+    with date_from_col:
+        date_from = st.date_input("Created from", value=None, key="history_date_from")
+    with date_to_col:
+        date_to = st.date_input("Created to", value=None, key="history_date_to")
+    created_from = date_from.isoformat() if date_from else None
+    created_to = (date_to + timedelta(days=1)).isoformat() if date_to else None
+
+    if search_query.strip():
+        search_results = db.search_specs(search_query, limit=10, created_from=created_from, created_to=created_to)
+        if not search_results:
+            st.caption("No matching specifications.")
+        for spec_id, title, created_at, snippet, _score in search_results:
+            st.markdown(f"**#{spec_id} · {title}**  \n<small>{created_at[:10]}</small>", unsafe_allow_html=True)
+            st.caption(snippet)
+
+    st.markdown("### 📚 Specification History")
+    history_filter = st.text_input("Filter by title", key="history_filter", placeholder="Title starts with...")
+    if st.session_state.get("history_filter_applied") != (history_filter, created_from, created_to):
+        # New filter: restart from the newest page
+        st.session_state.history_filter_applied = (history_filter, created_from, created_to)
+        st.session_state.history_cursors = [None]
+
+    history_cursors = st.session_state.setdefault("history_cursors", [None])
+    history_rows, history_next = db.get_specs_page(
+        HISTORY_PAGE_SIZE, cursor=history_cursors[-1], title_prefix=history_filter.strip() or None,
+        created_from=created_from, created_to=created_to,
+    )
+
+    if history_rows:
+        selected = st.selectbox(
+            "Stored specifications",
+            history_rows,
+            format_func=lambda row: f"#{row[0]} · {row[1]} · {row[3][:10]}",
+            key="history_selected",
+        )
+        stored = db.get_spec_by_id(selected[0])
+        if stored:
+            st.download_button("📥 Download Markdown", stored[4], file_name=f"spec_{stored[0]}.md", use_container_width=True)
+            with st.expander("Preview", expanded=False):
+                st.markdown(stored[4])
+    else:
+        st.caption("No stored specifications yet.")
+
+    nav_newer, nav_older = st.columns(2)
+    with nav_newer:
+        if st.button("← Newer", disabled=len(history_cursors) == 1, use_container_width=True):
+            history_cursors.pop()
+            st.rerun()
+    with nav_older:
+        if st.button("Older →", disabled=history_next is None, use_container_width=True):
+            history_cursors.append(history_next)
+            st.rerun()
+
+    st.markdown("### ⏱️ Performance")
+    with st.expander("Latency per stage (last 24h)", expanded=False):
+        stage_stats = cached_stage_stats()
+        if stage_stats:
+            st.dataframe(
+                [{k: s[k] for k in ("name", "model", "count", "p50_ms", "p95_ms", "p99_ms", "ttft_p50_ms",
+                                    "cache_hit_rate", "retries", "hedge_rate", "hedge_wins", "cost_usd")}
+                 for s in stage_stats],
+                hide_index=True,
+                use_container_width=True,
+            )
+            st.download_button("📤 Export traces (OTLP JSON)", cached_trace_export(),
+                               file_name="specgen_traces.json", mime="application/json", use_container_width=True)
+        else:
+            st.caption("No traced runs yet.")
+        routing = ROUTER.describe()
+        st.caption("Models: " + ", ".join(f"{route} → {model}" for route, model in routing["routes"].items())
+                   + (f" · escalates to {routing['escalation_model']} on {' / '.join(routing['escalate_on'])}"
+                      if routing["escalation_model"] else ""))
+
 # Header
 st.markdown("<h1>✨ SpecGen AI</h1>", unsafe_allow_html=True)
 st.markdown('<p class="tagline">Transform Ideas into Professional Requirements • Powered by AI Agents</p>', unsafe_allow_html=True)
@@ -300,13 +485,13 @@ col1, col2 = st.columns([2, 1])
 with col1:
     industry = st.selectbox(
         "Select Industry",
-        ["General", "Healthcare", "Finance", "E-commerce", "Education", "SaaS", "Government", "Entertainment"],
+        INDUSTRIES,
         key="industry"
     )
 with col2:
     team_size = st.selectbox(
         "Team Size",
-        ["Solo", "2-5", "6-20", "21-50", "51+"],
+        TEAM_SIZES,
         key="team"
     )
 
@@ -332,15 +517,66 @@ with st.expander("⚙️ Advanced Options", expanded=False):
         include_deployment = st.checkbox("🚀 Include Deployment Considerations", value=False)
         include_cost = st.checkbox("💰 Include Cost Estimation", value=True)
         include_api = st.checkbox("🔌 Include API Specifications", value=False)
+    engine = st.radio("Pipeline Engine", [ENGINE_CREW, ENGINE_STREAMING], index=0, key="engine")
 st.markdown("<br>", unsafe_allow_html=True)
 
+options = {
+    "industry": industry,
+    "team_size": team_size,
+    "include_security": include_security,
+    "include_accessibility": include_accessibility,
+    "include_testing": include_testing,
+    "include_deployment": include_deployment,
+    "include_cost": include_cost,
+    "include_api": include_api,
+}
+result_key = request_key(feature_goal, {**options, "engine": engine})
+
 # Generate button (centered)
 col1, col2, col3 = st.columns([1.5, 1, 1.5])
 with col2:
     generate_btn = st.button("🚀 GENERATE SPECIFICATION", use_container_width=True, type="primary")
+    generate_btn = generate_btn or st.session_state.pop("auto_generate", False)
+
+# Near-duplicate offer: a stored spec already covers this goal
+similar_match = st.session_state.get("similar_match")
+if similar_match and similar_match["goal"] == feature_goal and not generate_btn:
+    spec_id, similarity, stored_feature = similar_match["matches"][0]
+    st.info(f"🔁 A stored specification (#{spec_id}, {similarity:.0%} similar) already covers this goal:\n\n> {stored_feature}")
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("📂 Use stored specification", use_container_width=True):
+            st.session_state.reuse_spec_id = spec_id
+            del st.session_state.similar_match
+            st.rerun()
+    with col2:
+        if st.button("🚀 Generate a new one anyway", use_container_width=True):
+            st.session_state.skip_similar_check = True
+            st.session_state.auto_generate = True
+            del st.session_state.similar_match
+            st.rerun()
+
+reuse_spec_id = st.session_state.pop("reuse_spec_id", None)
+stored_spec = db.get_spec_by_id(reuse_spec_id) if reuse_spec_id is not None else None
 
 # Main generation logic
-if generate_btn:
+just_generated = False
+if stored_spec:
+    # Reuse a stored spec instead of spending three LLM calls on a near-duplicate goal
+    remember_result(f"stored:{stored_spec[0]}", {
+        "spec": Specification.model_validate_json(stored_spec[3]),
+        "feature_goal": stored_spec[2],
+        "options": options,
+        "elapsed_time": 0.0,
+        "timestamp": datetime.fromisoformat(stored_spec[5]).strftime("%B %d, %Y at %I:%M %p"),
+        "source": f"Loaded stored specification #{stored_spec[0]}",
+    })
+
+elif generate_btn and result_key in st.session_state.get("results", {}):
+    # Same goal and options as an earlier run in this session: no new LLM calls
+    remember_result(result_key, st.session_state.results[result_key])
+
+elif generate_btn:
     # Check API key
     api_key = os.getenv("GEMINI_API_KEY")
 
@@ -358,116 +594,82 @@ if generate_btn:
         st.warning("⚠️ Please describe your feature goal")
         st.stop()
 
-    start_time = time.time()
-
-    # Show loading state
-    with st.spinner("🤖 AI Agents are working on your specification..."):
+    # Offer a stored spec first when one is a near-duplicate of this goal
+    if not st.session_state.pop("skip_similar_check", False):
         try:
-            # Build enhanced prompt
-            prompt = feature_goal.strip()
-
-            if industry != "General":
-                prompt += f"\n\nIndustry: {industry}"
-
-            if team_size != "Solo":
-                prompt += f"\nTeam Size: {team_size}"
-
-            if include_security:
-                prompt += "\n\nInclude security requirements (authentication, authorization, encryption, data protection)."
-
-            if include_accessibility:
-                prompt += "\n\nInclude WCAG 2.1 Level AA accessibility requirements."
-
-            if include_testing:
-                prompt += "\n\nInclude comprehensive testing strategy and test cases."
-
-            if include_deployment:
-                prompt += "\n\nInclude deployment, infrastructure, and scalability considerations."
-
-            if include_cost:
-                prompt += "\n\nInclude cost estimation and resource requirements."
-
-            if include_api:
-                prompt += "\n\nInclude RESTful API endpoint specifications."
-
-            # Create and run the crew
-            crew = create_spec_crew(prompt)
-            result = crew.kickoff()
-
-            # Parse the result
-            raw_output = str(result.raw if hasattr(result, 'raw') else result)
-
-            # Clean up the output - remove markdown code blocks
-            raw_output = re.sub(r'```json\s*', '', raw_output)
-            raw_output = re.sub(r'```\s*', '', raw_output)
-            raw_output = raw_output.strip()
-
-            # Extract JSON using regex
-            json_match = re.search(r'\{.*\}', raw_output, re.DOTALL)
-            if not json_match:
-                raise ValueError("No valid JSON found in agent output")
-
-            json_str = json_match.group(0)
-
-            # Clean JSON - remove trailing commas
-            json_str = re.sub(r',\s*}', '}', json_str)
-            json_str = re.sub(r',\s*]', ']', json_str)
-
-            # Parse JSON
-            data = json.loads(json_str)
-            spec = Specification(**data)
-
-            elapsed_time = time.time() - start_time
-            timestamp = datetime.now().strftime("%B %d, %Y at %I:%M %p")
-
-        except json.JSONDecodeError as e:
-            st.error(f"❌ **JSON Parsing Error**")
-            st.info("The AI generated invalid JSON. Please try again.")
-            with st.expander("🔍 Debug Info (for developers)"):
-                st.code(raw_output[:500])
-            st.stop()
-
-        except Exception as e:
-            error_msg = str(e)
-
-            # Handle specific errors
-            if "429" in error_msg or "quota" in error_msg.lower() or "rate limit" in error_msg.lower():
-                st.error("⚠️ **API Rate Limit Reached**")
-                st.info("The free tier has a limit. Please wait 60 seconds and try again.")
-
-            elif "404" in error_msg or "not found" in error_msg.lower():
-                st.error("⚠️ **Model Not Available**")
-                st.info("The AI model is temporarily unavailable. Please try again in a moment.")
-
-            elif "401" in error_msg or "unauthorized" in error_msg.lower() or "invalid" in error_msg.lower():
-                st.error("⚠️ **Invalid API Key**")
-                st.info("""
-                Your API key may be invalid or expired. Please:
-                1. Go to https://aistudio.google.com/app/apikey
-                2. Generate a new API key
-                3. Update your `.env` file with the new key
-                4. Restart the app
-                """)
-
-            else:
-                st.error(f"❌ **Generation Failed**")
-                st.info("An unexpected error occurred. Please try again.")
+            matches = find_similar_specs(feature_goal)
+        except Exception:
+            matches = []  # The lookup is an optimisation; never block generation on it
+        if matches:
+            st.session_state.similar_match = {"goal": feature_goal, "matches": matches}
+            st.rerun()
 
-            with st.expander("🔍 Error Details (for debugging)"):
-                st.code(error_msg)
-            st.stop()
+    # Hand the run to the background workers; the job id in the URL survives reloads.
+    # A pending or just-finished job for the same goal + options is reused, not duplicated.
+    pending = db.get_job(st.query_params["job"]) if "job" in st.query_params else None
+    if not (pending and pending["status"] != "failed" and pending["request"]["key"] == result_key):
+        job_engine = jobs.ENGINE_STREAMING if engine == ENGINE_STREAMING else jobs.ENGINE_CREW
+        st.query_params["job"] = jobs.submit(feature_goal, options, job_engine, key=result_key)
+
+# Poll the active background job, showing its stage and partial output
+active_job_id = st.query_params.get("job")
+active_job = db.get_job(active_job_id) if active_job_id else None
+if active_job_id and active_job is None:
+    del st.query_params["job"]
+
+elif active_job and active_job["status"] in ("queued", "running"):
+    if active_job["status"] == "queued":
+        st.info("⏳ Waiting for a free worker...")
+    else:
+        st.info(f"🤖 {active_job['stage'] or 'AI Agents are working on your specification...'}")
+    if active_job["partial"]:
+        with st.container(border=True):
+            st.markdown(active_job["partial"] + " ▌")
+    time.sleep(JOB_POLL_SECONDS)
+    st.rerun()
+
+elif active_job and active_job["status"] == "failed":
+    del st.query_params["job"]
+    show_generation_error(active_job["error"] or "Unknown error")
+
+elif active_job:
+    del st.query_params["job"]
+    if active_job["error"]:
+        st.warning(f"⚠️ {active_job['error']}")
+    request = active_job["request"]
+    started = datetime.fromisoformat(active_job["created_at"])
+    remember_result(request["key"] or active_job["id"], {
+        "spec": Specification.model_validate_json(active_job["result"]),
+        "feature_goal": request["feature_goal"],
+        "options": request["options"],
+        "elapsed_time": (datetime.fromisoformat(active_job["finished_at"]) - started).total_seconds(),
+        "timestamp": datetime.now().strftime("%B %d, %Y at %I:%M %p"),
+        "source": "Specification generated successfully!",
+        "trace_id": active_job["id"],
+    })
+    just_generated = True
+
+# Results are rendered from session state, so widget reruns never regenerate them
+current_result = st.session_state.get("results", {}).get(st.session_state.get("current_result"))
+if current_result:
+    spec = current_result["spec"]
+    feature_goal = current_result["feature_goal"]
+    include_cost = current_result["options"]["include_cost"]
+    elapsed_time = current_result["elapsed_time"]
+    timestamp = current_result["timestamp"]
 
     # Success message
-    st.success("✅ Specification generated successfully!")
-    st.balloons()
+    st.success(f"✅ {current_result['source']}")
+    if just_generated:
+        st.balloons()
 
     # Metrics dashboard
     st.markdown('<p class="section-header">📊 Specification Metrics</p>', unsafe_allow_html=True)
 
-    # Calculate metrics
-    fr_count = spec.detailed_spec_markdown.count('FR-')
-    nfr_count = spec.detailed_spec_markdown.count('NFR-')
-    word_count = len(spec.detailed_spec_markdown.split())
+    # Calculate metrics (one cached pass over the Markdown)
+    analytics = cached_analytics(spec.detailed_spec_markdown, len(spec.high_level_stories))
+    fr_count = analytics.fr_count
+    nfr_count = analytics.nfr_count
 
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -475,9 +677,13 @@ if generate_btn:
     with col2:
         st.metric("📋 User Stories", len(spec.high_level_stories))
     with col3:
-        st.metric("✅ Requirements", fr_count + nfr_count)
+        st.metric("✅ Requirements", analytics.requirement_count)
     with col4:
-        st.metric("📝 Word Count", f"{word_count:,}")
+        st.metric("📝 Word Count", f"{analytics.word_count:,}")
+
+    if current_result.get("trace_id"):
+        with st.expander("⏱️ Where the time went", expanded=False):
+            st.dataframe(trace_breakdown(current_result["trace_id"]), hide_index=True, use_container_width=True)
 
     # Download button
     st.markdown("<br>", unsafe_allow_html=True)
@@ -490,7 +696,11 @@ if generate_btn:
     with tab1:
         st.markdown("### Complete Specification Document")
         with st.expander("📑 Quick Navigation", expanded=False):
-            st.markdown("""
+            sections = [text for level, text in analytics.headings if level == 2]
+            if sections:
+                st.markdown("\n".join(f"- **{text}**" for text in sections))
+            else:
+                st.markdown("""
             - **Introduction** - Feature overview and scope
             - **Functional Requirements** - What the system must do
             - **Non-Functional Requirements** - How the system must perform
@@ -520,17 +730,14 @@ if generate_btn:
 
         if include_cost:
             st.markdown("#### 💰 Project Estimates")
-            # Calculation logic identical to your original code
-            weeks = max(2, (fr_count * 0.5 + nfr_count * 0.3))
-            min_cost = int(weeks * 40 * 80)
-            max_cost = int(weeks * 1.5 * 40 * 150)
+            min_cost, max_cost = analytics.cost_range
 
             col1, col2 = st.columns(2)
             with col1:
                 st.metric("Estimated Cost", f"${min_cost:,} - ${max_cost:,}")
                 st.caption("Based on industry averages for similar projects")
             with col2:
-                st.metric("Timeline", f"{int(weeks)}-{int(weeks*1.5)} weeks")
+                st.metric("Timeline", analytics.timeline)
                 st.caption("Includes development, testing, and deployment")
 
     with tab3:
@@ -544,6 +751,12 @@ if generate_btn:
         st.markdown("#### 📝 Validation Feedback")
         st.info(spec.validation_critique)
 
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Acceptance Criteria", analytics.acceptance_criteria)
+        with col2:
+            st.metric("Mermaid Diagrams", len(analytics.mermaid_blocks))
+
         st.markdown("#### ✅ Quality Checks Performed")
         checks = [
             "✓ Testability - All requirements follow GIVEN/WHEN/THEN format",
@@ -560,37 +773,27 @@ if generate_btn:
         st.markdown("### AI-Powered Insights")
 
         # Completeness score
-        completeness = min(100, (fr_count * 5 + nfr_count * 5 + len(spec.high_level_stories) * 10))
+        completeness = analytics.completeness
         st.markdown("#### 📈 Completeness Score")
         st.progress(completeness / 100)
         st.write(f"**{completeness}%** - Your specification is comprehensive and well-structured")
 
         # Complexity analysis
         st.markdown("#### 🧩 Implementation Complexity")
-        if fr_count + nfr_count < 15:
-            complexity = "Low"
-            color = "🟢"
-        elif fr_count + nfr_count < 30:
-            complexity = "Medium"
-            color = "🟡"
-        else:
-            complexity = "High"
-            color = "🔴"
-        st.write(f"{color} **{complexity}** - Based on {fr_count + nfr_count} total requirements")
+        complexity, color = analytics.complexity
+        st.write(f"{color} **{complexity}** - Based on {analytics.requirement_count} total requirements")
 
         # Timeline and cost estimates
         if include_cost:
             st.markdown("#### 📅 Project Estimates")
-            weeks = max(2, (fr_count * 0.5 + nfr_count * 0.3))
-            min_cost = int(weeks * 40 * 80)
-            max_cost = int(weeks * 1.5 * 40 * 150)
+            min_cost, max_cost = analytics.cost_range
 
             col1, col2 = st.columns(2)
             with col1:
                 st.metric("💰 Estimated Cost", f"${min_cost:,} - ${max_cost:,}")
                 st.caption("Based on industry averages for similar projects")
             with col2:
-                st.metric("⏱️ Timeline", f"{int(weeks)}-{int(weeks*1.5)} weeks")
+                st.metric("⏱️ Timeline", analytics.timeline)
                 st.caption("Includes development, testing, and deployment")
 
         # Recommendations
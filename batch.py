@@ -0,0 +1,195 @@
+"""
+Headless batch generation for SpecGen AI.
+
+Reads feature goals (plus the same options the Streamlit UI offers) from a
+JSONL or CSV file, runs them through a worker pool and streams every result
+into specgen.db (db.save_spec) and an output JSONL file.
+
+Usage:
+    python batch.py goals.jsonl --output results.jsonl --workers 4
+    python batch.py goals.csv --engine crew --resume
+
+Each input row needs a "feature_goal" (or "goal") field. Optional fields:
+industry, team_size, include_security, include_accessibility,
+include_testing, include_deployment, include_cost, include_api.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from prompt_builder import build_enhanced_prompt, request_key, DEFAULT_OPTIONS
+
+load_dotenv()
+
+BOOL_OPTIONS = [key for key, value in DEFAULT_OPTIONS.items() if isinstance(value, bool)]
+
+
+# ----------------------------------
+# Input Parsing
+# ----------------------------------
+def _parse_bool(value, default: bool) -> bool:
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "y", "on")
+
+
+def _normalize_row(row: dict) -> dict:
+    goal = (row.get("feature_goal") or row.get("goal") or "").strip()
+    options = {
+        "industry": (row.get("industry") or DEFAULT_OPTIONS["industry"]).strip(),
+        "team_size": (row.get("team_size") or DEFAULT_OPTIONS["team_size"]).strip(),
+    }
+    for key in BOOL_OPTIONS:
+        options[key] = _parse_bool(row.get(key), DEFAULT_OPTIONS[key])
+    return {"feature_goal": goal, "options": options}
+
+
+def read_goals(path: str) -> list:
+    """Load goal rows from a .jsonl or .csv file."""
+    rows = []
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = [_normalize_row(row) for row in csv.DictReader(f)]
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    rows.append(_normalize_row(json.loads(line)))
+    return [row for row in rows if row["feature_goal"]]
+
+
+def job_key(feature_goal: str, options: dict) -> str:
+    """Stable id for a goal + options pair, used to skip finished work on --resume."""
+    return request_key(feature_goal, options)
+
+
+def completed_keys(output_path: str) -> set:
+    """Keys of goals already written successfully to the output JSONL."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partial last line from an interrupted run
+            if record.get("status") == "ok":
+                done.add(record["key"])
+    return done
+
+
+# ----------------------------------
+# Pipeline Engines
+# ----------------------------------
+# Each engine returns (spec dict, model routing summary)
+def _run_core(prompt: str) -> tuple:
+    from specgen_core import run_specgen_pipeline
+
+    result = run_specgen_pipeline(prompt)
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return json.loads(result["final_json_str"]), result["routing"]
+
+
+def _run_crew(prompt: str) -> tuple:
+    from agents import stream_spec_crew
+    from models import Specification
+    from specgen_core import repair_specification
+
+    raw_output, routing = "", None
+    for event in stream_spec_crew(prompt):
+        if event["type"] == "result":
+            raw_output, routing = event["raw"], event["routing"]
+    return repair_specification(raw_output, response_model=Specification).model_dump(), routing
+
+
+ENGINES = {"core": _run_core, "crew": _run_crew}
+
+
+# ----------------------------------
+# Batch Runner
+# ----------------------------------
+def run_batch(input_path: str, output_path: str, engine: str = "core", workers: int = 4,
+              resume: bool = False, save_to_db: bool = True) -> dict:
+    """
+    Generate specs for every goal in input_path. Results are appended to
+    output_path as they finish; with resume=True goals already recorded as
+    "ok" in output_path are skipped.
+    """
+    from models import Specification
+    import db
+
+    run_engine = ENGINES[engine]
+    goals = read_goals(input_path)
+    skip = completed_keys(output_path) if resume else set()
+    todo = [g for g in goals if job_key(g["feature_goal"], g["options"]) not in skip]
+
+    summary = {"total": len(goals), "skipped": len(goals) - len(todo), "ok": 0, "failed": 0}
+    write_lock = threading.Lock()
+
+    def process(goal: dict) -> dict:
+        key = job_key(goal["feature_goal"], goal["options"])
+        record = {"key": key, "feature_goal": goal["feature_goal"], "options": goal["options"]}
+        start = time.time()
+        try:
+            prompt = build_enhanced_prompt(goal["feature_goal"], **goal["options"])
+            spec_fields, record["routing"] = run_engine(prompt)
+            spec = Specification(**spec_fields)
+            title = db.spec_title(goal["feature_goal"], spec.detailed_spec_markdown)
+            if save_to_db:
+                record["spec_id"] = db.save_spec(
+                    title, goal["feature_goal"], spec.model_dump_json(), spec.detailed_spec_markdown
+                )
+            record.update(status="ok", title=title, spec=spec.model_dump())
+        except Exception as e:
+            record.update(status="error", error=str(e))
+        record["elapsed_s"] = round(time.time() - start, 2)
+        return record
+
+    mode = "a" if resume else "w"
+    with open(output_path, mode, encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(process, goal) for goal in todo]
+        for future in as_completed(futures):
+            record = future.result()
+            with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+            summary["ok" if record["status"] == "ok" else "failed"] += 1
+            print(f"[{record['status']}] {record['feature_goal'][:60]} ({record['elapsed_s']}s)", file=sys.stderr)
+
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-generate SpecGen specifications from a JSONL or CSV file.")
+    parser.add_argument("input", help="Input .jsonl or .csv file with feature goals")
+    parser.add_argument("-o", "--output", default="specgen_batch_results.jsonl", help="Output JSONL path")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Number of goals generated in parallel")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="core",
+                        help="core = specgen_core LiteLLM pipeline, crew = CrewAI agents")
+    parser.add_argument("--resume", action="store_true", help="Skip goals already completed in the output file")
+    parser.add_argument("--no-db", action="store_true", help="Do not save results to specgen.db")
+    args = parser.parse_args(argv)
+
+    if "GEMINI_API_KEY" not in os.environ:
+        parser.error("GEMINI_API_KEY is missing from environment variables.")
+
+    summary = run_batch(args.input, args.output, engine=args.engine, workers=args.workers,
+                        resume=args.resume, save_to_db=not args.no_db)
+    print(json.dumps(summary))
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
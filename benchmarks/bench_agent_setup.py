@@ -0,0 +1,93 @@
+"""
+Measure cold-import time of agents.py and per-request crew time.
+
+Usage:
+    python benchmarks/bench_agent_setup.py                 # current tree
+    python benchmarks/bench_agent_setup.py --src ../old    # another checkout, for before/after
+
+Requests go through agents.stream_spec_crew, the path the job workers and
+batch.py take (a new crew thread per request), against the mock LLM with
+no latency. Setup is the time spent building agents and the crew; the
+request time adds CrewAI's own overhead. A dummy GEMINI_API_KEY is enough.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter so the import is genuinely cold
+CHILD = r"""
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+t0 = time.perf_counter()
+import agents
+t1 = time.perf_counter()
+import mock_llm
+mock_llm.install(mock_llm.MockLLM(latency_ms=0, latency="constant", tokens_per_second=0))
+
+setup = [0.0]
+def timed(fn):
+    def wrapper(*args, **kwargs):
+        s = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            setup[0] += time.perf_counter() - s
+    return wrapper
+agents._build_agents = timed(agents._build_agents)
+agents.create_spec_crew = timed(agents.create_spec_crew)
+
+timings, setups = [], []
+for i in range(int(sys.argv[2])):
+    s, setup[0] = time.perf_counter(), 0.0
+    for event in agents.stream_spec_crew(f"Benchmark goal {i}: build a chat app with read receipts"):
+        pass
+    timings.append(time.perf_counter() - s)
+    setups.append(setup[0])
+print(json.dumps({"import_s": t1 - t0, "request_s": timings, "setup_s": setups}))
+"""
+
+
+def measure(src: str, runs: int, requests: int) -> dict:
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "benchmark-dummy-key")
+    env.update(SPECGEN_RPM="1000000000", SPECGEN_TPM="1000000000000")
+    imports, first, warm, first_setup, warm_setup = [], [], [], [], []
+    for _ in range(runs):
+        # A scratch working directory: the traces go to its specgen.db
+        with tempfile.TemporaryDirectory() as workdir:
+            out = subprocess.run(
+                [sys.executable, "-c", CHILD, src, str(requests)],
+                capture_output=True, text=True, env=env, check=True, cwd=workdir,
+            ).stdout.strip().splitlines()[-1]
+        data = json.loads(out)
+        imports.append(data["import_s"])
+        first.append(data["request_s"][0])
+        warm.extend(data["request_s"][1:])
+        first_setup.append(data["setup_s"][0])
+        warm_setup.extend(data["setup_s"][1:])
+    return {
+        "cold_import_ms": round(statistics.median(imports) * 1000, 1),
+        "first_request_setup_ms": round(statistics.median(first_setup) * 1000, 2),
+        "warm_request_setup_ms": round(statistics.median(warm_setup) * 1000, 2) if warm_setup else None,
+        "first_request_ms": round(statistics.median(first) * 1000, 1),
+        "warm_request_ms": round(statistics.median(warm) * 1000, 1) if warm else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--src", default=ROOT, help="Directory containing agents.py (default: this checkout)")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to average over")
+    parser.add_argument("--requests", type=int, default=20, help="stream_spec_crew runs per interpreter")
+    args = parser.parse_args()
+    print(json.dumps(measure(os.path.abspath(args.src), args.runs, args.requests), indent=2))
+
+
+if __name__ == "__main__":
+    main()
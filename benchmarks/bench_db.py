@@ -0,0 +1,126 @@
+"""
+Storage-layer throughput: inserts/sec and reads/sec with 1, 8 and 32
+concurrent writers, comparing the pooled WAL layer in db.py against the
+previous open-a-connection-per-call pattern.
+
+Usage:
+    python benchmarks/bench_db.py [--ops 200] [--writers 1 8 32]
+
+Runs against a throwaway database in a temp directory.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+SPEC_MARKDOWN = "# Spec\n\n## Functional Requirements\n" + "\n".join(f"- FR-{i:03d}: The system shall ..." for i in range(60))
+SPEC_JSON = '{"high_level_stories": ["As a user, I want ..."], "detailed_spec_markdown": "..."}'
+
+
+# ----------------------------------
+# Legacy pattern (one connection per call, rollback journal)
+# ----------------------------------
+def legacy_save(path, title):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute(
+        "INSERT INTO specifications (title, feature, json_output, markdown_output, created_at) VALUES (?, ?, ?, ?, ?)",
+        (title, "feature", SPEC_JSON, SPEC_MARKDOWN, datetime.utcnow().isoformat()),
+    )
+    conn.commit()
+    conn.close()
+
+
+def legacy_read(path, spec_id):
+    conn = sqlite3.connect(path, timeout=30)
+    row = conn.execute(
+        "SELECT id, title, feature, json_output, markdown_output, created_at FROM specifications WHERE id = ?",
+        (spec_id,),
+    ).fetchone()
+    conn.close()
+    return row
+
+
+def legacy_setup(path):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE specifications (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, feature TEXT, "
+        "json_output TEXT, markdown_output TEXT, created_at TEXT)"
+    )
+    conn.commit()
+    conn.close()
+
+
+# ----------------------------------
+# Harness
+# ----------------------------------
+def run_threads(n_threads, ops_per_thread, fn):
+    errors = []
+
+    def worker(t):
+        for i in range(ops_per_thread):
+            try:
+                fn(t, i)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(n_threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return (n_threads * ops_per_thread - len(errors)) / elapsed, len(errors)
+
+
+def bench(mode, writers, ops):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        if mode == "legacy":
+            legacy_setup(path)
+            save = lambda t, i: legacy_save(path, f"spec {t}-{i}")
+            read = lambda t, i: legacy_read(path, 1 + (t * ops + i) % (writers * ops))
+        else:
+            db.set_db_path(path, pool_size=max(writers, 1))
+            db.init_db()
+            save = lambda t, i: db.save_spec(f"spec {t}-{i}", "feature", SPEC_JSON, SPEC_MARKDOWN)
+            read = lambda t, i: db.get_spec_by_id(1 + (t * ops + i) % (writers * ops))
+
+        inserts, insert_errors = run_threads(writers, ops, save)
+        reads, read_errors = run_threads(writers, ops, read)
+
+        batch_rate = None
+        if mode == "pooled":
+            rows = [(f"batch {i}", "feature", SPEC_JSON, SPEC_MARKDOWN) for i in range(writers * ops)]
+            start = time.perf_counter()
+            db.save_specs(rows)
+            batch_rate = len(rows) / (time.perf_counter() - start)
+            db._pool.close_all()
+
+        return inserts, reads, insert_errors + read_errors, batch_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=200, help="Operations per writer/reader thread")
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'threads':>7} {'inserts/s':>10} {'reads/s':>10} {'batch ins/s':>12} {'locked':>7}")
+    for writers in args.writers:
+        for mode in ("legacy", "pooled"):
+            inserts, reads, errors, batch_rate = bench(mode, writers, args.ops)
+            batch = f"{batch_rate:12.0f}" if batch_rate else f"{'-':>12}"
+            print(f"{mode:<8} {writers:>7} {inserts:10.0f} {reads:10.0f} {batch} {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+JSON extraction from ~1 MB agent outputs: the single-pass extractor in
+json_extract.py against the previous cleanup (four re.sub passes, a
+greedy {.*} search and json.loads).
+
+Usage:
+    python benchmarks/bench_json_extract.py [--size-mb 1] [--repeat 20]
+
+Three outputs are measured: clean JSON in a fence, the same with a
+trailing comma, and with braces in the surrounding prose. Besides the
+timings it reports whether each approach recovered the Markdown exactly;
+the old cleanup strips the Mermaid/code fences inside it.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_extract import parse_json  # noqa: E402
+
+SECTION = """
+## FR-{i:04d}: Configurable widget {i}
+
+The system shall render widget {i} from its config object `{{"id": {i}, "layout": {{"cols": 3}}}}`.
+
+```mermaid
+flowchart TD
+    A[Load config] --> B{{Valid?}}
+    B -->|yes| C[Render]
+    B -->|no| D[Show error]
+```
+
+- GIVEN a dashboard WHEN the user adds widget {i} THEN it appears within 200 ms.
+"""
+
+
+SCENARIOS = [
+    # (label, braces in the surrounding prose, trailing comma in the JSON)
+    ("clean JSON in a fence", False, False),
+    ("trailing comma (repair path)", False, True),
+    ("braces in prose + trailing comma", True, True),
+]
+
+
+def build_output(size_mb: float, prose_braces: bool, trailing_comma: bool):
+    """Agent-style output: prose around a ```json fence, optionally with the usual defects."""
+    target = int(size_mb * 1024 * 1024)
+    sections, total, i = [], 0, 0
+    while total < target:
+        section = SECTION.format(i=i)
+        sections.append(section)
+        total += len(section)
+        i += 1
+    markdown = "# Software Specification\n" + "".join(sections)
+    spec = {
+        "high_level_stories": ["As a user, I want {a} dashboard", "As an admin, I want exports", "As a viewer, I want filters"],
+        "detailed_spec_markdown": markdown,
+        "validation_status": "Validated",
+        "validation_critique": "All requirements are testable.",
+    }
+    body = json.dumps(spec, indent=2)
+    if trailing_comma:
+        body = body[:-1].rstrip() + ",\n}"
+    feature, anything = ("{feature}", "{anything}") if prose_braces else ("the feature", "anything")
+    text = (
+        f"Final Answer: here is the validated spec for {feature}.\n\n"
+        f"```json\n{body}\n```\n\n"
+        f"Let me know if you need changes to {anything}."
+    )
+    return text, markdown
+
+
+def legacy_parse(raw_output: str):
+    raw_output = re.sub(r'```json\s*', '', raw_output)
+    raw_output = re.sub(r'```\s*', '', raw_output)
+    raw_output = raw_output.strip()
+    json_match = re.search(r'\{.*\}', raw_output, re.DOTALL)
+    if not json_match:
+        raise ValueError("No valid JSON found in agent output")
+    json_str = json_match.group(0)
+    json_str = re.sub(r',\s*}', '}', json_str)
+    json_str = re.sub(r',\s*]', ']', json_str)
+    return json.loads(json_str)
+
+
+def bench(name, fn, text, markdown, repeat):
+    start = time.perf_counter()
+    try:
+        for _ in range(repeat):
+            data = fn(text)
+        elapsed = (time.perf_counter() - start) / repeat
+        exact = data.get("detailed_spec_markdown") == markdown
+        print(f"{name:<12} {elapsed * 1000:9.1f} ms/op   markdown intact: {exact}")
+    except Exception as e:
+        print(f"{name:<12}      failed   {type(e).__name__}: {str(e)[:60]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for label, prose_braces, trailing_comma in SCENARIOS:
+        text, markdown = build_output(args.size_mb, prose_braces, trailing_comma)
+        print(f"\n{label} ({len(text) / 1024 / 1024:.2f} MB)")
+        bench("legacy", legacy_parse, text, markdown, args.repeat)
+        bench("json_extract", lambda t: parse_json(t, "{"), text, markdown, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Offline pipeline benchmark on the deterministic mock LLM (mock_llm.py):
+end-to-end throughput, per-stage framework overhead, JSON-parse cost,
+DB write cost and the tail latency with and without hedged requests, for
+the staged LiteLLM pipeline (sync and async) and, when crewai is
+installed, the CrewAI pipeline.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--goals 20] [--concurrency 4]
+        [--latency-ms 300] [--tokens-per-second 2000] [--rate-limit-rate 0.05]
+        [--tail-jitter 1.0]
+
+No network access or API quota is used; the rate limiter and response
+cache are disabled and everything is written to a temp directory. The
+same --seed gives the same mock latencies and injected 429s, so two
+checkouts can be compared run for run.
+"""
+import argparse
+import importlib.util
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+TMP = tempfile.mkdtemp(prefix="specgen-bench-")
+# Before any SpecGen import: no rate limiting, no response cache, throwaway files
+os.environ.update({
+    "SPECGEN_RPM": "1000000000",
+    "SPECGEN_TPM": "1000000000000",
+    "SPECGEN_CACHE_DISABLED": "1",
+    "SPECGEN_CACHE_PATH": os.path.join(TMP, "cache.db"),
+})
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-dummy-key")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import tracing  # noqa: E402
+import hedging  # noqa: E402
+import mock_llm  # noqa: E402
+import specgen_core  # noqa: E402
+import specgen_async  # noqa: E402
+from models import Specification  # noqa: E402
+
+GOAL = "Benchmark goal {i}: team workspaces with role-based sharing and an audit trail"
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:9.1f}"
+
+
+def _summary(label: str, latencies: list, wall: float, failures: int, extra: str = ""):
+    latencies = sorted(latencies)
+
+    def percentile(fraction):
+        return latencies[max(0, math.ceil(len(latencies) * fraction) - 1)] if latencies else 0.0
+
+    rate = len(latencies) / wall * 60 if wall else 0.0
+    p50 = statistics.median(latencies) if latencies else 0.0
+    print(f"{label:<22} {rate:10.1f} {_ms(p50)} {_ms(percentile(0.95))} {_ms(percentile(0.99))} {failures:>8}{extra}")
+
+
+def _hedge_totals() -> tuple:
+    rows = hedging.HEDGER.stats()
+    return tuple(sum(row[field] for row in rows) for field in ("calls", "hedged", "won"))
+
+
+# ----------------------------------
+# Pipelines under test
+# ----------------------------------
+def run_sync(goals: list, concurrency: int, parallel_sections: bool, pipelined_review: bool = False):
+    def one(goal):
+        start = time.perf_counter()
+        result = specgen_core.run_specgen_pipeline(goal, parallel_sections=parallel_sections,
+                                                   pipelined_review=pipelined_review)
+        return time.perf_counter() - start, "error" in result
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, goals))
+
+
+def run_async(goals: list, concurrency: int, parallel_sections: bool, pipelined_review: bool = False):
+    # iter_specgen_pipelines does not expose per-goal timing, so time each goal here
+    import asyncio
+
+    async def one(goal, semaphore):
+        async with semaphore:
+            start = time.perf_counter()
+            result = await specgen_async.arun_specgen_pipeline(goal, parallel_sections=parallel_sections,
+                                                               pipelined_review=pipelined_review)
+            return time.perf_counter() - start, "error" in result
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(one(goal, semaphore) for goal in goals))
+
+    return asyncio.run(run_all())
+
+
+def run_crew(goals: list, concurrency: int, parallel_sections: bool, pipelined_review: bool = False):
+    from agents import stream_spec_crew
+
+    def one(goal):
+        start = time.perf_counter()
+        try:
+            for event in stream_spec_crew(goal, parallel_sections=parallel_sections):
+                if event["type"] == "result":
+                    specgen_core.repair_specification(event["raw"], response_model=Specification)
+            return time.perf_counter() - start, False
+        except Exception:
+            return time.perf_counter() - start, True
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, goals))
+
+
+@lru_cache(maxsize=None)
+def pipelines():
+    found = [("core sync", run_sync), ("core async", run_async)]
+    if importlib.util.find_spec("crewai") is not None:
+        found.append(("crew", run_crew))
+    else:
+        print("(crewai not installed: skipping the CrewAI pipeline)")
+    return tuple(found)
+
+
+# ----------------------------------
+# Sections
+# ----------------------------------
+def bench_throughput(args):
+    print(f"\nEnd-to-end throughput: {args.goals} goals, concurrency {args.concurrency}, "
+          f"mock {args.latency} {args.latency_ms:g} ms + {args.tokens_per_second:g} tok/s, "
+          f"429 rate {args.rate_limit_rate:g}")
+    print(f"{'pipeline':<22} {'goals/min':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'failures':>8}")
+    goals = [GOAL.format(i=i) for i in range(args.goals)]
+    # (label, parallel_sections, pipelined_review); the crew has no pipelined review
+    modes = [("serial", False, False), ("sections", True, False), ("pipelined", False, True)]
+    for name, run in pipelines():
+        for mode, parallel_sections, pipelined_review in modes:
+            if pipelined_review and run is run_crew:
+                continue
+            mock_llm.install(mock_llm.MockLLM(
+                latency_ms=args.latency_ms, latency=args.latency, tokens_per_second=args.tokens_per_second,
+                rate_limit_rate=args.rate_limit_rate, retry_after=0.05, seed=args.seed,
+            ))
+            start = time.perf_counter()
+            results = run(goals, args.concurrency, parallel_sections, pipelined_review)
+            wall = time.perf_counter() - start
+            _summary(f"{name} ({mode})", [r[0] for r in results], wall, sum(r[1] for r in results))
+
+
+def bench_stage_overhead(args):
+    """Zero-latency mock: whatever time a stage takes is SpecGen's own overhead."""
+    print(f"\nPer-stage overhead (instant mock, {args.goals} goals, from trace spans)")
+    print(f"{'pipeline':<12} {'span':<16} {'p50 ms':>9} {'p95 ms':>9}")
+    goals = [GOAL.format(i=i) for i in range(args.goals)]
+    for name, run in pipelines():
+        mock_llm.install(mock_llm.MockLLM(latency_ms=0, latency="constant", tokens_per_second=0, seed=args.seed))
+        start = time.time()
+        run(goals, 1, False)
+        for stats in tracing.stage_stats(time.time() - start):
+            if stats["name"] in ("stage_1", "stage_2", "stage_3", "repair", "llm.completion", "llm.stream", "crew"):
+                print(f"{name:<12} {stats['name']:<16} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f}")
+        db.delete_spans(time.time_ns())
+
+
+def bench_hedging(args):
+    """
+    Heavy-tailed mock latency, hedging off then on. The first run also
+    fills the hedger's latency window, so the second hedges from its start.
+    """
+    print(f"\nHedged requests: {args.goals} goals, concurrency {args.concurrency}, lognormal mock "
+          f"{args.latency_ms:g} ms (sigma {args.tail_jitter:g}), hedge at p{hedging.HEDGER.percentile * 100:g}, "
+          f"budget {hedging.HEDGER.budget:g}")
+    print(f"{'pipeline':<22} {'goals/min':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'failures':>8}"
+          f" {'extra calls':>12} {'hedge wins':>11}")
+    goals = [GOAL.format(i=i) for i in range(args.goals)]
+    for name, run in pipelines():
+        for enabled in (False, True):
+            hedging.HEDGER.enabled = enabled
+            mock_llm.install(mock_llm.MockLLM(
+                latency_ms=args.latency_ms, latency="lognormal", jitter=args.tail_jitter,
+                tokens_per_second=args.tokens_per_second, seed=args.seed,
+            ))
+            calls, hedged, won = _hedge_totals()
+            start = time.perf_counter()
+            results = run(goals, args.concurrency, False)
+            wall = time.perf_counter() - start
+            calls, hedged, won = (after - before for after, before in zip(_hedge_totals(), (calls, hedged, won)))
+            extra = f" {hedged / calls if calls else 0.0:12.1%} {won:>11}"
+            _summary(f"{name} (hedging {'on' if enabled else 'off'})", [r[0] for r in results], wall,
+                     sum(r[1] for r in results), extra)
+    hedging.HEDGER.enabled = hedging.HEDGING_ENABLED
+
+
+def bench_json_parse(args):
+    print("\nStage 3 JSON parse + validation (repair_specification on mock output)")
+    print(f"{'output':>10} {'ms/op':>9}")
+    for chars in (12_000, 100_000, 1_000_000):
+        text = "Final answer:\n```json\n" + mock_llm.mock_content("", structured=True, output_chars=chars) + "\n```"
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            specgen_core.repair_specification(text, response_model=Specification, max_attempts=0)
+        print(f"{len(text) / 1024:8.0f}KB {_ms((time.perf_counter() - start) / args.repeat)}")
+
+
+def bench_db_writes(args):
+    print("\nDB write cost")
+    print(f"{'operation':<20} {'ms/op':>9}")
+    spec_json = mock_llm.mock_content("", structured=True)
+    markdown = mock_llm.mock_content("")
+    operations = [
+        ("save_checkpoint", lambda i: db.save_checkpoint(f"bench-{i}", "stage_2", markdown)),
+        ("save_spec", lambda i: db.save_spec(f"Bench {i}", GOAL.format(i=i), spec_json, markdown)),
+        ("update_job", lambda i: db.update_job("bench-job", partial=markdown)),
+    ]
+    for name, operation in operations:
+        start = time.perf_counter()
+        for i in range(args.repeat):
+            operation(i)
+        print(f"{name:<20} {_ms((time.perf_counter() - start) / args.repeat)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--goals", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Median mock time to first token")
+    parser.add_argument("--latency", choices=mock_llm.LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of calls answered with a 429")
+    parser.add_argument("--tail-jitter", type=float, default=1.0,
+                        help="Lognormal sigma of the mock latency in the hedging section")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=50, help="Iterations for the parse and DB sections")
+    parser.add_argument("--only", choices=("throughput", "overhead", "hedging", "json", "db"), nargs="+",
+                        default=("throughput", "overhead", "hedging", "json", "db"))
+    args = parser.parse_args()
+
+    db.set_db_path(os.path.join(TMP, "bench.db"))
+    db.init_db()
+    sections = {"throughput": bench_throughput, "overhead": bench_stage_overhead, "hedging": bench_hedging,
+                "json": bench_json_parse, "db": bench_db_writes}
+    for name in args.only:
+        sections[name](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import re
+
+import tracing
+from rate_limiter import estimate_tokens
+
+# --------------------------------------------------
+# Context Trimming and Shared Prompt Prefix for the Crew
+# --------------------------------------------------
+# CrewAI feeds each task the full output of every task in its `context`,
+# and each agent repeats its own preamble. Two changes keep later prompts
+# small:
+#   - Trimming: once the analysis is done, downstream tasks see only its
+#     user stories (the writer), and the reviewer sees only the draft. The
+#     stories still reach the final Specification from here, in code.
+#   - Shared prefix: the static instructions (SRS layout, conventions,
+#     output rules) are sent as one identical system message at the start
+#     of every crew LLM call, so Gemini can reuse it (implicit prefix
+#     caching; SPECGEN_CONTEXT_CACHE=1 also marks it for explicit context
+#     caching through LiteLLM). Agent backstories and task descriptions only
+#     carry what differs.
+# SPECGEN_TRIM_CONTEXT=0 restores the full upstream context.
+
+TRIM_CONTEXT = os.getenv("SPECGEN_TRIM_CONTEXT", "1").lower() not in ("0", "false", "no")
+CONTEXT_CACHE = os.getenv("SPECGEN_CONTEXT_CACHE", "").lower() in ("1", "true", "yes")
+
+SHARED_PREFIX = """You are part of SpecGen AI, a three-agent team that turns a product feature goal into a Software Requirements Specification (SRS):
+the Product Analyst writes user stories and strategic notes, the Lead Technical Writer drafts the SRS, and the QA Engineering Lead reviews it.
+
+Conventions for every agent:
+- User stories follow 'As a [role], I want [action] so that [benefit]', one per line.
+- Functional requirements are numbered FR-001, FR-002, ... and each has testable acceptance criteria in GIVEN/WHEN/THEN format.
+- Non-functional requirements are numbered NFR-001, NFR-002, ... and each has a measurable target (performance, security, scalability, accessibility).
+- Flow diagrams are a single Mermaid block (```mermaid ... ```).
+
+The SRS is clean Markdown with these headings, in order:
+# Title
+## Introduction
+## User Stories
+## Functional Requirements (FR-001…)
+## Non-Functional Requirements (NFR-001…)
+## API Requirements (if applicable)
+## Data Requirements (if applicable)
+## Risks & Mitigation
+
+Output rules:
+- Drafts are Markdown only, never JSON.
+- Structured answers are ONLY the raw JSON object matching the named Pydantic model: no Markdown code fences, no commentary.
+"""
+
+_STORY = re.compile(r"\bAs an?\s+[^,\n]{1,80},\s*I\s+(?:want|need)\b[^\n]*", re.IGNORECASE)
+
+
+def extract_stories(text: str) -> list:
+    """The 'As a ..., I want ...' user stories in text, in order, without duplicates or list markup."""
+    stories = []
+    for match in _STORY.finditer(text or ""):
+        story = match.group(0).strip().rstrip("*_\"'").strip()
+        if story not in stories:
+            stories.append(story)
+    return stories
+
+
+def output_text(output) -> str:
+    """Raw text of a CrewAI TaskOutput (`raw` in current CrewAI, `raw_output` in older releases)."""
+    return getattr(output, "raw", None) or getattr(output, "raw_output", None) or str(output)
+
+
+def _set_output_text(output, text: str):
+    for field in ("raw", "raw_output"):
+        if hasattr(output, field):
+            setattr(output, field, text)
+
+
+def with_shared_prefix(messages) -> list:
+    """The crew LLM messages with SHARED_PREFIX as the first (system) message."""
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    content = SHARED_PREFIX
+    if CONTEXT_CACHE:
+        content = [{"type": "text", "text": SHARED_PREFIX, "cache_control": {"type": "ephemeral"}}]
+    return [{"role": "system", "content": content}, *messages]
+
+
+PREFIX_TOKENS = estimate_tokens(SHARED_PREFIX, 0)
+
+
+class TaskContext:
+    """
+    Tracks the crew's task outputs for one run: trims what downstream tasks
+    see and estimates each task's prompt tokens with and without trimming.
+
+    register() each task with the names of the tasks whose output it would
+    get untrimmed (`before`) and actually gets (`after`); task_done() and
+    then trim() are called from the task's callback.
+    """
+
+    def __init__(self, trim: bool = TRIM_CONTEXT):
+        self.trim_enabled = trim
+        self.stories = []
+        self.report = {}    # task name -> prompt token estimates (tracing attributes)
+        self._full = {}     # task name -> full output text
+        self._sent = {}     # task name -> output text downstream tasks see
+        self._inputs = {}   # task name -> (description, before, after)
+
+    def register(self, name: str, task, before: list = (), after: list = ()):
+        self._inputs[name] = (task.description, list(before), list(after))
+
+    def task_done(self, name: str, output):
+        """Record a finished task's output and its prompt token estimates."""
+        text = output_text(output)
+        self._full[name] = self._sent[name] = text
+        description, before, after = self._inputs.get(name, ("", [], []))
+        untrimmed = estimate_tokens(description + "".join(self._full.get(i, "") for i in before), 0)
+        trimmed = estimate_tokens(description + "".join(self._sent.get(i, "") for i in after), 0)
+        self.report[name] = {
+            tracing.UNTRIMMED_ESTIMATE: untrimmed,
+            tracing.PROMPT_ESTIMATE: trimmed,
+            tracing.SHARED_PREFIX_TOKENS: PREFIX_TOKENS,
+        }
+
+    def trim(self, name: str, output):
+        """Cut the analysis down to its user stories before the writer reads it."""
+        if name != "analysis":
+            return
+        self.stories = extract_stories(self._full[name])
+        if self.trim_enabled and self.stories:
+            self._sent[name] = "User stories:\n" + "\n".join(f"- {story}" for story in self.stories)
+            _set_output_text(output, self._sent[name])
+
+    def full_text(self, name: str) -> str:
+        return self._full.get(name, "")
@@ -1,17 +1,189 @@
 import sqlite3
 import os
-from datetime import datetime
+import json
+import re
+import zlib
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# zstd is optional; zlib (stdlib) is used when the zstandard package is absent
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 DB_PATH = os.path.join(os.getcwd(), "specgen.db")
+POOL_SIZE = int(os.getenv("SPECGEN_DB_POOL_SIZE", "8"))
 
 # ----------------------------------
-# Initialize Database
+# Connection Tuning
 # ----------------------------------
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+# WAL lets readers run alongside a writer, so concurrent Streamlit sessions no
+# longer stall on "database is locked". synchronous=NORMAL is durable under WAL
+# except for the last transactions on power loss, which is fine for a spec store.
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",      # ~20 MB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=30000",
+    "PRAGMA mmap_size=268435456",    # 256 MB memory-mapped reads
+]
+
+# sqlite3 keeps a per-connection LRU of prepared statements keyed by SQL text,
+# so every query below is a constant string that is compiled once per connection.
+STATEMENT_CACHE_SIZE = 256
+
+
+# ----------------------------------
+# Compressed Storage
+# ----------------------------------
+# Large json_output / markdown_output values are stored as BLOBs with a
+# 4-byte codec tag; small values stay plain TEXT. The Markdown is stored once:
+# json_output keeps a placeholder where detailed_spec_markdown used to be.
+COMPRESS_MIN_BYTES = 512
+COMPRESSION = os.getenv("SPECGEN_COMPRESSION", "zstd" if zstandard else "zlib")
+ZLIB_TAG = b"SGZ1"
+ZSTD_TAG = b"SGS1"
+MARKDOWN_PLACEHOLDER = "__specgen:markdown_output__"
+
+
+def encode_text(text):
+    """Compress text for storage if it is large enough to be worth it."""
+    if text is None:
+        return None
+    raw = text.encode("utf-8")
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return text
+    if COMPRESSION == "zstd" and zstandard is not None:
+        return ZSTD_TAG + zstandard.ZstdCompressor(level=9).compress(raw)
+    return ZLIB_TAG + zlib.compress(raw, 6)
+
+
+def decode_text(value):
+    """Inverse of encode_text; plain TEXT values pass through unchanged."""
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    value = bytes(value)
+    tag, payload = value[:4], value[4:]
+    if tag == ZLIB_TAG:
+        return zlib.decompress(payload).decode("utf-8")
+    if tag == ZSTD_TAG:
+        if zstandard is None:
+            raise RuntimeError("This spec was stored with zstd; install the 'zstandard' package to read it.")
+        return zstandard.ZstdDecompressor().decompress(payload).decode("utf-8")
+    return value.decode("utf-8")
+
+
+def _dedupe_json(json_str: str, markdown: str) -> str:
+    """Replace the embedded copy of the Markdown with a placeholder."""
+    try:
+        data = json.loads(json_str)
+    except (TypeError, ValueError):
+        return json_str
+    if isinstance(data, dict) and markdown and data.get("detailed_spec_markdown") == markdown:
+        data["detailed_spec_markdown"] = MARKDOWN_PLACEHOLDER
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return json_str
+
+
+def _restore_json(json_str: str, markdown: str) -> str:
+    if not json_str or MARKDOWN_PLACEHOLDER not in json_str:
+        return json_str
+    # Restored by key: other fields may quote the placeholder. The stored
+    # JSON is small without its Markdown, so the parse is cheap.
+    data = json.loads(json_str)
+    if not isinstance(data, dict) or data.get("detailed_spec_markdown") != MARKDOWN_PLACEHOLDER:
+        return json_str
+    data["detailed_spec_markdown"] = markdown
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _encode_spec(json_str: str, markdown: str):
+    return encode_text(_dedupe_json(json_str, markdown)), encode_text(markdown)
+
+
+# ----------------------------------
+# Connection Pool
+# ----------------------------------
+class ConnectionPool:
+    """
+    Thread-safe pool of long-lived SQLite connections. Connections are opened
+    lazily up to `size`; further callers wait for one to be returned.
+    """
+
+    def __init__(self, path: str, size: int = POOL_SIZE, on_first_connect=None):
+        self.path = path
+        self.size = size
+        self.on_first_connect = on_first_connect
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=30,
+            check_same_thread=False,  # connections move between threads via the pool
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        # Lets SQL (the search view and its triggers) read compressed columns
+        conn.create_function("spec_text", 1, decode_text, deterministic=True)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    conn = self._open()
+                    if not self._initialized and self.on_first_connect:
+                        self.on_first_connect(conn)
+                    self._initialized = True
+                    return conn
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; the block runs as one transaction (commit on success, rollback on error)."""
+        conn = self._acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close_all(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._created -= 1
 
-    cur.execute(
+
+# ----------------------------------
+# Initialize Database
+# ----------------------------------
+def _create_schema(conn):
+    conn.execute(
         """
         CREATE TABLE IF NOT EXISTS specifications (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -24,74 +196,685 @@ def init_db():
         """
     )
 
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pipeline_checkpoints (
+            run_id TEXT,
+            stage TEXT,
+            payload TEXT,
+            created_at TEXT,
+            PRIMARY KEY (run_id, stage)
+        );
+        """
+    )
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT,
+            request TEXT,
+            stage TEXT,
+            partial TEXT,
+            result TEXT,
+            spec_id INTEGER,
+            error TEXT,
+            worker TEXT,
+            created_at TEXT,
+            started_at TEXT,
+            updated_at TEXT,
+            finished_at TEXT
+        );
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS trace_spans (
+            span_id TEXT PRIMARY KEY,
+            trace_id TEXT,
+            parent_id TEXT,
+            name TEXT,
+            start_ns INTEGER,
+            end_ns INTEGER,
+            status TEXT,
+            attributes TEXT
+        );
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trace_spans_start ON trace_spans(start_ns)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trace_spans_trace ON trace_spans(trace_id)")
+
+    # Insert / delete counters kept by triggers (plain SQL, so they also count
+    # writes from other processes and plain connections): in-memory indexes
+    # such as similarity.py read one row to learn whether anything changed.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS spec_changes (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            inserted INTEGER NOT NULL,
+            deleted INTEGER NOT NULL
+        );
+        """
+    )
+    conn.execute("INSERT OR IGNORE INTO spec_changes (id, inserted, deleted) VALUES (1, 0, 0)")
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS specifications_count_insert AFTER INSERT ON specifications "
+        "BEGIN UPDATE spec_changes SET inserted = inserted + 1 WHERE id = 1; END"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS specifications_count_delete AFTER DELETE ON specifications "
+        "BEGIN UPDATE spec_changes SET deleted = deleted + 1 WHERE id = 1; END"
+    )
+
+    # History paging walks (created_at, id) newest-first; the index also
+    # carries the rowid so each page is a bounded index range scan.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_specifications_created_at ON specifications(created_at, id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_specifications_title ON specifications(title COLLATE NOCASE)"
+    )
+
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        _migrate_compressed_storage(conn)
+
+    _create_search_index(conn)
+
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
-    conn.close()
+
+
+# ----------------------------------
+# One-shot Storage Migration
+# ----------------------------------
+# user_version 1 = compressed, de-duplicated json_output / markdown_output
+SCHEMA_VERSION = 1
+MIGRATION_BATCH_SIZE = 500
+
+
+def _migrate_compressed_storage(conn):
+    """
+    Rewrite plain-TEXT rows into the compressed format. Search triggers of
+    older schemas are dropped first; the decoded text is unchanged, so the
+    FTS index stays valid.
+    """
+    for trigger in ("specifications_fts_insert", "specifications_fts_delete", "specifications_fts_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, json_output, markdown_output FROM specifications "
+            "WHERE id > ? AND typeof(markdown_output) = 'text' ORDER BY id LIMIT ?",
+            (last_id, MIGRATION_BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        conn.executemany(
+            "UPDATE specifications SET json_output = ?, markdown_output = ? WHERE id = ?",
+            [(*_encode_spec(decode_text(j), decode_text(m)), spec_id) for spec_id, j, m in rows]
+        )
+        last_id = rows[-1][0]
+
+
+def compact_db():
+    """Sweep expired checkpoints and spans, then reclaim the freed space (VACUUM cannot run inside a transaction)."""
+    delete_expired_checkpoints()
+    delete_expired_spans()
+    conn = _pool._acquire()
+    try:
+        conn.execute("VACUUM")
+    finally:
+        _pool._idle.put(conn)
+
+
+# ----------------------------------
+# Full-Text Search Index (FTS5)
+# ----------------------------------
+# The FTS table is contentless: it holds only the index, not a second copy
+# of every Markdown document. Rows are written from Python with the decoded
+# text (save_spec, save_specs, delete_spec), so the schema needs no SQL
+# function and plain sqlite3 connections can still change specifications.
+FTS_ENABLED = True
+FTS_COLUMNS = "title, feature, markdown, stories"
+
+
+def _spec_stories(json_str: str) -> str:
+    try:
+        data = json.loads(json_str or "")
+    except (TypeError, ValueError):
+        return ""
+    stories = data.get("high_level_stories") if isinstance(data, dict) else None
+    return " ".join(str(story) for story in stories) if isinstance(stories, list) else ""
+
+
+def _search_row(spec_id: int, title: str, feature: str, json_str: str, markdown: str) -> tuple:
+    return spec_id, title, feature, markdown, _spec_stories(json_str)
+
+
+def _index_specs(conn, rows: list):
+    """Add (id, title, feature, json_str, markdown) rows, decoded, to the search index."""
+    if FTS_ENABLED and rows:
+        conn.executemany(
+            f"INSERT INTO specifications_fts (rowid, {FTS_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+            [_search_row(*row) for row in rows]
+        )
+
+
+def _unindex_specs(conn, rows: list):
+    # A contentless index forgets a row only when given the values it indexed
+    if FTS_ENABLED and rows:
+        conn.executemany(
+            f"INSERT INTO specifications_fts (specifications_fts, rowid, {FTS_COLUMNS}) "
+            "VALUES ('delete', ?, ?, ?, ?, ?)",
+            [_search_row(*row) for row in rows]
+        )
+
+
+def _create_search_index(conn):
+    global FTS_ENABLED
+
+    existing = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'specifications_fts'"
+    ).fetchone()
+    # Older databases: an external-content index over a view, kept in sync by
+    # triggers, all calling spec_text(). Replace it with the contentless one.
+    for trigger in ("specifications_fts_insert", "specifications_fts_delete", "specifications_fts_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    if existing and "specifications_search" in existing[0]:
+        conn.execute("DROP TABLE specifications_fts")
+        existing = None
+    conn.execute("DROP VIEW IF EXISTS specifications_search")
+
+    try:
+        conn.execute(
+            f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS specifications_fts USING fts5(
+                {FTS_COLUMNS}, content='', tokenize='porter unicode61'
+            )
+            """
+        )
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5: search_specs() falls back to a LIKE scan
+        FTS_ENABLED = False
+        return
+
+    if not existing:
+        # Index every spec stored before search (or this index) was added
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, title, feature, json_output, markdown_output FROM specifications "
+                "WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, MIGRATION_BATCH_SIZE)
+            ).fetchall()
+            if not rows:
+                break
+            _index_specs(conn, [(spec_id, title, feature, decode_text(j), decode_text(m))
+                                for spec_id, title, feature, j, m in rows])
+            last_id = rows[-1][0]
+
+
+# Schema is created on first use instead of as an import side effect
+_pool = ConnectionPool(DB_PATH, on_first_connect=_create_schema)
+
+
+def init_db():
+    with _pool.connection() as conn:
+        _create_schema(conn)
+
+
+def set_db_path(path: str, pool_size: int = POOL_SIZE):
+    """Point the storage layer at another database file (benchmarks, CLI tools)."""
+    global DB_PATH, _pool
+    _pool.close_all()
+    DB_PATH = path
+    _pool = ConnectionPool(path, size=pool_size, on_first_connect=_create_schema)
 
 
 # ----------------------------------
 # Save Specification
 # ----------------------------------
-def save_spec(title: str, feature: str, json_str: str, markdown: str):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+INSERT_SPEC_SQL = """
+    INSERT INTO specifications (title, feature, json_output, markdown_output, created_at)
+    VALUES (?, ?, ?, ?, ?)
+"""
 
-    cur.execute(
-        """
-        INSERT INTO specifications (title, feature, json_output, markdown_output, created_at)
-        VALUES (?, ?, ?, ?, ?)
-        """,
-        (
-            title,
-            feature,
-            json_str,
-            markdown,
-            datetime.utcnow().isoformat()
+
+def spec_title(feature: str, markdown: str) -> str:
+    """First Markdown H1 of the spec, else the start of the feature goal."""
+    match = re.search(r'^#\s+(.+)$', markdown, re.MULTILINE)
+    if match:
+        return match.group(1).strip()[:120]
+    return feature[:80]
+
+
+def save_spec(title: str, feature: str, json_str: str, markdown: str):
+    json_blob, markdown_blob = _encode_spec(json_str, markdown)
+    with _pool.connection() as conn:
+        cur = conn.execute(
+            INSERT_SPEC_SQL,
+            (
+                title,
+                feature,
+                json_blob,
+                markdown_blob,
+                datetime.utcnow().isoformat()
+            )
         )
-    )
+        spec_id = cur.lastrowid
+        _index_specs(conn, [(spec_id, title, feature, json_str, markdown)])
+    return spec_id
 
-    conn.commit()
-    conn.close()
+
+def save_specs(specs: list):
+    """
+    Batched insert of (title, feature, json_str, markdown) tuples in a
+    single transaction.
+    """
+    created_at = datetime.utcnow().isoformat()
+    with _pool.connection() as conn:
+        conn.executemany(
+            INSERT_SPEC_SQL,
+            [
+                (title, feature, *_encode_spec(json_str, markdown), created_at)
+                for title, feature, json_str, markdown in specs
+            ]
+        )
+        # One transaction on an AUTOINCREMENT table: the new ids are consecutive
+        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        first_id = last_id - len(specs) + 1
+        _index_specs(conn, [(first_id + offset, *spec) for offset, spec in enumerate(specs)])
+    return len(specs)
 
 
 # ----------------------------------
 # Fetch All Specifications
 # ----------------------------------
 def get_all_specs():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT id, title, feature, created_at FROM specifications ORDER BY id DESC")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    # Loads every row; prefer get_specs_page() for anything user-facing.
+    with _pool.connection() as conn:
+        return conn.execute(
+            "SELECT id, title, feature, created_at FROM specifications ORDER BY id DESC"
+        ).fetchall()
+
+
+def iter_spec_features(batch_size: int = 5000, after_id: int = 0):
+    """Yields batches of (id, feature) for every stored spec with an id above after_id, oldest first."""
+    last_id = after_id
+    while True:
+        with _pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT id, feature FROM specifications WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            ).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def spec_change_counts() -> tuple:
+    """(specs ever inserted, specs ever deleted), from any process: a one-row read for change detection."""
+    with _pool.connection() as conn:
+        return conn.execute("SELECT inserted, deleted FROM spec_changes WHERE id = 1").fetchone()
+
+
+def get_spec_ids() -> set:
+    with _pool.connection() as conn:
+        return {row[0] for row in conn.execute("SELECT id FROM specifications")}
+
+
+# ----------------------------------
+# Paginated Specification History
+# ----------------------------------
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def get_specs_page(limit: int = 20, cursor=None, title_prefix: str = None,
+                   created_from: str = None, created_to: str = None):
+    """
+    Keyset-paginated history listing, newest first.
+
+    cursor is the (created_at, id) pair returned with the previous page;
+    title_prefix matches case-insensitively from the start of the title;
+    created_from / created_to are ISO timestamps (inclusive / exclusive).
+
+    Returns (rows, next_cursor) where next_cursor is None on the last page.
+    Each page is an index range scan, so its cost does not grow with table size.
+    """
+    clauses = []
+    params = []
+
+    if cursor is not None:
+        clauses.append("(created_at, id) < (?, ?)")
+        params.extend(cursor)
+    if title_prefix:
+        clauses.append("title LIKE ? ESCAPE '\\'")
+        params.append(_escape_like(title_prefix) + "%")
+    if created_from:
+        clauses.append("created_at >= ?")
+        params.append(created_from)
+    if created_to:
+        clauses.append("created_at < ?")
+        params.append(created_to)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with _pool.connection() as conn:
+        rows = conn.execute(
+            f"SELECT id, title, feature, created_at FROM specifications {where} "
+            "ORDER BY created_at DESC, id DESC LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+
+    # One extra row tells us whether another page exists without a COUNT(*)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, (last[3], last[0])
+    return rows, None
+
+
+# ----------------------------------
+# Full-Text Search
+# ----------------------------------
+# bm25 column weights: title, feature, markdown, stories
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0, 3.0)
+
+
+def _fts_query(text: str) -> str:
+    """Quote each word so user input can never be parsed as FTS5 syntax; the last word matches as a prefix."""
+    words = re.findall(r'\w+', text)
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words[:-1]] + [f'"{words[-1]}"*']
+    return " ".join(terms)
+
+
+def search_specs(query: str, limit: int = 20, created_from: str = None, created_to: str = None):
+    """
+    Ranked full-text search over title, feature, Markdown and user stories.
+    created_from / created_to are ISO timestamps (inclusive / exclusive), as in get_specs_page.
+    Returns (id, title, created_at, snippet, score) rows, best match first.
+    """
+    match = _fts_query(query)
+    if not match:
+        return []
+
+    date_clauses = ""
+    date_params = []
+    if created_from:
+        date_clauses += " AND s.created_at >= ?"
+        date_params.append(created_from)
+    if created_to:
+        date_clauses += " AND s.created_at < ?"
+        date_params.append(created_to)
+
+    with _pool.connection() as conn:
+        if not FTS_ENABLED:
+            like = f"%{_escape_like(query.strip())}%"
+            return conn.execute(
+                "SELECT id, title, created_at, substr(feature, 1, 160), 0.0 FROM specifications AS s "
+                "WHERE (title LIKE ? ESCAPE '\\' OR feature LIKE ? ESCAPE '\\' OR spec_text(markdown_output) LIKE ? ESCAPE '\\')"
+                f"{date_clauses} ORDER BY id DESC LIMIT ?",
+                (like, like, like, *date_params, limit)
+            ).fetchall()
+
+        rows = conn.execute(
+            f"""
+            SELECT s.id, s.title, s.created_at, s.feature, s.markdown_output,
+                   bm25(specifications_fts, ?, ?, ?, ?) AS score
+            FROM specifications_fts
+            JOIN specifications AS s ON s.id = specifications_fts.rowid
+            WHERE specifications_fts MATCH ?{date_clauses}
+            ORDER BY score
+            LIMIT ?
+            """,
+            (*SEARCH_WEIGHTS, match, *date_params, limit)
+        ).fetchall()
+    # The contentless index has no text for snippet(): cut it from the hits, decoded
+    words = re.findall(r'\w+', query)
+    return [
+        (spec_id, title, created_at, _snippet((title, feature, decode_text(markdown_blob)), words), score)
+        for spec_id, title, created_at, feature, markdown_blob, score in rows
+    ]
+
+
+def _snippet(texts, words: list, context: int = 60) -> str:
+    """A window around the first query word found in texts, matches in bold (like FTS5 snippet())."""
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(w) for w in words) + r")\w*", re.IGNORECASE)
+    for text in texts:
+        found = pattern.search(text or "")
+        if found:
+            start, end = max(0, found.start() - context), min(len(text), found.end() + context)
+            window = " ".join(text[start:end].split())
+            window = pattern.sub(lambda m: f"**{m.group(0)}**", window)
+            return ("… " if start else "") + window + (" …" if end < len(text) else "")
+    return (texts[1] or "")[:160]
 
 
 # ----------------------------------
 # Fetch Full Spec
 # ----------------------------------
 def get_spec_by_id(spec_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, title, feature, json_output, markdown_output, created_at FROM specifications WHERE id = ?",
-        (spec_id,)
-    )
-    row = cur.fetchone()
-    conn.close()
-    return row
+    with _pool.connection() as conn:
+        row = conn.execute(
+            "SELECT id, title, feature, json_output, markdown_output, created_at FROM specifications WHERE id = ?",
+            (spec_id,)
+        ).fetchone()
+    if row is None:
+        return None
+
+    # Transparent decode: callers always see the original TEXT columns
+    spec_id, title, feature, json_blob, markdown_blob, created_at = row
+    markdown = decode_text(markdown_blob)
+    return (spec_id, title, feature, _restore_json(decode_text(json_blob), markdown), markdown, created_at)
 
 
 # ----------------------------------
 # Delete Specification
 # ----------------------------------
 def delete_spec(spec_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM specifications WHERE id = ?", (spec_id,))
-    conn.commit()
-    conn.close()
+    with _pool.connection() as conn:
+        row = conn.execute(
+            "SELECT id, title, feature, json_output, markdown_output FROM specifications WHERE id = ?",
+            (spec_id,)
+        ).fetchone()
+        if row is not None:
+            _unindex_specs(conn, [(row[0], row[1], row[2], decode_text(row[3]), decode_text(row[4]))])
+        conn.execute("DELETE FROM specifications WHERE id = ?", (spec_id,))
 
 
 # ----------------------------------
-# Initialize DB at import
+# Pipeline Stage Checkpoints
 # ----------------------------------
-init_db()
\ No newline at end of file
+# A run's checkpoints are deleted once it completes; runs abandoned after a
+# failure are swept once their newest checkpoint is CHECKPOINT_TTL_HOURS old.
+CHECKPOINT_TTL_HOURS = float(os.getenv("SPECGEN_CHECKPOINT_TTL_HOURS", "72"))
+
+
+def save_checkpoint(run_id: str, stage: str, payload):
+    with _pool.connection() as conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO pipeline_checkpoints (run_id, stage, payload, created_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            (run_id, stage, encode_text(json.dumps(payload)), datetime.utcnow().isoformat())
+        )
+
+
+def get_checkpoints(run_id: str) -> dict:
+    with _pool.connection() as conn:
+        rows = conn.execute(
+            "SELECT stage, payload FROM pipeline_checkpoints WHERE run_id = ?", (run_id,)
+        ).fetchall()
+    return {stage: json.loads(decode_text(payload)) for stage, payload in rows}
+
+
+def delete_checkpoints(run_id: str):
+    with _pool.connection() as conn:
+        conn.execute("DELETE FROM pipeline_checkpoints WHERE run_id = ?", (run_id,))
+
+
+def delete_expired_checkpoints(ttl_hours: float = CHECKPOINT_TTL_HOURS) -> int:
+    """Drop every run whose newest checkpoint is older than ttl_hours; returns the rows deleted."""
+    expired_before = (datetime.utcnow() - timedelta(hours=ttl_hours)).isoformat()
+    with _pool.connection() as conn:
+        return conn.execute(
+            "DELETE FROM pipeline_checkpoints WHERE run_id IN ("
+            "SELECT run_id FROM pipeline_checkpoints GROUP BY run_id HAVING MAX(created_at) < ?)",
+            (expired_before,)
+        ).rowcount
+
+
+# ----------------------------------
+# Background Job Queue
+# ----------------------------------
+# status: queued -> running -> done | failed. Running jobs refresh updated_at
+# as a heartbeat; a job whose worker stopped heartbeating is queued again.
+JOB_COLUMNS = ("id", "status", "request", "stage", "partial", "result", "spec_id", "error",
+               "worker", "created_at", "started_at", "updated_at", "finished_at")
+
+
+def enqueue_job(request: dict) -> str:
+    job_id = uuid.uuid4().hex
+    now = datetime.utcnow().isoformat()
+    with _pool.connection() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, status, request, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+            (job_id, json.dumps(request), now, now)
+        )
+    return job_id
+
+
+def claim_job(worker: str, stale_after_seconds: float):
+    """Atomically move the oldest queued job to running; returns (job_id, request) or None."""
+    now = datetime.utcnow()
+    stale_before = (now - timedelta(seconds=stale_after_seconds)).isoformat()
+    with _pool.connection() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND updated_at < ?",
+            (stale_before,)
+        )
+        for job_id, request in conn.execute(
+            "SELECT id, request FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 8"
+        ).fetchall():
+            # Another worker may have won the race for this row; try the next one
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (worker, now.isoformat(), now.isoformat(), job_id)
+            )
+            if cur.rowcount == 1:
+                return job_id, json.loads(request)
+    return None
+
+
+def update_job(job_id: str, stage: str = None, partial: str = None):
+    """Record progress (and refresh the heartbeat); None leaves a field unchanged."""
+    with _pool.connection() as conn:
+        conn.execute(
+            "UPDATE jobs SET stage = COALESCE(?, stage), partial = COALESCE(?, partial), updated_at = ? "
+            "WHERE id = ?",
+            (stage, partial, datetime.utcnow().isoformat(), job_id)
+        )
+
+
+def finish_job(job_id: str, result: str, spec_id: int = None, error: str = None):
+    """Mark the job done; error notes a problem that did not fail it (e.g. the spec was not saved)."""
+    now = datetime.utcnow().isoformat()
+    with _pool.connection() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = 'done', result = ?, spec_id = ?, error = ?, partial = NULL, "
+            "updated_at = ?, finished_at = ? WHERE id = ?",
+            (result, spec_id, error, now, now, job_id)
+        )
+
+
+def fail_job(job_id: str, error: str):
+    now = datetime.utcnow().isoformat()
+    with _pool.connection() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+            (error, now, now, job_id)
+        )
+
+
+def get_job(job_id: str):
+    """The job as a dict (request decoded), or None."""
+    with _pool.connection() as conn:
+        row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(zip(JOB_COLUMNS, row))
+    job["request"] = json.loads(job["request"])
+    return job
+
+
+# ----------------------------------
+# Trace Spans
+# ----------------------------------
+# Written by tracing.py, one transaction per finished trace; spans older
+# than SPAN_RETENTION_DAYS are swept by delete_expired_spans().
+SPAN_RETENTION_DAYS = float(os.getenv("SPECGEN_TRACE_RETENTION_DAYS", "7"))
+SPAN_COLUMNS = ("span_id", "trace_id", "parent_id", "name", "start_ns", "end_ns", "status", "attributes")
+
+
+def save_spans(spans: list):
+    """Insert (span_id, trace_id, parent_id, name, start_ns, end_ns, status, attributes_dict) tuples."""
+    with _pool.connection() as conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO trace_spans ({', '.join(SPAN_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(*span[:7], json.dumps(span[7])) for span in spans]
+        )
+
+
+def get_spans(trace_id: str = None, since_ns: int = None, limit: int = 50000):
+    """Span dicts (attributes decoded), oldest first, for one trace or everything since since_ns."""
+    clauses, params = [], []
+    if trace_id is not None:
+        clauses.append("trace_id = ?")
+        params.append(trace_id)
+    if since_ns is not None:
+        clauses.append("start_ns >= ?")
+        params.append(since_ns)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with _pool.connection() as conn:
+        rows = conn.execute(
+            f"SELECT {', '.join(SPAN_COLUMNS)} FROM trace_spans {where} ORDER BY start_ns LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+    spans = [dict(zip(SPAN_COLUMNS, row)) for row in rows]
+    for span in spans:
+        span["attributes"] = json.loads(span["attributes"] or "{}")
+    return spans
+
+
+def delete_spans(before_ns: int) -> int:
+    with _pool.connection() as conn:
+        return conn.execute("DELETE FROM trace_spans WHERE start_ns < ?", (before_ns,)).rowcount
+
+
+def delete_expired_spans(retention_days: float = SPAN_RETENTION_DAYS) -> int:
+    """Drop spans that started more than retention_days ago; returns the rows deleted."""
+    return delete_spans(time.time_ns() - int(retention_days * 86400 * 1e9))
+
+
+# ----------------------------------
+# CLI: python db.py migrate
+# ----------------------------------
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["migrate"]:
+        sys.exit("Usage: python db.py migrate")
+
+    before = os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0
+    init_db()
+    compact_db()
+    after = os.path.getsize(DB_PATH)
+    print(f"Migrated {DB_PATH}: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
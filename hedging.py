@@ -0,0 +1,257 @@
+import os
+import math
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+
+import tracing
+
+# --------------------------------------------------
+# Per-call Deadlines and Hedged Requests
+# --------------------------------------------------
+# One slow Gemini response used to stall a whole run: neither the LiteLLM
+# calls nor the CrewAI LLM had a timeout. Two controls cut the tail:
+#   - Deadlines: every LLM call gets the timeout of its route (pipeline
+#     stage or crew agent, as in model_router). SPECGEN_DEADLINE_<ROUTE>
+#     (e.g. SPECGEN_DEADLINE_STAGE_2=240) sets one route,
+#     SPECGEN_DEADLINE_SECONDS the others; 0 means no deadline. For streams
+#     LiteLLM applies it to the wait for each chunk.
+#   - Hedging (SPECGEN_HEDGING=1): a call that has not answered by the p90
+#     latency of recent calls on the same route and model (time to first
+#     chunk for streams) gets a duplicate, and whichever answers first wins.
+#     The loser is cancelled where possible (async calls, streams) or left
+#     to finish unused. SPECGEN_HEDGE_BUDGET caps duplicates at that share
+#     of calls (0.1: at most ~10% extra requests, and so ~10% extra spend);
+#     nothing is hedged before SPECGEN_HEDGE_MIN_SAMPLES latencies are known.
+# Hedges are recorded on the LLM spans (tracing.stage_stats reports how
+# often they fire and win) and, per process, in HEDGER.stats().
+
+DEFAULT_DEADLINE_SECONDS = float(os.getenv("SPECGEN_DEADLINE_SECONDS", "120"))
+# Routes that write the whole draft get longer
+DEFAULT_DEADLINES = {"stage_2": 240.0, "writer": 240.0}
+
+HEDGING_ENABLED = os.getenv("SPECGEN_HEDGING", "").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("SPECGEN_HEDGE_PERCENTILE", "0.9"))
+HEDGE_BUDGET = float(os.getenv("SPECGEN_HEDGE_BUDGET", "0.1"))
+HEDGE_MIN_SAMPLES = int(os.getenv("SPECGEN_HEDGE_MIN_SAMPLES", "20"))
+# Latencies kept per route and model, and hedges that may fire back to back:
+# credit beyond one would let a slow spell overshoot the budget
+LATENCY_WINDOW = 200
+HEDGE_BURST = 1
+
+
+def deadline_for(route: str, environ=os.environ):
+    """Timeout in seconds for one LLM call on route, or None for no deadline."""
+    value = environ.get(f"SPECGEN_DEADLINE_{(route or '').upper()}")
+    seconds = float(value) if value else DEFAULT_DEADLINES.get(route, DEFAULT_DEADLINE_SECONDS)
+    return seconds if seconds > 0 else None
+
+
+# ----------------------------------
+# Hedger
+# ----------------------------------
+def _discard_loser(future, on_discard):
+    # The losing attempt finished after the winner: release what it returned
+    if on_discard is None or future.cancelled() or future.exception() is not None:
+        return
+    try:
+        on_discard(future.result())
+    except Exception:
+        pass
+
+
+class Hedger:
+    """
+    Runs LLM calls with an optional duplicate once they outlast the
+    route's p90, within a budget of extra calls. key identifies comparable
+    calls, e.g. (route, model, streamed).
+    """
+
+    def __init__(self, enabled: bool = HEDGING_ENABLED, percentile: float = HEDGE_PERCENTILE,
+                 budget: float = HEDGE_BUDGET, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self._latencies = {}   # key -> recent latencies (seconds)
+        self._counts = {}      # key -> {"calls", "hedged", "won", "over_budget"}
+        self._credit = 0.0     # Hedges allowed now; each call that may hedge adds `budget`
+        self._lock = threading.Lock()
+
+    # -------------------------
+    # Latency window and budget
+    # -------------------------
+    def _count(self, key, field: str):
+        with self._lock:
+            counts = self._counts.setdefault(key, {"calls": 0, "hedged": 0, "won": 0, "over_budget": 0})
+            counts[field] += 1
+
+    def _earn_credit(self):
+        # Only calls that may hedge earn credit, so disabled or warming-up keys don't bank a burst
+        with self._lock:
+            self._credit = min(self._credit + self.budget, HEDGE_BURST)
+
+    def record(self, key, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def hedge_delay(self, key):
+        """Seconds to wait before hedging a call on key (its p90), or None while hedging is off for it."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[max(0, math.ceil(self.percentile * len(samples)) - 1)]
+
+    def _take_credit(self, key) -> bool:
+        with self._lock:
+            if self._credit >= 1:
+                self._credit -= 1
+                return True
+        self._count(key, "over_budget")
+        return False
+
+    def _timed(self, key, fn):
+        start = time.perf_counter()
+        result = fn()
+        self.record(key, time.perf_counter() - start)
+        return result
+
+    async def _atimed(self, key, coro_fn):
+        start = time.perf_counter()
+        result = await coro_fn()
+        self.record(key, time.perf_counter() - start)
+        return result
+
+    def _start(self, context, key, fn) -> Future:
+        # A thread per attempt, not a pool: a full pool would hold back the very calls it should race
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(context.run(self._timed, key, fn))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="specgen-hedge", daemon=True).start()
+        return future
+
+    def _finish(self, key, hedged: bool, won: bool):
+        if hedged:
+            self._count(key, "hedged")
+        if won:
+            self._count(key, "won")
+        span = tracing.current_span()
+        span.set(tracing.HEDGED, hedged)
+        span.set(tracing.HEDGE_WON, won)
+
+    # -------------------------
+    # Calls
+    # -------------------------
+    def call(self, fn, key, on_discard=None):
+        """
+        fn() with hedging. Both attempts run in the caller's context (spans,
+        model routing); on_discard(result) is handed the loser's result if
+        it still succeeds, e.g. to close a stream.
+        """
+        self._count(key, "calls")
+        delay = self.hedge_delay(key)
+        if delay is None:
+            return self._timed(key, fn)
+
+        self._earn_credit()
+        context = contextvars.copy_context()
+        primary = self._start(context.copy(), key, fn)
+        if wait([primary], timeout=delay).done or not self._take_credit(key):
+            result = primary.result()
+            self._finish(key, hedged=False, won=False)
+            return result
+
+        hedge = self._start(context.copy(), key, fn)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((f for f in (primary, hedge) if f in done and f.exception() is None), None)
+            if winner is not None:
+                for loser in pending:
+                    loser.add_done_callback(lambda f: _discard_loser(f, on_discard))
+                self._finish(key, hedged=True, won=winner is hedge)
+                return winner.result()
+        self._finish(key, hedged=True, won=False)
+        return primary.result()  # Both failed: raise the primary's error
+
+    async def acall(self, coro_fn, key):
+        """Async version of call(); the losing attempt is cancelled."""
+        self._count(key, "calls")
+        delay = self.hedge_delay(key)
+        if delay is None:
+            return await self._atimed(key, coro_fn)
+
+        self._earn_credit()
+        primary = asyncio.ensure_future(self._atimed(key, coro_fn))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._take_credit(key):
+                result = await primary
+                self._finish(key, hedged=False, won=False)
+                return result
+
+            hedge = asyncio.ensure_future(self._atimed(key, coro_fn))
+            tasks.append(hedge)
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in (primary, hedge) if t in done and t.exception() is None), None)
+                if winner is not None:
+                    self._finish(key, hedged=True, won=winner is hedge)
+                    return winner.result()
+            self._finish(key, hedged=True, won=False)
+            return primary.result()
+        finally:
+            # Also covers the caller being cancelled mid-wait: no attempt outlives the call
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> list:
+        """Per key: calls, hedges fired, hedges that won, hedges skipped for budget, and the current hedge delay."""
+        with self._lock:
+            counts = {key: dict(c) for key, c in self._counts.items()}
+        rows = []
+        for key, c in counts.items():
+            delay = self.hedge_delay(key)
+            rows.append(dict(
+                c,
+                key=" ".join(str(part) for part in key) if isinstance(key, tuple) else str(key),
+                hedge_rate=round(c["hedged"] / c["calls"], 3) if c["calls"] else 0.0,
+                win_rate=round(c["won"] / c["hedged"], 3) if c["hedged"] else None,
+                hedge_after_ms=round(delay * 1000, 1) if delay is not None else None,
+            ))
+        return rows
+
+
+# ----------------------------------
+# Streams
+# ----------------------------------
+def first_chunk(stream) -> tuple:
+    """(first chunk, the rest of the stream): hedging a stream races the time to first chunk."""
+    rest = iter(stream)
+    return next(rest, None), rest
+
+
+def close_stream(opened: tuple):
+    close = getattr(opened[1], "close", None)
+    if close is not None:
+        close()
+
+
+# ----------------------------------
+# Shared process-wide instance
+# ----------------------------------
+HEDGER = Hedger()
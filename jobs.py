@@ -0,0 +1,254 @@
+"""
+Background generation jobs for SpecGen AI.
+
+The Streamlit app only enqueues a job (db.enqueue_job) and polls its row for
+status and partial output; the agents run in a pool of worker processes that
+claim jobs from the SQLite queue in specgen.db. Jobs therefore survive page
+reloads, and one server can run several generations at once.
+
+Usage:
+    python jobs.py --workers 4      # run a worker pool next to the app
+
+The app starts a pool itself on first use (SPECGEN_JOB_WORKERS, default 2;
+set it to 0 when workers are run separately).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import db
+import tracing
+from prompt_builder import build_enhanced_prompt
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("SPECGEN_JOB_WORKERS", "2"))
+POLL_INTERVAL_SECONDS = 0.5
+HEARTBEAT_SECONDS = 15
+# A running job whose worker missed this many seconds of heartbeats is requeued
+STALE_AFTER_SECONDS = 4 * HEARTBEAT_SECONDS
+# Partial output is written at most this often
+PROGRESS_INTERVAL_SECONDS = 0.5
+# Expired checkpoints and trace spans are swept this often (and on start)
+SWEEP_INTERVAL_SECONDS = 3600
+
+ENGINE_CREW = "crew"
+ENGINE_STREAMING = "streaming"
+
+
+def submit(feature_goal: str, options: dict, engine: str = ENGINE_CREW, key: str = None) -> str:
+    """Queue a generation and return its job id."""
+    return db.enqueue_job({"feature_goal": feature_goal, "options": options, "engine": engine, "key": key})
+
+
+# ----------------------------------
+# Job Progress
+# ----------------------------------
+class JobProgress:
+    """Writes stage labels and throttled partial output to the job row."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._last_write = 0.0
+
+    def stage(self, label: str):
+        db.update_job(self.job_id, stage=label)
+
+    def partial(self, text: str, force: bool = False):
+        now = time.time()
+        if force or now - self._last_write >= PROGRESS_INTERVAL_SECONDS:
+            db.update_job(self.job_id, partial=text)
+            self._last_write = now
+
+
+def _heartbeat(job_id: str, done: threading.Event):
+    while not done.wait(HEARTBEAT_SECONDS):
+        db.update_job(job_id)
+
+
+# ----------------------------------
+# Pipeline Engines
+# ----------------------------------
+def _run_crew(prompt: str, progress: JobProgress) -> str:
+    from agents import stream_spec_crew
+    from spec_sections import merge_sections
+
+    labels = {"analysis": "🔎 Analyst finished", "draft": "✍️ Writer finished — draft below", "validation": "✅ Reviewer finished"}
+    progress.stage("🤖 Agents are working...")
+    sections = {}
+    raw_output = ""
+    for event in stream_spec_crew(prompt):
+        if event["type"] == "escalation":
+            sections = {}
+            progress.stage(f"🔁 Review asked for refinement — retrying on {event['model']}...")
+        elif event["type"] == "task_output":
+            task = event["task"]
+            if task.startswith("section:"):
+                # Parallel sections: preview whatever has been drafted so far, in document order
+                sections[task.split(":", 1)[1]] = event["text"]
+                progress.stage(f"✍️ {len(sections)} sections drafted")
+                progress.partial(merge_sections(sections), force=True)
+            else:
+                progress.stage(labels.get(task, "Task finished"))
+            if task == "draft":
+                progress.partial(event["text"], force=True)
+        elif event["type"] == "result":
+            raw_output = event["raw"]
+            _record_routing(event["routing"])
+    return raw_output
+
+
+def _run_streaming(prompt: str, progress: JobProgress) -> str:
+    from specgen_core import stream_specgen_pipeline
+
+    draft = ""
+    result = {}
+    for event in stream_specgen_pipeline(prompt):
+        if event["type"] == "stage":
+            progress.stage(f"⏳ {event['label']}...")
+        elif event["type"] == "escalation":
+            draft = ""  # Stage 2 is redrafted on the stronger model
+            progress.stage(f"🔁 Review asked for refinement — retrying on {event['model']}...")
+        elif event["type"] == "chunk":
+            draft += event["text"]
+            progress.partial(draft)
+        elif event["type"] == "result":
+            result = event["result"]
+    if draft:
+        progress.partial(draft, force=True)
+    if "routing" in result:
+        _record_routing(result["routing"])
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result["final_json_str"]
+
+
+def _record_routing(routing: dict):
+    """Put the run's model routing summary on the job span (it runs inside it)."""
+    span = tracing.current_span()
+    span.set("specgen.escalated", routing["escalated"])
+    span.set("specgen.routing", json.dumps(routing))
+
+
+ENGINES = {ENGINE_CREW: _run_crew, ENGINE_STREAMING: _run_streaming}
+
+
+# ----------------------------------
+# Worker
+# ----------------------------------
+def run_job(job_id: str, request: dict):
+    """Generate, validate and store one spec, recording the outcome on the job row."""
+    from models import Specification
+    from specgen_core import repair_specification
+
+    done = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job_id, done), daemon=True).start()
+    try:
+        # The job id doubles as the trace id, so the app can show this run's spans
+        with tracing.span("job", trace_id=job_id, engine=request["engine"]):
+            prompt = build_enhanced_prompt(request["feature_goal"], **request["options"])
+            raw_output = ENGINES[request["engine"]](prompt, JobProgress(job_id))
+            spec = repair_specification(raw_output, response_model=Specification)
+
+        spec_id = save_error = None
+        try:
+            spec_id = db.save_spec(
+                db.spec_title(request["feature_goal"], spec.detailed_spec_markdown),
+                request["feature_goal"],
+                spec.model_dump_json(),
+                spec.detailed_spec_markdown,
+            )
+        except Exception as e:
+            # The job result still carries the spec: the job is done, with the failed save noted on it
+            save_error = f"Not saved to history: {e}"
+            print(f"[job {job_id}] {save_error}", file=sys.stderr)
+        db.finish_job(job_id, spec.model_dump_json(), spec_id, error=save_error)
+    except Exception as e:
+        db.fail_job(job_id, str(e))
+    finally:
+        done.set()
+
+
+def _parent_alive(parent_pid) -> bool:
+    if not parent_pid:
+        return True
+    try:
+        os.kill(parent_pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def worker_loop(name: str, budget_share: float = 1.0, parent_pid: int = None):
+    """Claim and run jobs until the parent process goes away."""
+    from rate_limiter import gemini_limiter
+    from mock_llm import install_from_env
+
+    install_from_env()  # SPECGEN_MOCK_LLM=1: offline runs against the mock backend
+    # Worker processes split the Gemini quota instead of each assuming all of it
+    gemini_limiter.share(budget_share)
+    db.init_db()
+    next_sweep = 0.0
+    while _parent_alive(parent_pid):
+        if time.time() >= next_sweep:
+            db.delete_expired_checkpoints()
+            db.delete_expired_spans()
+            next_sweep = time.time() + SWEEP_INTERVAL_SECONDS
+        claimed = db.claim_job(name, STALE_AFTER_SECONDS)
+        if claimed is None:
+            time.sleep(POLL_INTERVAL_SECONDS)
+            continue
+        run_job(*claimed)
+
+
+def run_pool(workers: int = JOB_WORKERS, parent_pid: int = None):
+    """Run `workers` worker processes and wait for them."""
+    context = multiprocessing.get_context("spawn")
+    host = socket.gethostname()
+    processes = [
+        context.Process(
+            target=worker_loop,
+            args=(f"{host}:{os.getpid()}:{i}", 1.0 / workers, parent_pid or os.getpid()),
+            daemon=True,
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def start_pool(workers: int = JOB_WORKERS):
+    """Launch a worker pool in a separate process tied to this one (used by the Streamlit app)."""
+    if workers <= 0:
+        return None
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--workers", str(workers), "--parent-pid", str(os.getpid())],
+        cwd=os.getcwd(),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run SpecGen background generation workers.")
+    parser.add_argument("-w", "--workers", type=int, default=max(JOB_WORKERS, 1), help="Number of worker processes")
+    parser.add_argument("--parent-pid", type=int, default=None, help="Exit when this process exits")
+    args = parser.parse_args(argv)
+
+    db.init_db()
+    run_pool(args.workers, args.parent_pid)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
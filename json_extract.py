@@ -0,0 +1,186 @@
+import re
+import json
+
+from models import Specification
+
+# --------------------------------------------------
+# JSON Extraction from LLM Output
+# --------------------------------------------------
+# Agents wrap their JSON in prose and ```json fences, and the Markdown inside
+# it is full of braces and code fences of its own. Instead of stripping
+# fences and grabbing the widest {...} with a greedy regex, the extractor
+# decodes the JSON value starting at each candidate bracket (C-speed
+# raw_decode, string-aware, no copies of the surrounding text) and keeps
+# the largest; a bracket in the prose before it cannot win. Only when
+# decoding fails does a second walk repair common defects on the way.
+# Output truncated mid-value (e.g. cut off by max_tokens) is never closed
+# up and accepted: it is an error, so the caller's repair loop runs. An
+# unclosed bracket counts as truncation only when no value parsed or it
+# opens JSON-like after the value that did; stray brackets in prose don't.
+
+# Extra candidate starts tried when an earlier bracket turns out to be prose
+MAX_CANDIDATES = 50
+
+_FENCE = re.compile(r"```(?:json|JSON)\s*")
+_STRUCTURAL = re.compile(r'[{}\[\]",“”]')
+# Whole double-quoted string, escapes included (unrolled so it runs in C)
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_IN_SMART_STRING = re.compile(r'["\\“”]')
+_WHITESPACE = re.compile(r"\s*")
+_DECODER = json.JSONDecoder(strict=False)
+_CLOSERS = {"{": "}", "[": "]"}
+# What may follow an opening bracket in JSON
+_OPENS_JSON = {
+    "{": re.compile(r'\s*["“]'),
+    "[": re.compile(r'\s*(?:["“{\[\-\d]|true|false|null)'),
+}
+
+
+class JSONExtractionError(json.JSONDecodeError):
+    """No parseable JSON value was found in the text."""
+
+
+def _scan(text: str, start: int):
+    """
+    Walk one JSON value starting at text[start] ('{' or '[').
+
+    Returns (repaired JSON text, end offset), (None, len(text)) when the text
+    ends inside the value, or None when the brackets do not match. Repairs
+    applied on the way: trailing commas are dropped and smart-quoted strings
+    become regular strings.
+    """
+    pieces = []     # repaired output; only grows when a repair is needed
+    last = start    # text[last:pos] is still to be copied into pieces
+    stack = []
+    pos = start
+    n = len(text)
+
+    while True:
+        match = _STRUCTURAL.search(text, pos)
+        if match is None:
+            break
+        ch, i = match.group(), match.start()
+
+        if ch in "{[":
+            stack.append(_CLOSERS[ch])
+            pos = i + 1
+        elif ch in "}]":
+            if not stack or stack.pop() != ch:
+                return None
+            pos = i + 1
+            if not stack:
+                pieces.append(text[last:pos])
+                return "".join(pieces), pos
+        elif ch == ",":
+            pos = i + 1
+            after = _WHITESPACE.match(text, pos).end()
+            if after < n and text[after] in "}]":
+                pieces.append(text[last:i])
+                last = pos
+        elif ch == '"':
+            # String: jump straight past its closing quote
+            string = _STRING.match(text, i)
+            if string is None:
+                return None, n  # Truncated inside a string
+            pos = string.end()
+        else:
+            # Smart-quoted string: rewrite its delimiters as plain quotes
+            pieces.append(text[last:i] + '"')
+            last = pos = i + 1
+            while True:
+                inner = _IN_SMART_STRING.search(text, pos)
+                if inner is None:
+                    return None, n
+                c, k = inner.group(), inner.start()
+                if c == "\\":
+                    pos = k + 2
+                elif c == "”":
+                    pieces.append(text[last:k] + '"')
+                    last = pos = k + 1
+                    break
+                else:
+                    # A plain or opening quote inside a smart-quoted string is content
+                    pieces.append(text[last:k] + '\\"')
+                    last = pos = k + 1
+
+    # Ran out of text with brackets still open
+    return None, n
+
+
+def _candidates(text: str, start_chars: str):
+    """
+    Offsets of possible JSON starts: the very start when the output is bare
+    JSON, then inside a ```json fence when there is one, then every bracket.
+    """
+    first = _WHITESPACE.match(text).end()
+    if text[first:first + 1] and text[first] in start_chars:
+        yield first
+    fence = _FENCE.search(text)
+    origin = fence.end() if fence else 0
+    pattern = re.compile("[" + re.escape(start_chars) + "]")
+    for match in pattern.finditer(text, origin):
+        if match.start() != first:
+            yield match.start()
+    if origin:
+        for match in pattern.finditer(text, 0, fence.start()):
+            if match.start() != first:
+                yield match.start()
+
+
+def _extract(text: str, start_chars: str):
+    """(JSON text, value) of the largest balanced JSON value in text."""
+    best = None         # (start, end, JSON text, value)
+    truncated = None    # start of a value the text ends inside
+    error = None
+    for attempt, start in enumerate(_candidates(text, start_chars)):
+        if attempt > MAX_CANDIDATES:
+            break
+        if best and best[0] <= start < best[1]:
+            continue  # Nested inside the value already found
+        try:
+            data, end = _DECODER.raw_decode(text, start)
+        except json.JSONDecodeError:
+            # Not valid as-is: repair and retry this candidate
+            scanned = _scan(text, start)
+            if scanned is None:
+                continue
+            candidate, end = scanned
+            if candidate is None:
+                if _OPENS_JSON[text[start]].match(text, start + 1):
+                    truncated = start if truncated is None else max(truncated, start)
+                continue
+            try:
+                data = json.loads(candidate, strict=False)
+            except json.JSONDecodeError as e:
+                error = error or e
+                continue
+        else:
+            candidate = text[start:end]
+        if best is None or end - start > best[1] - best[0]:
+            best = (start, end, candidate, data)
+
+    if truncated is not None and (best is None or truncated >= best[1]):
+        # The output was cut off mid-value: nothing complete, or a later value is unfinished
+        raise JSONExtractionError("JSON output is truncated", text, len(text))
+    if best is not None:
+        return best[2], best[3]
+    message = f"No valid JSON found in agent output ({error.msg})" if error else "No valid JSON found in agent output"
+    raise JSONExtractionError(message, text, error.pos if error else 0)
+
+
+# -------------------------
+# Public helpers
+# -------------------------
+def extract_json(text: str, start_chars: str = "{[") -> str:
+    """Return the largest parseable (repaired) JSON object or array in text, as a string."""
+    return _extract(text, start_chars)[0]
+
+
+def parse_json(text: str, start_chars: str = "{["):
+    """Like extract_json, but return the parsed value."""
+    return _extract(text, start_chars)[1]
+
+
+def parse_specification(text: str, model=Specification):
+    """Extract the JSON object from agent output and validate it into a Specification model."""
+    return model.model_validate(parse_json(text, "{"))
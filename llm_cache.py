@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from db import ConnectionPool
+
+# ----------------------------------
+# Cache Configuration
+# ----------------------------------
+# The cache lives next to specgen.db so a rerun of the same goal is served
+# from local disk instead of three Gemini round trips.
+CACHE_PATH = os.getenv("SPECGEN_CACHE_PATH", os.path.join(os.getcwd(), "specgen_cache.db"))
+CACHE_TTL_SECONDS = int(os.getenv("SPECGEN_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("SPECGEN_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.getenv("SPECGEN_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_ENABLED = os.getenv("SPECGEN_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+
+
+# ----------------------------------
+# Cache Key
+# ----------------------------------
+def make_cache_key(model: str, messages: list, temperature: float, response_schema=None) -> str:
+    """
+    Content-addressed key: SHA-256 over the canonical JSON of everything
+    that can change the model's answer.
+    """
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "response_schema": response_schema,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ----------------------------------
+# Response Cache (SQLite, TTL + LRU)
+# ----------------------------------
+class ResponseCache:
+    """
+    Persistent LLM response cache with TTL expiry, size-bounded LRU
+    eviction and per-process hit/miss counters.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, ttl_seconds: int = CACHE_TTL_SECONDS,
+                 max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._pool = ConnectionPool(path, on_first_connect=self._create_schema)
+
+    @staticmethod
+    def _create_schema(conn):
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                size INTEGER,
+                created_at REAL,
+                last_access REAL
+            );
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+        conn.commit()
+
+    def get(self, key: str):
+        """Return the cached response text, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock, self._pool.connection() as conn:
+            row = conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            response, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+
+            conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return response
+
+    def set(self, key: str, model: str, response: str):
+        """Store a response and evict least-recently-used entries past the size bounds."""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock, self._pool.connection() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_cache (key, model, response, size, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, model, response, size, now, now),
+            )
+            self._evict(conn, now)
+
+    def delete(self, key: str):
+        """Drop one entry (a cached response its caller has rejected)."""
+        with self._lock, self._pool.connection() as conn:
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+
+    def _evict(self, conn, now: float):
+        if self.ttl_seconds:
+            cur = conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            self.evictions += max(cur.rowcount, 0)
+
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        # Walk entries oldest-access first until both bounds hold again
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+
+        conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def clear(self):
+        with self._lock, self._pool.connection() as conn:
+            conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> dict:
+        with self._lock, self._pool.connection() as conn:
+            count, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": count,
+            "bytes": total,
+        }
+
+
+# ----------------------------------
+# Shared process-wide instance
+# ----------------------------------
+response_cache = ResponseCache()
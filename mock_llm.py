@@ -0,0 +1,338 @@
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+
+# --------------------------------------------------
+# Deterministic Mock LLM Backend
+# --------------------------------------------------
+# A stand-in for litellm.completion / acompletion that needs no network or
+# quota: responses are generated from the prompt (stories, SRS Markdown,
+# section bodies or Specification JSON), latency follows a configurable
+# distribution, streamed tokens arrive at a fixed rate, and errors / 429s
+# can be injected. Every random draw is seeded by (seed, prompt, n-th call
+# with that prompt), so a run is reproducible regardless of thread timing.
+#
+# install() plugs it into specgen_core, specgen_async and litellm itself,
+# which is what the CrewAI LLM in agents.py calls. With SPECGEN_MOCK_LLM=1
+# the job workers install it on start-up, so the whole app runs offline
+# (any non-empty GEMINI_API_KEY will do).
+
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "lognormal")
+MOCK_MODEL_ID = "mock/specgen"
+
+
+class MockRateLimitError(Exception):
+    """Looks like a provider 429 to rate_limiter.is_rate_limit_error()."""
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"429 RESOURCE_EXHAUSTED (mock): retry after {retry_after:g}s")
+        self.headers = {"retry-after": str(retry_after)}
+
+
+class MockTimeoutError(Exception):
+    """The call outlasted its `timeout` (LiteLLM raises a Timeout with status 408)."""
+    status_code = 408
+
+
+class MockLLMError(Exception):
+    """Injected non-retryable provider failure."""
+    status_code = 500
+
+
+class MockResponse(dict):
+    """OpenAI-style response usable both as a dict and through attributes, like LiteLLM's."""
+
+    @property
+    def choices(self):
+        return self["choices"]
+
+    @property
+    def usage(self):
+        return self.get("usage")  # Only the last stream chunk carries usage
+
+
+# ----------------------------------
+# Canned Content
+# ----------------------------------
+def _stories(feature: str) -> list:
+    roles = ["user", "admin", "team lead", "new user", "support agent", "auditor", "mobile user", "API client"]
+    return [f"As a {role}, I want {feature.lower()} to fit my workflow so that I save time" for role in roles]
+
+
+def _functional(count: int) -> str:
+    return "\n\n".join(
+        f"**FR-{i:03d}**: The system shall support capability {i} of the feature.\n"
+        f"- GIVEN a signed-in user WHEN they use capability {i} THEN the result is saved within 500 ms."
+        for i in range(1, count + 1)
+    )
+
+
+def _non_functional(count: int) -> str:
+    areas = ["Performance", "Security", "Scalability", "Accessibility", "Availability"]
+    return "\n".join(
+        f"- **NFR-{i:03d}** ({areas[(i - 1) % len(areas)]}): p95 latency stays under {100 * i} ms at 1,000 RPS."
+        for i in range(1, count + 1)
+    )
+
+
+DIAGRAM = "```mermaid\nflowchart TD\n    A[User] --> B{Valid input?}\n    B -->|yes| C[Save]\n    B -->|no| D[Show error]\n```"
+
+
+def _section_body(key: str, size: int) -> str:
+    if key == "functional":
+        return _functional(max(3, size // 180))
+    if key == "non_functional":
+        return _non_functional(max(3, size // 100))
+    if key == "diagram":
+        return DIAGRAM
+    return "The feature is described here in enough detail for planning. " * max(1, size // 60)
+
+
+def _spec_markdown(size: int) -> str:
+    return "\n\n".join([
+        "# Software Requirements Specification",
+        "## 1. Introduction\n\n" + _section_body("introduction", size // 8),
+        "## 2. Functional Requirements\n\n" + _section_body("functional", size // 2),
+        "## 3. Non-Functional Requirements\n\n" + _section_body("non_functional", size // 5),
+        "## 4. Feature Flow Diagram\n\n" + DIAGRAM,
+        "## 5. Risks & Mitigation\n\n" + _section_body("risks", size // 8),
+    ])
+
+
+def _section_key(prompt: str):
+    from spec_sections import SPEC_SECTIONS
+    for key, heading, _ in SPEC_SECTIONS:
+        if f"ONLY the '{heading}'" in prompt:
+            return key
+    return None
+
+
+def mock_content(prompt: str, structured: bool = False, output_chars: int = 12000) -> str:
+    """The text a well-behaved model would return for one of SpecGen's prompts."""
+    if "JSON list of strings" in prompt:
+        return json.dumps(_stories("the feature"))
+    if "SectionAudit" in prompt:
+        # Per-section audit: the functional requirements get tightened, the rest pass
+        corrected = _section_body("functional", 600) if "## 2. Functional Requirements" in prompt else ""
+        return json.dumps({
+            "validation_status": "Validated",
+            "validation_critique": "Acceptance criteria tightened (mock audit)." if corrected else "Section is fine (mock audit).",
+            "replacement": corrected,
+        })
+    if "SpecReview" in prompt:
+        # Patch-mode review: verdict plus one corrected section
+        return json.dumps({
+            "high_level_stories": _stories("the feature")[:5],
+            "validation_status": "Validated",
+            "validation_critique": "Tightened the non-functional targets (mock review).",
+            "patches": [{"section_id": "S3", "replacement": _section_body("non_functional", 600)}],
+        })
+    if structured or "JSON object" in prompt:
+        return json.dumps({
+            "feature_goal": "the feature",
+            "high_level_stories": _stories("the feature")[:5],
+            "detailed_spec_markdown": _spec_markdown(output_chars),
+            "validation_status": "Validated",
+            "validation_critique": "All requirements are testable (mock review).",
+        })
+    key = _section_key(prompt)
+    if key:
+        return _section_body(key, output_chars // 7)
+    return _spec_markdown(output_chars)
+
+
+# ----------------------------------
+# Mock Backend
+# ----------------------------------
+class MockLLM:
+    """
+    Fake completion backend.
+
+    latency_ms / latency: time to first token, drawn from a "constant",
+    "uniform" (0.5x-1.5x) or "lognormal" (median latency_ms, sigma jitter)
+    distribution. tokens_per_second paces the output (0 = instant).
+    error_rate / rate_limit_rate are per-call probabilities of a 500 or a
+    429 carrying retry_after. A call whose first token would come after
+    its `timeout` kwarg fails with MockTimeoutError once the timeout passes.
+    """
+
+    def __init__(self, latency_ms: float = 800.0, latency: str = "lognormal", jitter: float = 0.35,
+                 tokens_per_second: float = 250.0, output_chars: int = 12000,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 1.0,
+                 seed: int = 0, chunk_chars: int = 64):
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency must be one of {LATENCY_DISTRIBUTIONS}")
+        self.latency_ms = latency_ms
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.output_chars = output_chars
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.chunk_chars = chunk_chars
+        self.stats = {"calls": 0, "errors": 0, "rate_limited": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    # -------------------------
+    # Deterministic draws
+    # -------------------------
+    def _rng(self, prompt: str) -> random.Random:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            n = self._seen.get(digest, 0)
+            self._seen[digest] = n + 1
+            self.stats["calls"] += 1
+        return random.Random(f"{self.seed}:{digest}:{n}")
+
+    def _first_token_delay(self, rng: random.Random) -> float:
+        base = self.latency_ms / 1000.0
+        if self.latency == "uniform":
+            return rng.uniform(0.5 * base, 1.5 * base)
+        if self.latency == "lognormal" and self.jitter > 0:
+            return rng.lognormvariate(math.log(base), self.jitter) if base > 0 else 0.0
+        return base
+
+    def _generation_time(self, text: str) -> float:
+        return len(text) / 4 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _plan(self, messages, kwargs):
+        """Draw the outcome of one call: (first-token delay, text, usage) or an exception."""
+        prompt = "\n".join(str(m.get("content", "")) if isinstance(m, dict) else str(m) for m in messages)
+        rng = self._rng(prompt)
+        delay = self._first_token_delay(rng)
+        roll = rng.random()
+        if roll < self.rate_limit_rate:
+            with self._lock:
+                self.stats["rate_limited"] += 1
+            return delay, MockRateLimitError(self.retry_after), None
+        if roll < self.rate_limit_rate + self.error_rate:
+            with self._lock:
+                self.stats["errors"] += 1
+            return delay, MockLLMError("500 INTERNAL (mock): injected failure"), None
+
+        text = mock_content(prompt, structured=kwargs.get("response_model") is not None, output_chars=self.output_chars)
+        if "Final Answer:" in prompt:
+            # CrewAI agents parse a ReAct-style reply
+            text = f"Thought: I now can give a great answer\nFinal Answer: {text}"
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        with self._lock:
+            self.stats["prompt_tokens"] += usage["prompt_tokens"]
+            self.stats["completion_tokens"] += usage["completion_tokens"]
+        return delay, text, usage
+
+    @staticmethod
+    def _response(text: str, usage: dict) -> MockResponse:
+        return MockResponse(
+            model=MOCK_MODEL_ID,
+            choices=[{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            usage=usage,
+        )
+
+    def _chunks(self, text: str, usage: dict):
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+        for i, piece in enumerate(pieces):
+            chunk = MockResponse(choices=[{"index": 0, "delta": {"content": piece}}])
+            if i == len(pieces) - 1:
+                chunk["usage"] = usage
+            yield chunk
+
+    # -------------------------
+    # LiteLLM-compatible entry points
+    # -------------------------
+    @staticmethod
+    def _timed_out(delay: float, kwargs):
+        timeout = kwargs.get("timeout")
+        if timeout and delay > timeout:
+            return MockTimeoutError(f"Request timed out after {timeout:g}s (mock)")
+        return None
+
+    def completion(self, model=None, messages=(), stream=False, **kwargs):
+        delay, outcome, usage = self._plan(messages, kwargs)
+        timed_out = self._timed_out(delay, kwargs)
+        if timed_out:
+            time.sleep(kwargs["timeout"])
+            raise timed_out
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        if not stream:
+            time.sleep(self._generation_time(outcome))
+            return self._response(outcome, usage)
+
+        def generate():
+            per_chunk = self.chunk_chars / 4 / self.tokens_per_second if self.tokens_per_second else 0.0
+            for chunk in self._chunks(outcome, usage):
+                yield chunk
+                time.sleep(per_chunk)
+        return generate()
+
+    async def acompletion(self, model=None, messages=(), stream=False, **kwargs):
+        delay, outcome, usage = self._plan(messages, kwargs)
+        timed_out = self._timed_out(delay, kwargs)
+        if timed_out:
+            await asyncio.sleep(kwargs["timeout"])
+            raise timed_out
+        await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        await asyncio.sleep(self._generation_time(outcome))
+        return self._response(outcome, usage)
+
+
+# ----------------------------------
+# Plugging it in
+# ----------------------------------
+_installed = {}
+
+
+def install(backend: MockLLM = None) -> MockLLM:
+    """
+    Route every LLM call in this process to backend (a default MockLLM if
+    omitted): specgen_core, specgen_async and litellm (used by CrewAI).
+    """
+    import specgen_core
+    import specgen_async
+
+    backend = backend or MockLLM()
+    targets = [(specgen_core, "completion", backend.completion), (specgen_async, "acompletion", backend.acompletion)]
+    try:
+        import litellm
+        targets += [(litellm, "completion", backend.completion), (litellm, "acompletion", backend.acompletion)]
+    except ImportError:
+        pass
+
+    for module, name, fn in targets:
+        _installed.setdefault((module, name), getattr(module, name))
+        setattr(module, name, fn)
+    return backend
+
+
+def uninstall():
+    """Restore the real backends."""
+    for (module, name), original in _installed.items():
+        setattr(module, name, original)
+    _installed.clear()
+
+
+def install_from_env():
+    """Install a mock configured by SPECGEN_MOCK_* variables when SPECGEN_MOCK_LLM is set."""
+    if os.getenv("SPECGEN_MOCK_LLM", "").lower() not in ("1", "true", "yes"):
+        return None
+    return install(MockLLM(
+        latency_ms=float(os.getenv("SPECGEN_MOCK_LATENCY_MS", "800")),
+        latency=os.getenv("SPECGEN_MOCK_LATENCY", "lognormal"),
+        tokens_per_second=float(os.getenv("SPECGEN_MOCK_TOKENS_PER_SECOND", "250")),
+        error_rate=float(os.getenv("SPECGEN_MOCK_ERROR_RATE", "0")),
+        rate_limit_rate=float(os.getenv("SPECGEN_MOCK_429_RATE", "0")),
+        seed=int(os.getenv("SPECGEN_MOCK_SEED", "0")),
+    ))
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import tracing
+from spec_patch import REVIEW_FAILED
+
+# --------------------------------------------------
+# Per-stage Model Routing
+# --------------------------------------------------
+# Every LLM call used to go to gemini-2.5-flash. The router picks a model
+# per pipeline stage (stage_1, stage_2 incl. its sections, stage_3) and per
+# crew agent (analyst, writer, reviewer), so decomposition can run on a
+# lighter model while drafting stays on a stronger one. When validation
+# comes back as 'Needs Refinement' (or 'Needs Revision'), the run is
+# retried once with the escalation model on the escalated routes. A review
+# that failed ('Review Failed': timeout, 429, unreadable output) is an
+# infrastructure problem, not a verdict, and never escalates.
+#
+# Configuration, later sources winning:
+#   1. SPECGEN_MODEL_ROUTES=routes.json, e.g.
+#        {"default": "gemini/gemini-2.5-flash",
+#         "routes": {"stage_1": "gemini/gemini-2.5-flash-lite", "analyst": "gemini/gemini-2.5-flash-lite"},
+#         "escalation_model": "gemini/gemini-2.5-pro",
+#         "escalate": ["stage_2", "stage_3", "writer", "reviewer"],
+#         "escalate_on": ["Needs Refinement", "Needs Revision"]}
+#   2. SPECGEN_MODEL_DEFAULT, SPECGEN_MODEL_<ROUTE> (e.g. SPECGEN_MODEL_STAGE_1,
+#      SPECGEN_MODEL_ANALYST), SPECGEN_MODEL_ESCALATION (empty disables
+#      escalation) and SPECGEN_ESCALATE_ON (comma-separated statuses).
+# Model ids are LiteLLM ids ("provider/model").
+
+DEFAULT_MODEL = "gemini/gemini-2.5-flash"
+DEFAULT_ESCALATION_MODEL = "gemini/gemini-2.5-pro"
+ROUTES = ("stage_1", "stage_2", "stage_3", "analyst", "writer", "reviewer")
+DEFAULT_ESCALATED_ROUTES = ("stage_2", "stage_3", "writer", "reviewer")
+DEFAULT_ESCALATE_ON = ("Needs Refinement", "Needs Revision")
+ROUTES_PATH = os.getenv("SPECGEN_MODEL_ROUTES", "")
+
+
+class ModelRouter:
+    """Maps a route (pipeline stage or crew agent) to a model id."""
+
+    def __init__(self, routes: dict = None, default: str = DEFAULT_MODEL,
+                 escalation_model: str = DEFAULT_ESCALATION_MODEL,
+                 escalate: tuple = DEFAULT_ESCALATED_ROUTES, escalate_on: tuple = DEFAULT_ESCALATE_ON):
+        unknown = set(routes or {}) - set(ROUTES)
+        if unknown:
+            raise ValueError(f"Unknown model routes: {', '.join(sorted(unknown))} (expected {', '.join(ROUTES)})")
+        self.routes = dict(routes or {})
+        self.default = default
+        self.escalation_model = escalation_model or None
+        self.escalate = tuple(escalate)
+        self.escalate_on = tuple(escalate_on)
+
+    def model_for(self, route: str, escalated: bool = False) -> str:
+        if escalated and self.escalation_model and route in self.escalate:
+            return self.escalation_model
+        return self.routes.get(route) or self.default
+
+    def should_escalate(self, validation_status: str) -> bool:
+        status = (validation_status or "").strip().lower()
+        wanted = {s.strip().lower() for s in self.escalate_on} - {REVIEW_FAILED.lower()}
+        return bool(self.escalation_model) and status in wanted
+
+    def describe(self) -> dict:
+        return {
+            "routes": {route: self.model_for(route) for route in ROUTES},
+            "escalation_model": self.escalation_model,
+            "escalate": list(self.escalate),
+            "escalate_on": list(self.escalate_on),
+        }
+
+
+def load_router(path: str = ROUTES_PATH, environ=os.environ) -> ModelRouter:
+    """Build the router from the routes file (if any) and SPECGEN_MODEL_* variables."""
+    config = {}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+
+    routes = dict(config.get("routes", {}))
+    for route in ROUTES:
+        if environ.get(f"SPECGEN_MODEL_{route.upper()}"):
+            routes[route] = environ[f"SPECGEN_MODEL_{route.upper()}"]
+    escalate_on = config.get("escalate_on", DEFAULT_ESCALATE_ON)
+    if environ.get("SPECGEN_ESCALATE_ON"):
+        escalate_on = [status for status in environ["SPECGEN_ESCALATE_ON"].split(",") if status.strip()]
+
+    return ModelRouter(
+        routes=routes,
+        default=environ.get("SPECGEN_MODEL_DEFAULT") or config.get("default") or DEFAULT_MODEL,
+        escalation_model=environ.get("SPECGEN_MODEL_ESCALATION", config.get("escalation_model", DEFAULT_ESCALATION_MODEL)),
+        escalate=config.get("escalate", DEFAULT_ESCALATED_ROUTES),
+        escalate_on=escalate_on,
+    )
+
+
+ROUTER = load_router()
+
+
+# ----------------------------------
+# Routing Metadata of One Run
+# ----------------------------------
+_active = ContextVar("specgen_route", default=None)
+_lock = threading.Lock()
+
+
+class RunRouting:
+    """
+    The routing decisions of one run: the model of every stage attempt with
+    the wall time, tokens and estimated cost it took, and whether (and why)
+    the run was escalated. summary() goes into the run's result.
+    """
+
+    def __init__(self, router: ModelRouter = None):
+        self.router = router or ROUTER
+        self.escalated = False
+        self.reason = None
+        self.attempts = []
+
+    def model_for(self, route: str) -> str:
+        return self.router.model_for(route, self.escalated)
+
+    @contextmanager
+    def stage(self, name: str, model=None, overlapped: bool = False):
+        """
+        Time one stage attempt. LLM calls made inside it (also from copied
+        contexts, e.g. section threads) use and are charged to its model.
+        overlapped attempts run alongside another stage: their cost counts,
+        their time is not added to the run's latency.
+        """
+        entry = {"stage": name, "model": model or self.model_for(name), "escalated": self.escalated,
+                 "overlapped": overlapped, "latency_ms": 0.0, "calls": 0, "input_tokens": 0, "output_tokens": 0,
+                 "cost_usd": 0.0}
+        self.attempts.append(entry)
+        token = _active.set(entry)
+        start = time.perf_counter()
+        try:
+            yield entry["model"]
+        finally:
+            entry["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            try:
+                _active.reset(token)
+            except ValueError:
+                # A generator holding the stage was resumed from another context
+                _active.set(None)
+
+    def escalate(self, validation_status: str) -> bool:
+        """Switch to the escalation model if the status calls for it (once per run)."""
+        if self.escalated or not self.router.should_escalate(validation_status):
+            return False
+        self.escalated = True
+        self.reason = f"validation_status '{validation_status}'"
+        return True
+
+    def summary(self) -> dict:
+        def total(key, escalated=None):
+            return sum(a[key] for a in self.attempts if escalated is None or a["escalated"] == escalated)
+
+        def latency(escalated=None):
+            return round(sum(a["latency_ms"] for a in self.attempts if not a["overlapped"]
+                             and (escalated is None or a["escalated"] == escalated)), 1)
+
+        return {
+            "escalated": self.escalated,
+            "reason": self.reason,
+            "attempts": [dict(a, cost_usd=round(a["cost_usd"], 6)) for a in self.attempts],
+            "latency_ms": latency(),
+            "cost_usd": round(total("cost_usd"), 6),
+            "escalation_latency_ms": latency(True),
+            "escalation_cost_usd": round(total("cost_usd", True), 6),
+        }
+
+
+def current_model() -> str:
+    """Model of the stage being run in this context (the default model outside any stage)."""
+    entry = _active.get()
+    # A crew attempt records its per-agent models as a dict; calls made there use the default
+    return entry["model"] if entry and isinstance(entry["model"], str) else ROUTER.default
+
+
+def current_route():
+    """Route of the stage being run in this context ('stage_3' for its section audits), None outside any stage."""
+    entry = _active.get()
+    return entry["stage"].split(".")[0] if entry else None
+
+
+def record_call(span):
+    """Charge a finished LLM span's tokens and cost to the active stage attempt."""
+    entry = _active.get()
+    attributes = getattr(span, "attributes", None)
+    if entry is None or attributes is None:
+        return
+    with _lock:
+        entry["calls"] += 1
+        entry["input_tokens"] += attributes.get(tracing.INPUT_TOKENS, 0)
+        entry["output_tokens"] += attributes.get(tracing.OUTPUT_TOKENS, 0)
+        entry["cost_usd"] += attributes.get(tracing.COST_USD, 0.0)
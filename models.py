@@ -34,4 +34,56 @@ class Specification(BaseModel):
                 "validation_status": "Validated",
                 "validation_critique": "All requirements are clear, testable, and follow GIVEN/WHEN/THEN format."
             }
-        }
\ No newline at end of file
+        }
+
+
+class SectionPatch(BaseModel):
+    """
+    Replacement for one section of the draft.
+    """
+    section_id: str = Field(
+        description="Id of the section to replace, e.g. 'S3' for the third '## ' section; 'new' appends a section"
+    )
+    replacement: str = Field(
+        description="Complete corrected Markdown body of the section (a '## ' heading line is only needed for 'new')"
+    )
+
+
+class SpecReview(BaseModel):
+    """
+    Reviewer output in patch mode: verdict plus patches, never the whole document.
+    """
+    high_level_stories: List[str] = Field(
+        default_factory=list,
+        description="List of user stories decomposed from the feature goal"
+    )
+    validation_status: str = Field(
+        default="Validated",
+        description="Status of validation: 'Validated' or 'Needs Revision'"
+    )
+    validation_critique: str = Field(
+        default="All requirements meet quality standards.",
+        description="Quality feedback from validation agent"
+    )
+    patches: List[SectionPatch] = Field(
+        default_factory=list,
+        description="Only the sections that needed fixing; an empty list when the draft is fine as is"
+    )
+
+
+class SectionAudit(BaseModel):
+    """
+    Verdict on a single section, from the pipelined (per-section) Stage 3 audit.
+    """
+    validation_status: str = Field(
+        default="Validated",
+        description="Status of this section: 'Validated' or 'Needs Revision'"
+    )
+    validation_critique: str = Field(
+        default="",
+        description="Short quality feedback on this section"
+    )
+    replacement: str = Field(
+        default="",
+        description="Complete corrected Markdown body of the section (no heading), or an empty string if it is fine"
+    )
@@ -0,0 +1,71 @@
+import json
+import hashlib
+
+# --------------------------------------------------
+# Prompt Builder for SpecGen AI
+# --------------------------------------------------
+# Turns a feature goal plus the UI options (industry, team size and the six
+# "include" toggles) into the enhanced prompt sent to the agents. Shared by
+# the Streamlit app and the batch CLI so both produce identical prompts.
+
+INDUSTRIES = ["General", "Healthcare", "Finance", "E-commerce", "Education", "SaaS", "Government", "Entertainment"]
+TEAM_SIZES = ["Solo", "2-5", "6-20", "21-50", "51+"]
+
+# Default values mirror the checkboxes in the Advanced Options panel
+DEFAULT_OPTIONS = {
+    "industry": "General",
+    "team_size": "Solo",
+    "include_security": True,
+    "include_accessibility": False,
+    "include_testing": True,
+    "include_deployment": False,
+    "include_cost": True,
+    "include_api": False,
+}
+
+
+def request_key(feature_goal: str, options: dict) -> str:
+    """Stable id for a goal + options pair (whitespace and case in the goal are ignored)."""
+    payload = json.dumps({"goal": " ".join(feature_goal.split()).lower(), "options": options}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def build_enhanced_prompt(
+    feature_goal: str,
+    industry: str = "General",
+    team_size: str = "Solo",
+    include_security: bool = True,
+    include_accessibility: bool = False,
+    include_testing: bool = True,
+    include_deployment: bool = False,
+    include_cost: bool = True,
+    include_api: bool = False,
+) -> str:
+    """Build the enhanced prompt for a feature goal and its options."""
+    prompt = feature_goal.strip()
+
+    if industry != "General":
+        prompt += f"\n\nIndustry: {industry}"
+
+    if team_size != "Solo":
+        prompt += f"\nTeam Size: {team_size}"
+
+    if include_security:
+        prompt += "\n\nInclude security requirements (authentication, authorization, encryption, data protection)."
+
+    if include_accessibility:
+        prompt += "\n\nInclude WCAG 2.1 Level AA accessibility requirements."
+
+    if include_testing:
+        prompt += "\n\nInclude comprehensive testing strategy and test cases."
+
+    if include_deployment:
+        prompt += "\n\nInclude deployment, infrastructure, and scalability considerations."
+
+    if include_cost:
+        prompt += "\n\nInclude cost estimation and resource requirements."
+
+    if include_api:
+        prompt += "\n\nInclude RESTful API endpoint specifications."
+
+    return prompt
@@ -0,0 +1,208 @@
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+
+import tracing
+
+# --------------------------------------------------
+# Process-wide Gemini Rate Limiter
+# --------------------------------------------------
+# Every Gemini caller (specgen_core, specgen_async and the CrewAI LLM in
+# agents.py) reserves capacity here before sending a request. Callers queue
+# for capacity instead of failing, and a 429 pauses everyone until the
+# provider's Retry-After has passed.
+
+GEMINI_RPM = float(os.getenv("SPECGEN_RPM", "10"))
+GEMINI_TPM = float(os.getenv("SPECGEN_TPM", "250000"))
+MAX_RETRIES = int(os.getenv("SPECGEN_MAX_RETRIES", "6"))
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 90.0
+
+# Output tokens reserved per call before the real usage is known
+DEFAULT_COMPLETION_TOKENS = 4000
+
+
+# -------------------------
+# Token Bucket
+# -------------------------
+class TokenBucket:
+    """
+    Token bucket that allows debt: a reservation always succeeds and returns
+    how long the caller must wait before using it. Later reservations queue
+    behind earlier ones, so waiting callers are served in arrival order.
+    """
+
+    def __init__(self, capacity: float, per_second: float):
+        self.capacity = capacity
+        self.per_second = per_second
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.per_second)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        self._refill(now)
+        self.level -= amount
+        if self.level >= 0:
+            return 0.0
+        return -self.level / self.per_second
+
+    def adjust(self, amount: float, now: float):
+        """Give back (positive) or take extra (negative) capacity after the fact."""
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+
+# -------------------------
+# Rate-limit error helpers
+# -------------------------
+def is_rate_limit_error(error: Exception) -> bool:
+    if getattr(error, "status_code", None) == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "rate limit" in message or "resource_exhausted" in message
+
+
+def retry_after_seconds(error: Exception):
+    """Server-suggested delay from a Retry-After header or Gemini's retryDelay, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(error, "headers", None) or getattr(response, "headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value is not None:
+            return float(value)
+    except (AttributeError, TypeError, ValueError):
+        pass
+
+    match = re.search(r'retry(?:Delay|[ _-]after| in)["\':\s]*([\d.]+)\s*s', str(error), re.IGNORECASE)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def estimate_tokens(messages, completion_tokens: int = DEFAULT_COMPLETION_TOKENS) -> int:
+    """Rough token estimate (~4 characters per token) for the prompt plus the expected completion."""
+    if isinstance(messages, str):
+        chars = len(messages)
+    else:
+        chars = sum(len(str(m.get("content", ""))) if isinstance(m, dict) else len(str(m)) for m in messages)
+    return chars // 4 + completion_tokens
+
+
+def usage_tokens(response):
+    """Total tokens reported by an OpenAI-style response, or None."""
+    usage = getattr(response, "usage", None)
+    if usage is None and isinstance(response, dict):
+        usage = response.get("usage")
+    if usage is None:
+        return None
+    total = usage.get("total_tokens") if isinstance(usage, dict) else getattr(usage, "total_tokens", None)
+    return total
+
+
+# -------------------------
+# Rate Limiter
+# -------------------------
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets with jittered
+    exponential backoff that honours Retry-After.
+    """
+
+    def __init__(self, rpm: float = GEMINI_RPM, tpm: float = GEMINI_TPM, max_retries: int = MAX_RETRIES):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm, rpm / 60.0)
+        self.tokens = TokenBucket(tpm, tpm / 60.0)
+        self.max_retries = max_retries
+        self.paused_until = 0.0
+        self.stats = {"calls": 0, "throttled": 0, "retries": 0, "rate_limit_errors": 0, "waited_s": 0.0}
+        self._lock = threading.Lock()
+
+    def share(self, fraction: float):
+        """Limit this process to a fraction of the budgets (worker processes splitting one API quota)."""
+        with self._lock:
+            self.requests = TokenBucket(self.rpm * fraction, self.rpm * fraction / 60.0)
+            self.tokens = TokenBucket(self.tpm * fraction, self.tpm * fraction / 60.0)
+
+    def reserve(self, estimated_tokens: int) -> float:
+        """Reserve one request and estimated_tokens; returns seconds to wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(
+                self.requests.reserve(1, now),
+                self.tokens.reserve(estimated_tokens, now),
+                self.paused_until - now,
+                0.0,
+            )
+            self.stats["calls"] += 1
+            if wait > 0:
+                self.stats["throttled"] += 1
+                self.stats["waited_s"] += wait
+            return wait
+
+    def record_usage(self, estimated_tokens: int, actual_tokens):
+        """Reconcile the token budget once the real usage is known."""
+        if actual_tokens is None:
+            return
+        with self._lock:
+            self.tokens.adjust(estimated_tokens - actual_tokens, time.monotonic())
+
+    def backoff(self, error: Exception, attempt: int) -> float:
+        """Pause all callers after a 429 and return the delay for this retry."""
+        delay = retry_after_seconds(error)
+        if delay is None:
+            # Full jitter: uniform in [0, base * 2^attempt], capped
+            delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.stats["rate_limit_errors"] += 1
+            self.stats["retries"] += 1
+        return delay
+
+    def call(self, fn, estimated_tokens: int = DEFAULT_COMPLETION_TOKENS):
+        """Run fn() under the budgets, retrying rate-limit errors with backoff."""
+        for attempt in range(self.max_retries + 1):
+            wait = self.reserve(estimated_tokens)
+            if wait > 0:
+                tracing.current_span().add(tracing.QUEUED_MS, round(wait * 1000, 1))
+                time.sleep(wait)
+            try:
+                response = fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                tracing.current_span().add(tracing.RETRIES)
+                time.sleep(self.backoff(e, attempt))
+                continue
+            self.record_usage(estimated_tokens, usage_tokens(response))
+            return response
+
+    async def acall(self, coro_fn, estimated_tokens: int = DEFAULT_COMPLETION_TOKENS):
+        """Async version of call(); coro_fn is a zero-argument coroutine factory."""
+        for attempt in range(self.max_retries + 1):
+            wait = self.reserve(estimated_tokens)
+            if wait > 0:
+                tracing.current_span().add(tracing.QUEUED_MS, round(wait * 1000, 1))
+                await asyncio.sleep(wait)
+            try:
+                response = await coro_fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                tracing.current_span().add(tracing.RETRIES)
+                await asyncio.sleep(self.backoff(e, attempt))
+                continue
+            self.record_usage(estimated_tokens, usage_tokens(response))
+            return response
+
+
+# -------------------------
+# Shared process-wide instance
+# -------------------------
+gemini_limiter = RateLimiter()
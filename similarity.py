@@ -0,0 +1,212 @@
+import re
+import math
+import threading
+from array import array
+
+import numpy as np
+
+import db
+
+# --------------------------------------------------
+# Near-duplicate Goal Lookup (local TF-IDF, no network)
+# --------------------------------------------------
+# Stored feature goals are indexed as binary unigram + bigram TF-IDF vectors
+# in an inverted index. A query only touches the posting lists of its own
+# terms, so lookups stay in the low milliseconds even at 100k stored specs.
+
+SIMILARITY_THRESHOLD = 0.55
+# Document norms depend on IDF; they are recomputed once the corpus has
+# grown by this fraction since the last refresh.
+NORM_REFRESH_GROWTH = 0.10
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "for", "to", "of", "in", "on", "with", "by", "as", "at",
+    "is", "are", "be", "that", "this", "it", "their", "our", "my", "your", "from", "into",
+    "build", "create", "develop", "make", "implement", "system", "feature", "app", "application",
+}
+
+
+def tokenize(text: str) -> list:
+    """Lower-cased unigrams and bigrams with stopwords removed."""
+    words = [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOPWORDS]
+    return sorted(set(words + [f"{a} {b}" for a, b in zip(words, words[1:])]))
+
+
+class SimilarityIndex:
+    """Incremental inverted TF-IDF index over feature goals."""
+
+    def __init__(self):
+        self._vocab = {}             # term -> term id
+        self._postings = []          # term id -> array of doc positions
+        self._df = np.zeros(1024)    # term id -> document frequency
+        self._doc_terms = array("q")  # all docs' term ids, concatenated
+        self._doc_offsets = [0]      # doc position -> slice start in _doc_terms
+        self._spec_ids = []          # doc position -> specifications.id
+        self._features = []          # doc position -> feature text
+        self._positions = {}         # specifications.id -> doc position
+        self._alive = np.zeros(0, dtype=bool)
+        self._norms = np.zeros(0, dtype=np.float64)
+        self._norms_at = 0           # corpus size when norms were last refreshed
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._spec_ids)
+
+    def spec_ids(self) -> set:
+        """Ids of the specs currently indexed (removed ones excluded)."""
+        with self._lock:
+            return set(self._positions)
+
+    # -------------------------
+    # Updates
+    # -------------------------
+    def add(self, spec_id: int, feature: str):
+        with self._lock:
+            self._add(spec_id, feature)
+
+    def add_many(self, rows):
+        with self._lock:
+            for spec_id, feature in rows:
+                self._add(spec_id, feature, update_norm=False)
+            self._refresh_norms()
+
+    def remove(self, spec_id: int):
+        with self._lock:
+            position = self._positions.pop(spec_id, None)
+            if position is not None:
+                self._alive[position] = False
+
+    def _add(self, spec_id: int, feature: str, update_norm: bool = True):
+        if spec_id in self._positions or not feature:
+            return
+        position = len(self._spec_ids)
+        term_ids = []
+        for term in tokenize(feature):
+            term_id = self._vocab.get(term)
+            if term_id is None:
+                term_id = self._vocab[term] = len(self._postings)
+                self._postings.append(array("q"))
+                if term_id >= len(self._df):
+                    self._df = np.concatenate([self._df, np.zeros(len(self._df))])
+            self._postings[term_id].append(position)
+            self._df[term_id] += 1
+            term_ids.append(term_id)
+
+        self._doc_terms.extend(term_ids)
+        self._doc_offsets.append(len(self._doc_terms))
+        self._spec_ids.append(spec_id)
+        self._features.append(feature)
+        self._positions[spec_id] = position
+
+        if position >= len(self._alive):
+            # Grow the per-doc arrays geometrically to keep appends amortised O(1)
+            capacity = max(1024, 2 * len(self._alive))
+            self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+            self._norms = np.concatenate([self._norms, np.ones(capacity - len(self._norms))])
+        self._alive[position] = True
+
+        if not update_norm:
+            return
+        if position + 1 > self._norms_at * (1 + NORM_REFRESH_GROWTH):
+            self._refresh_norms()
+        else:
+            self._norms[position] = math.sqrt(float(np.sum(self._idf(term_ids) ** 2))) if term_ids else 1.0
+
+    def _idf(self, term_ids=None) -> np.ndarray:
+        """Smoothed IDF for the given term ids (all terms if None)."""
+        df = self._df[:len(self._postings)] if term_ids is None else self._df[term_ids]
+        return np.log((1 + len(self._spec_ids)) / (1 + df)) + 1.0
+
+    def _refresh_norms(self):
+        n_docs = len(self._spec_ids)
+        if n_docs == 0:
+            return
+        idf_sq = self._idf() ** 2
+        terms = np.frombuffer(self._doc_terms, dtype=np.int64)
+        starts = np.asarray(self._doc_offsets[:-1], dtype=np.int64)
+        sums = np.zeros(n_docs)
+        non_empty = starts < np.asarray(self._doc_offsets[1:], dtype=np.int64)
+        if len(terms):
+            sums[non_empty] = np.add.reduceat(idf_sq[terms], starts[non_empty])
+        self._norms[:n_docs] = np.sqrt(np.maximum(sums, 1e-12))
+        self._norms_at = n_docs
+
+    # -------------------------
+    # Queries
+    # -------------------------
+    def query(self, text: str, k: int = 3, threshold: float = SIMILARITY_THRESHOLD) -> list:
+        """Return up to k (spec_id, cosine similarity, feature) tuples above threshold, best first."""
+        with self._lock:
+            n_docs = len(self._spec_ids)
+            terms = tokenize(text)
+            term_ids = [self._vocab[t] for t in terms if t in self._vocab]
+            if n_docs == 0 or not term_ids:
+                return []
+
+            idf = self._idf(term_ids)
+            # Terms never seen in the corpus still count towards the query norm
+            unknown = len(terms) - len(term_ids)
+            unknown_idf = math.log(1 + n_docs) + 1.0
+            query_norm = math.sqrt(float(np.sum(idf ** 2)) + unknown * unknown_idf ** 2)
+
+            scores = np.zeros(n_docs)
+            for term_id, weight in zip(term_ids, idf ** 2):
+                docs = np.frombuffer(self._postings[term_id], dtype=np.int64)
+                scores[docs] += weight
+
+            scores /= query_norm * self._norms[:n_docs]
+            scores[~self._alive[:n_docs]] = 0.0
+
+            k = min(k, n_docs)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                (self._spec_ids[i], float(scores[i]), self._features[i])
+                for i in top
+                if scores[i] >= threshold
+            ]
+
+
+# -------------------------
+# Process-wide index kept in sync with specgen.db
+# -------------------------
+# Specs are saved by the job worker processes, not by this one. Every
+# lookup first reads the insert and delete counters db keeps with triggers,
+# and only catches up when they moved: new rows are read past the last
+# indexed id, deletions by comparing ids.
+_index = None
+_synced_id = 0
+_synced_counts = None    # db.spec_change_counts() as of the last sync
+_index_lock = threading.Lock()
+
+
+def _sync(index: SimilarityIndex):
+    global _synced_id, _synced_counts
+    counts = db.spec_change_counts()
+    if counts == _synced_counts:
+        return
+    first = _synced_counts is None
+    if first or counts[0] != _synced_counts[0]:
+        for rows in db.iter_spec_features(after_id=_synced_id):
+            index.add_many(rows)
+            _synced_id = rows[-1][0]
+    if not first and counts[1] != _synced_counts[1]:
+        # Deleted elsewhere: drop what is no longer stored
+        for spec_id in index.spec_ids() - db.get_spec_ids():
+            index.remove(spec_id)
+    _synced_counts = counts
+
+
+def get_index() -> SimilarityIndex:
+    """The index of stored specs, built on first use and caught up with the database when it changed."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SimilarityIndex()
+        _sync(_index)
+        return _index
+
+
+def find_similar_specs(feature_goal: str, k: int = 3, threshold: float = SIMILARITY_THRESHOLD) -> list:
+    """Closest stored specs for a feature goal: (spec_id, similarity, stored feature), best first."""
+    return get_index().query(feature_goal, k=k, threshold=threshold)
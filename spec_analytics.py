@@ -0,0 +1,121 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+# --------------------------------------------------
+# Requirement Analytics
+# --------------------------------------------------
+# The spec Markdown is parsed once into a requirement index; every metric the
+# UI shows (counts, cost, complexity, completeness) is derived from it, and
+# the result is cached per document so reruns never re-scan the Markdown.
+
+# FR-001 / NFR-001; the lookbehind keeps "FR-" inside "NFR-" from matching twice
+REQUIREMENT_ID = re.compile(r"(?<![A-Za-z])(N?FR)-(\d+)")
+HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+FENCE = re.compile(r"^\s*```\s*(\w*)")
+ACCEPTANCE_CRITERION = re.compile(r"\b(?:GIVEN|Given)\b.*\b(?:THEN|Then)\b")
+
+# Estimation model (unchanged from the original UI formulas)
+HOURS_PER_WEEK = 40
+MIN_RATE, MAX_RATE = 80, 150
+TIMELINE_SPREAD = 1.5
+
+
+@dataclass(frozen=True)
+class SpecAnalytics:
+    """Requirement index of one spec plus the metrics derived from it."""
+    functional_ids: tuple
+    non_functional_ids: tuple
+    headings: tuple           # (level, text)
+    acceptance_criteria: int
+    mermaid_blocks: tuple     # diagram sources
+    word_count: int
+    story_count: int
+
+    @property
+    def fr_count(self) -> int:
+        return len(self.functional_ids)
+
+    @property
+    def nfr_count(self) -> int:
+        return len(self.non_functional_ids)
+
+    @property
+    def requirement_count(self) -> int:
+        return self.fr_count + self.nfr_count
+
+    @property
+    def weeks(self) -> float:
+        return max(2, self.fr_count * 0.5 + self.nfr_count * 0.3)
+
+    @property
+    def cost_range(self) -> tuple:
+        weeks = self.weeks
+        return int(weeks * HOURS_PER_WEEK * MIN_RATE), int(weeks * TIMELINE_SPREAD * HOURS_PER_WEEK * MAX_RATE)
+
+    @property
+    def timeline(self) -> str:
+        return f"{int(self.weeks)}-{int(self.weeks * TIMELINE_SPREAD)} weeks"
+
+    @property
+    def complexity(self) -> tuple:
+        """(label, colour emoji) by total requirement count."""
+        if self.requirement_count < 15:
+            return "Low", "🟢"
+        if self.requirement_count < 30:
+            return "Medium", "🟡"
+        return "High", "🔴"
+
+    @property
+    def completeness(self) -> int:
+        return min(100, self.fr_count * 5 + self.nfr_count * 5 + self.story_count * 10)
+
+
+@lru_cache(maxsize=256)
+def analyze_markdown(markdown: str, story_count: int = 0) -> SpecAnalytics:
+    """Single pass over the Markdown, line by line."""
+    ids = {"FR": {}, "NFR": {}}  # dicts keep first-seen order
+    headings = []
+    mermaid_blocks = []
+    criteria = 0
+    words = 0
+    fence_lang = None            # language of the open code fence, if any
+    block = []
+
+    for line in markdown.splitlines():
+        words += len(line.split())
+        fence = FENCE.match(line)
+        if fence_lang is not None:
+            if fence:
+                if fence_lang == "mermaid":
+                    mermaid_blocks.append("\n".join(block))
+                fence_lang, block = None, []
+            else:
+                block.append(line)
+            continue
+        if fence:
+            fence_lang = fence.group(1).lower()
+            continue
+
+        heading = HEADING.match(line)
+        if heading:
+            headings.append((len(heading.group(1)), heading.group(2)))
+        for kind, number in REQUIREMENT_ID.findall(line):
+            ids[kind].setdefault(f"{kind}-{number}", None)
+        if ACCEPTANCE_CRITERION.search(line):
+            criteria += 1
+
+    return SpecAnalytics(
+        functional_ids=tuple(ids["FR"]),
+        non_functional_ids=tuple(ids["NFR"]),
+        headings=tuple(headings),
+        acceptance_criteria=criteria,
+        mermaid_blocks=tuple(mermaid_blocks),
+        word_count=words,
+        story_count=story_count,
+    )
+
+
+def analyze_spec(spec) -> SpecAnalytics:
+    """Analytics for a Specification model (cached by its Markdown and story count)."""
+    return analyze_markdown(spec.detailed_spec_markdown, len(spec.high_level_stories))
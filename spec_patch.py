@@ -0,0 +1,219 @@
+import os
+import re
+
+from models import SpecReview
+
+# --------------------------------------------------
+# Reviewer Patch Mode
+# --------------------------------------------------
+# Instead of re-emitting the whole SRS inside JSON, the reviewer returns a
+# SpecReview: status, critique and patches (section id, replacement) for
+# only the sections it changed. The patches are applied here to the Stage 2
+# draft, which is never re-typed by the model. SPECGEN_REVIEW_MODE=full
+# restores the old behaviour.
+
+PATCH_REVIEW = os.getenv("SPECGEN_REVIEW_MODE", "patch").lower() != "full"
+NEW_SECTION_ID = "new"
+# Status written when the review itself failed (call error, unreadable
+# output) rather than judged the draft; model_router never escalates on it
+REVIEW_FAILED = "Review Failed"
+
+_SECTION_HEADING = re.compile(r"^##\s+\S")
+_FENCE = re.compile(r"^\s*```")
+_SECTION_ID = re.compile(r"^\[?\s*(?:S|§|section\s*)?(\d+)\s*\]?\.?$", re.IGNORECASE)
+_ID_MARKER = re.compile(r"^(##\s+)?\[S\d+\]\s*")
+
+
+def split_sections(markdown: str) -> list:
+    """
+    [heading, body] pairs: index 0 is the preamble before the first '## '
+    heading (heading None); section n is the n-th '## ' heading outside code fences.
+    """
+    sections = [[None, []]]
+    in_fence = False
+    for line in markdown.splitlines():
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        if not in_fence and _SECTION_HEADING.match(line):
+            sections.append([line, []])
+        else:
+            sections[-1][1].append(line)
+    return [[heading, "\n".join(body).strip("\n")] for heading, body in sections]
+
+
+def join_sections(sections: list) -> str:
+    parts = []
+    for heading, body in sections:
+        text = f"{heading}\n\n{body}" if heading else body
+        if text.strip():
+            parts.append(text.strip("\n"))
+    return "\n\n".join(parts) + "\n"
+
+
+def annotate_sections(markdown: str) -> str:
+    """The draft with an [S<n>] id in every '## ' heading, as shown to the reviewer."""
+    return join_sections([
+        [re.sub(r"^##\s+", f"## [S{i}] ", heading) if heading else None, body]
+        for i, (heading, body) in enumerate(split_sections(markdown))
+    ])
+
+
+def _title(heading: str) -> str:
+    return re.sub(r"^##\s+(\d+\.?\s*)?", "", heading).strip().lower()
+
+
+def _find_section(sections: list, section_id: str):
+    """Index of the section a patch refers to: 'S3', '3', '[S3]' or the heading text."""
+    section_id = section_id.strip()
+    match = _SECTION_ID.match(section_id)
+    if match:
+        index = int(match.group(1))
+        return index if index < len(sections) else None
+    wanted = _title("## " + section_id.lstrip("#").strip())
+    for index, (heading, _) in enumerate(sections):
+        if heading and wanted and _title(heading) == wanted:
+            return index
+    return None
+
+
+def _patch_field(patch, name: str) -> str:
+    return (patch.get(name) if isinstance(patch, dict) else getattr(patch, name)) or ""
+
+
+def apply_patches(markdown: str, patches) -> tuple:
+    """
+    Apply reviewer patches to the draft. Returns (patched Markdown, ids of
+    patches that matched no section). A replacement that starts with a
+    '## ' heading replaces the heading too; a 'new' patch (or an unknown id
+    whose replacement has a heading) is appended as an extra section.
+    """
+    if not patches:
+        return markdown, []
+    sections = split_sections(markdown)
+    skipped = []
+    for patch in patches:
+        section_id = _patch_field(patch, "section_id")
+        # An echoed id marker is dropped, keeping the heading it was attached to
+        replacement = _ID_MARKER.sub(lambda m: m.group(1) or "", _patch_field(patch, "replacement").strip())
+        lines = replacement.splitlines()
+        heading = lines[0] if lines and _SECTION_HEADING.match(lines[0]) else None
+        body = "\n".join(lines[1:]).strip("\n") if heading else replacement
+
+        index = None if section_id.strip().lower() == NEW_SECTION_ID else _find_section(sections, section_id)
+        if index is not None:
+            sections[index] = [heading or sections[index][0], body]
+        elif heading:
+            sections.append([heading, body])
+        else:
+            skipped.append(section_id)
+    return join_sections(sections), skipped
+
+
+def review_to_spec(review, draft: str, stories: list = None, feature_goal: str = None) -> dict:
+    """
+    Build the Specification fields from a SpecReview and the draft it
+    reviewed. stories, when given, win over the reviewer's copy (the
+    staged pipeline already has them from Stage 1).
+    """
+    markdown, skipped = apply_patches(draft, review.patches)
+    critique = review.validation_critique
+    if skipped:
+        critique += f" (Ignored patches for unknown sections: {', '.join(skipped)}.)"
+    spec = {
+        "high_level_stories": list(stories) if stories else list(review.high_level_stories),
+        "detailed_spec_markdown": markdown,
+        "validation_status": review.validation_status,
+        "validation_critique": critique,
+    }
+    if feature_goal is not None:
+        spec["feature_goal"] = feature_goal
+    return spec
+
+
+# --------------------------------------------------
+# Pipelined Section Review
+# --------------------------------------------------
+# Optional mode (SPECGEN_PIPELINED_REVIEW=1): Stage 3 does not wait for the
+# whole draft. The streamed Stage 2 output is cut at '## ' boundaries, each
+# finished section is audited on its own while the writer keeps going, and
+# the per-section verdicts are merged into the final Specification. Only
+# checks that span several sections are lost to the split.
+
+PIPELINED_REVIEW = os.getenv("SPECGEN_PIPELINED_REVIEW", "").lower() in ("1", "true", "yes")
+
+
+class SectionCutter:
+    """
+    Cuts streamed Markdown into the same sections as split_sections() and
+    hands each one out, as (index, heading, body), once the next heading
+    (or finish()) shows it is complete.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._in_fence = False
+        self._index = 0
+        self._heading = None
+        self._lines = []
+
+    def feed(self, text: str) -> list:
+        """Sections completed by this chunk."""
+        self._pending += text
+        *lines, self._pending = self._pending.split("\n")
+        return [section for section in map(self._line, lines) if section is not None]
+
+    def finish(self) -> list:
+        """The last section (call once, when the stream has ended)."""
+        if self._pending:
+            finished = self._line(self._pending)
+            self._pending = ""
+            if finished is not None:
+                return [finished, self._current()]
+        return [self._current()]
+
+    def _current(self) -> tuple:
+        return self._index, self._heading, "\n".join(self._lines).strip("\n")
+
+    def _line(self, line: str):
+        line = line.rstrip("\r")
+        if _FENCE.match(line):
+            self._in_fence = not self._in_fence
+        if not self._in_fence and _SECTION_HEADING.match(line):
+            finished = self._current()
+            self._index, self._heading, self._lines = self._index + 1, line, []
+            return finished
+        self._lines.append(line)
+        return None
+
+
+def merge_section_audits(draft: str, audits: dict, stories: list = None, feature_goal: str = None) -> dict:
+    """
+    Specification fields from per-section audits ({section index: SectionAudit},
+    None for an audit that failed). The run is 'Validated' only if every
+    section is; corrected sections replace the draft's. A verdict an audit
+    gave wins over REVIEW_FAILED for audits that failed.
+    """
+    sections = split_sections(draft)
+    patches, notes, statuses = [], [], []
+    for index in sorted(audits):
+        audit = audits[index]
+        heading = sections[index][0] if index < len(sections) and sections[index][0] else ""
+        label = f"S{index} ({heading.lstrip('#').strip()})" if heading else f"S{index}"
+        if audit is None:
+            statuses.append(REVIEW_FAILED)
+            notes.append(f"{label}: not audited (the audit call failed).")
+            continue
+        statuses.append(audit.validation_status)
+        if audit.replacement.strip():
+            patches.append({"section_id": f"S{index}", "replacement": audit.replacement})
+        if audit.validation_critique.strip():
+            notes.append(f"{label}: {audit.validation_critique.strip()}")
+
+    verdicts = [s for s in statuses if s != REVIEW_FAILED]
+    review = SpecReview(
+        validation_status=next((s for s in verdicts if s.strip().lower() != "validated"),
+                               REVIEW_FAILED if len(verdicts) < len(statuses) else "Validated"),
+        validation_critique=" ".join(notes) or "Every section passed the audit.",
+        patches=patches,
+    )
+    return review_to_spec(review, draft, stories=stories, feature_goal=feature_goal)
@@ -0,0 +1,89 @@
+import os
+import re
+
+from spec_analytics import REQUIREMENT_ID
+
+# --------------------------------------------------
+# Section Fan-out for the Spec Writer
+# --------------------------------------------------
+# Optional mode (SPECGEN_PARALLEL_SECTIONS=1): instead of one long serial
+# generation of the whole SRS, each independent section is drafted by its own
+# concurrent call from the same Stage 1 stories. The drafts are then merged
+# in a fixed order and FR/NFR ids renumbered, so the result does not depend
+# on which call finished first.
+
+PARALLEL_SECTIONS = os.getenv("SPECGEN_PARALLEL_SECTIONS", "").lower() in ("1", "true", "yes")
+SPEC_TITLE = "Software Requirements Specification"
+
+# (key, heading, what the section must contain) in document order
+SPEC_SECTIONS = [
+    ("introduction", "## 1. Introduction",
+     "Summarize the feature's purpose, scope, target users and key assumptions."),
+    ("functional", "## 2. Functional Requirements",
+     "List numbered functional requirements (FR-001, FR-002, ...). Give each one testable acceptance criteria in GIVEN/WHEN/THEN format."),
+    ("non_functional", "## 3. Non-Functional Requirements",
+     "List numbered non-functional requirements (NFR-001, NFR-002, ...) for performance, security, scalability and accessibility, each with a measurable target."),
+    ("diagram", "## 4. Feature Flow Diagram",
+     "Provide a single Mermaid syntax block (e.g., '```mermaid\nflowchart TD\n... \n```') that visually represents the core user journey or system logic for this feature."),
+    ("api", "## 5. API Requirements",
+     "Describe the API endpoints or contracts the feature needs (method, path, purpose, key fields). Write 'Not applicable.' if there are none."),
+    ("data", "## 6. Data Requirements",
+     "Describe the data entities, key fields, retention and privacy constraints. Write 'Not applicable.' if there are none."),
+    ("risks", "## 7. Risks & Mitigation",
+     "List the main delivery, security and product risks, each with a mitigation."),
+]
+
+_LEADING_FENCE = re.compile(r"^```(?:markdown|md)\s*\n")
+_TRAILING_FENCE = re.compile(r"\n```\s*$")
+
+
+def build_section_prompt(heading: str, instruction: str, user_needs) -> str:
+    return f"""
+    You are the Technical Specification Writer. Write ONLY the '{heading}' section of a software specification document in Markdown, based on the following user needs.
+
+    USER NEEDS (from Analyst): {user_needs}
+
+    {instruction}
+
+    Output only the body of this section: no section heading, no other sections, no commentary.
+    """
+
+
+def _clean_section(text: str) -> str:
+    """Strip a wrapping ```markdown fence and a heading the model may have echoed."""
+    text = text.strip()
+    if _LEADING_FENCE.match(text):
+        text = _TRAILING_FENCE.sub("", _LEADING_FENCE.sub("", text))
+    lines = text.splitlines()
+    if lines and lines[0].lstrip().startswith("#"):
+        lines = lines[1:]
+    return "\n".join(lines).strip()
+
+
+def renumber_requirements(sections: dict) -> dict:
+    """
+    Renumber FR ids in order of first appearance in the functional section and
+    NFR ids in the non-functional section (FR-001, FR-002, ... without gaps or
+    duplicates); references in every other section follow the same mapping.
+    """
+    mapping = {"FR": {}, "NFR": {}}
+    for key, kind in (("functional", "FR"), ("non_functional", "NFR")):
+        for found_kind, number in REQUIREMENT_ID.findall(sections.get(key, "")):
+            if found_kind == kind:
+                ids = mapping[kind]
+                ids.setdefault(int(number), f"{kind}-{len(ids) + 1:03d}")
+
+    def replace(match):
+        return mapping[match.group(1)].get(int(match.group(2)), match.group(0))
+
+    return {key: REQUIREMENT_ID.sub(replace, text) for key, text in sections.items()}
+
+
+def merge_sections(sections: dict, title: str = SPEC_TITLE) -> str:
+    """Assemble section drafts (keyed by SPEC_SECTIONS key) into one Markdown document."""
+    cleaned = renumber_requirements({key: _clean_section(text) for key, text in sections.items()})
+    parts = [f"# {title}"]
+    for key, heading, _ in SPEC_SECTIONS:
+        if cleaned.get(key):
+            parts.append(f"{heading}\n\n{cleaned[key]}")
+    return "\n\n".join(parts) + "\n"
@@ -0,0 +1,294 @@
+import os
+import asyncio
+import uuid
+
+# --- LiteLLM async completion (same provider routing as specgen_core) ---
+try:
+    from litellm import acompletion
+except ImportError:
+    raise ImportError("LiteLLM is required for this environment. Please run 'pip install litellm pydantic'.")
+
+import db
+import tracing
+import model_router
+from model_router import RunRouting
+from hedging import HEDGER, deadline_for
+from llm_cache import response_cache, CACHE_ENABLED
+from rate_limiter import gemini_limiter, estimate_tokens
+from spec_patch import split_sections
+from json_extract import parse_specification
+from models import SectionAudit
+from specgen_core import (
+    PIPELINE_STAGES,
+    stage_request,
+    stage_validator,
+    stage_3_output,
+    section_requests,
+    build_result,
+    begin_escalation,
+    end_escalation,
+    build_section_audit_prompt,
+    finish_section_review,
+    build_repair_prompt,
+    REPAIR_MAX_ATTEMPTS,
+    Specification,
+    _validation_errors,
+    AUDIT_TEMPERATURE,
+    PIPELINED_REVIEW,
+    merge_sections,
+    PARALLEL_SECTIONS,
+    SECTION_TEMPERATURE,
+    _prepare_request,
+    _response_text,
+    _accepts,
+)
+
+# --- Configuration Constants ---
+# Upper bound on LLM calls in flight across every async pipeline in this process.
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("SPECGEN_MAX_CONCURRENCY", "8"))
+# Per-goal wall-clock budget for all three stages together.
+DEFAULT_GOAL_TIMEOUT = float(os.getenv("SPECGEN_GOAL_TIMEOUT", "300"))
+
+# asyncio primitives are bound to an event loop, so keep one semaphore per loop.
+# Closed loops (one per finished asyncio.run()) are dropped on the next lookup;
+# weak keys would not free them, as a semaphore that was waited on holds its loop.
+_semaphores = {}
+
+
+def _llm_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        for closed in [other for other in _semaphores if other.is_closed()]:
+            del _semaphores[closed]
+        semaphore = _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+    return semaphore
+
+
+# --- Async LLM Call Helper ---
+
+async def _acomplete(prompt: str, temperature: float, response_model=None, validate=None) -> str:
+    """
+    Async twin of specgen_core._complete: same cache keys and validated
+    caching, but the network call
+    goes through litellm.acompletion under the global concurrency semaphore
+    and the shared Gemini rate limiter. A hedge's losing attempt is cancelled.
+    """
+    model = model_router.current_model()
+    route = model_router.current_route()
+    messages, kwargs, cache_key = _prepare_request(prompt, temperature, response_model, model)
+
+    with tracing.span("llm.completion", **{tracing.MODEL: model}) as span:
+        if CACHE_ENABLED:
+            cached = await asyncio.to_thread(response_cache.get, cache_key)
+            if cached is not None and not _accepts(validate, cached):
+                await asyncio.to_thread(response_cache.delete, cache_key)
+                cached = None
+            span.set(tracing.CACHE_HIT, cached is not None)
+            if cached is not None:
+                return cached
+
+        async def attempt():
+            # Each attempt (a hedge too) holds its own semaphore slot and rate-limit budget
+            async with _llm_semaphore():
+                return await gemini_limiter.acall(
+                    lambda: acompletion(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        timeout=deadline_for(route),
+                        **kwargs
+                    ),
+                    estimated_tokens=estimate_tokens(messages),
+                )
+
+        response = await HEDGER.acall(attempt, key=(route, model))
+        span.record_usage(response)
+        text = _response_text(response, response_model)
+    model_router.record_call(span)
+
+    if CACHE_ENABLED and _accepts(validate, text):
+        await asyncio.to_thread(response_cache.set, cache_key, model, text)
+    return text
+
+
+async def arepair_specification(raw_output: str, response_model=Specification,
+                                max_attempts: int = REPAIR_MAX_ATTEMPTS):
+    """Async twin of specgen_core.repair_specification: repair calls go through _acomplete."""
+    text = raw_output
+    with tracing.span("repair") as span:
+        for attempt in range(max_attempts + 1):
+            try:
+                return parse_specification(text, response_model)
+            except ValueError as e:
+                if attempt == max_attempts:
+                    raise
+                span.add("specgen.repair_attempts")
+                text = await _acomplete(
+                    build_repair_prompt(text, _validation_errors(e)),
+                    temperature=0.0,
+                    response_model=response_model,
+                    validate=lambda repaired: parse_specification(repaired, response_model),
+                )
+
+
+# --- 1. Async Orchestration Function ---
+
+async def _adraft_section(key: str, prompt: str) -> str:
+    with tracing.span(f"section.{key}"):
+        return await _acomplete(prompt, temperature=SECTION_TEMPERATURE)
+
+
+async def _asection_fanout(state: dict) -> str:
+    """Async twin of specgen_core._run_section_fanout."""
+    requests = section_requests(state)
+    texts = await asyncio.gather(*(_adraft_section(key, prompt) for key, prompt in requests))
+    return merge_sections({key: text for (key, _), text in zip(requests, texts)})
+
+
+async def _aaudit_section(routing: RunRouting, index: int, heading: str, body: str, user_needs):
+    with routing.stage(f"stage_3.S{index}", model=routing.model_for("stage_3"), overlapped=True), \
+            tracing.span(f"audit.S{index}", heading=heading):
+        text = await _acomplete(build_section_audit_prompt(f"S{index}", heading, body, user_needs),
+                                temperature=AUDIT_TEMPERATURE, response_model=SectionAudit,
+                                validate=stage_validator(SectionAudit, None))
+        return await arepair_specification(text, response_model=SectionAudit)
+
+
+async def _asection_review(state: dict, routing: RunRouting) -> str:
+    """
+    Stage 3 as concurrent per-section audits. Stage 2 is not streamed here,
+    so the audits start when the draft is complete, but run side by side.
+    """
+    sections = [(index, heading, body) for index, (heading, body) in enumerate(split_sections(state["stage_2"])) if heading]
+    results = await asyncio.gather(
+        *(_aaudit_section(routing, index, heading, body, state["stage_1"]) for index, heading, body in sections),
+        return_exceptions=True,
+    )
+    audits = {index: None if isinstance(result, Exception) else result
+              for (index, _, _), result in zip(sections, results)}
+    return finish_section_review(state, audits)
+
+
+async def arun_specgen_pipeline(feature_goal: str, run_id: str = None,
+                                parallel_sections: bool = PARALLEL_SECTIONS,
+                                pipelined_review: bool = PIPELINED_REVIEW) -> dict:
+    """
+    Executes the three-stage pipeline with async LiteLLM calls.
+    Stage outputs are checkpointed exactly like run_specgen_pipeline, so a
+    failed or timed-out run can be finished with resume_specgen_pipeline().
+    pipelined_review runs Stage 3 as concurrent per-section audits.
+    """
+    if not feature_goal:
+        return {"error": "Input feature goal cannot be empty."}
+
+    run_id = run_id or uuid.uuid4().hex
+    await asyncio.to_thread(db.save_checkpoint, run_id, "goal", feature_goal)
+
+    state = {"feature_goal": feature_goal}
+    routing = RunRouting()
+    with tracing.span("pipeline", trace_id=run_id, run_id=run_id):
+        error = await _arun_pending_stages(run_id, state, routing, parallel_sections, pipelined_review)
+        first_attempt = {} if error else begin_escalation(state, routing)
+        if first_attempt:
+            with tracing.span("escalation", reason=routing.reason):
+                retry_error = await _arun_pending_stages(run_id, state, routing, parallel_sections, pipelined_review)
+            end_escalation(state, routing, first_attempt, retry_error)
+            if retry_error:
+                for stage, output in first_attempt.items():
+                    await asyncio.to_thread(db.save_checkpoint, run_id, stage, output)
+
+    if error:
+        return dict(error, routing=routing.summary())
+    await asyncio.to_thread(db.delete_checkpoints, run_id)
+    return build_result(run_id, state, routing)
+
+
+async def _arun_pending_stages(run_id: str, state: dict, routing: RunRouting, parallel_sections: bool,
+                               pipelined_review: bool):
+    """Runs every stage not yet in state; returns the error result of a failed stage, or None."""
+    for stage, label in PIPELINE_STAGES:
+        if stage in state:
+            continue
+        with routing.stage(stage) as model, tracing.span(stage, label=label, **{tracing.MODEL: model}) as span:
+            try:
+                if parallel_sections and stage == "stage_2":
+                    state[stage] = await _asection_fanout(state)
+                elif pipelined_review and stage == "stage_3":
+                    state[stage] = await _asection_review(state, routing)
+                else:
+                    prompt, temperature, response_model, parser = stage_request(stage, state)
+                    text = await _acomplete(prompt, temperature=temperature, response_model=response_model,
+                                            validate=stage_validator(response_model, parser))
+                    if response_model is not None:
+                        # Structured stage: repair calls must not block the event loop
+                        state[stage] = stage_3_output(await arepair_specification(text, response_model), state)
+                    else:
+                        state[stage] = parser(text) if parser else text
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                span.fail(e)
+                return {"error": f"{label} Failed: {e}", "run_id": run_id, "failed_stage": stage}
+        await asyncio.to_thread(db.save_checkpoint, run_id, stage, state[stage])
+    return None
+
+
+async def _run_goal(index: int, feature_goal: str, timeout: float) -> dict:
+    run_id = uuid.uuid4().hex
+    try:
+        result = await asyncio.wait_for(arun_specgen_pipeline(feature_goal, run_id=run_id), timeout)
+    except asyncio.TimeoutError:
+        result = {"error": f"Pipeline timed out after {timeout:g}s", "run_id": run_id}
+    except Exception as e:
+        # One goal's failure must not end the iterator and cancel the others
+        result = {"error": f"Pipeline failed: {e}", "run_id": run_id}
+    result["index"] = index
+    result["feature_goal"] = feature_goal
+    return result
+
+
+# --- 2. Many Goals at Once ---
+
+async def iter_specgen_pipelines(goals, concurrency: int = MAX_CONCURRENT_LLM_CALLS,
+                                 timeout: float = DEFAULT_GOAL_TIMEOUT):
+    """
+    Runs many feature goals concurrently and yields each result dict as soon as
+    it finishes (completion order, not input order). Every result carries its
+    input "index" and "feature_goal".
+
+    At most `concurrency` goals are in flight; each goal gets `timeout` seconds.
+    Closing the iterator early cancels all goals still running.
+    """
+    pending_goals = iter(enumerate(goals))
+    in_flight = set()
+
+    try:
+        while True:
+            while len(in_flight) < concurrency:
+                item = next(pending_goals, None)
+                if item is None:
+                    break
+                in_flight.add(asyncio.ensure_future(_run_goal(item[0], item[1], timeout)))
+
+            if not in_flight:
+                return
+
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in in_flight:
+            task.cancel()
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+
+def run_specgen_pipelines(goals, concurrency: int = MAX_CONCURRENT_LLM_CALLS,
+                          timeout: float = DEFAULT_GOAL_TIMEOUT) -> list:
+    """Blocking convenience wrapper: returns all results in completion order."""
+
+    async def _collect():
+        return [result async for result in iter_specgen_pipelines(goals, concurrency, timeout)]
+
+    return asyncio.run(_collect())
@@ -1,6 +1,9 @@
 import os
 import json
-import re
+import uuid
+import itertools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # --- Import LiteLLM and Pydantic for robust execution ---
@@ -11,6 +14,20 @@ try:
 except ImportError:
     raise ImportError("LiteLLM is required for this environment. Please run 'pip install litellm pydantic'.")
 
+import db
+import tracing
+import model_router
+from model_router import RunRouting
+from hedging import HEDGER, deadline_for, first_chunk, close_stream
+from llm_cache import response_cache, make_cache_key, CACHE_ENABLED
+from rate_limiter import gemini_limiter, estimate_tokens
+from json_extract import parse_json, parse_specification
+from spec_sections import PARALLEL_SECTIONS, SPEC_SECTIONS, build_section_prompt, merge_sections
+from spec_patch import (
+    PATCH_REVIEW, PIPELINED_REVIEW, SectionCutter, annotate_sections, merge_section_audits, review_to_spec,
+)
+from models import SpecReview, SectionAudit
+
 # --- Fallback for Google Genai (Not used for API call, but sometimes CrewAI looks for it) ---
 try:
     from google import genai
@@ -24,7 +41,8 @@ load_dotenv()
 # --- Configuration Constants ---
 # LiteLLM requires the provider to be prefixed in the model name.
 # This format explicitly tells LiteLLM to use the Gemini provider with the 2.5-flash model.
-GEMINI_MODEL_ID = "gemini/gemini-2.5-flash" 
+# It is the default; model_router picks the model of each stage.
+GEMINI_MODEL_ID = model_router.DEFAULT_MODEL
 # LiteLLM uses GEMINI_API_KEY environment variable automatically.
 
 # --- Pydantic Output Model (Must match models.py) ---
@@ -36,44 +54,152 @@ class Specification(BaseModel):
     validation_critique: str = Field(description="The detailed log explaining the audit process and any corrections made to achieve validation.")
 
 
-# --- 1. Master Orchestration Function (Now using LiteLLM Completion) ---
+# --- LLM Call Helper (with persistent response cache) ---
+
+def _prepare_request(prompt: str, temperature: float, response_model=None, model: str = GEMINI_MODEL_ID):
+    """Builds the LiteLLM messages, extra kwargs and the content-addressed cache key for one call."""
+    messages = [{"role": "user", "content": prompt}]
+    response_schema = response_model.model_json_schema() if response_model else None
+    cache_key = make_cache_key(model, messages, temperature, response_schema)
+    kwargs = {"response_model": response_model} if response_model else {}
+    return messages, kwargs, cache_key
+
+
+def _response_text(response, response_model=None) -> str:
+    if response_model and not hasattr(response, "choices"):
+        # Structured output: LiteLLM returns the parsed object, not raw text
+        return response.model_dump_json()
+    # LiteLLM returns a standard OpenAI-style response object
+    return response['choices'][0]['message']['content']
+
 
-def run_specgen_pipeline(feature_goal: str) -> dict:
+def _accepts(validate, text: str) -> bool:
+    """Whether validate (a parser raising ValueError on bad output) accepts text; no validator accepts all."""
+    if validate is None:
+        return True
+    try:
+        validate(text)
+    except ValueError:
+        return False
+    return True
+
+
+def _complete(prompt: str, temperature: float, response_model=None, validate=None) -> str:
     """
-    Executes the three-stage multi-agent pipeline using sequential LiteLLM API calls.
+    Sends one prompt through LiteLLM and returns the response text.
+    Identical (model, messages, temperature, schema) calls are served from the local response cache.
+    Only text that validate accepts is cached (and served from it), so a
+    malformed answer is returned to the caller once but never replayed.
+    The model is the one model_router chose for the running stage; the call
+    gets the stage's deadline and is hedged when it outlasts the stage's p90.
     """
-    
-    if not feature_goal:
-        return {"error": "Input feature goal cannot be empty."}
+    model = model_router.current_model()
+    route = model_router.current_route()
+    messages, kwargs, cache_key = _prepare_request(prompt, temperature, response_model, model)
+
+    with tracing.span("llm.completion", **{tracing.MODEL: model}) as span:
+        if CACHE_ENABLED:
+            cached = response_cache.get(cache_key)
+            if cached is not None and not _accepts(validate, cached):
+                response_cache.delete(cache_key)  # Stored before answers were validated
+                cached = None
+            span.set(tracing.CACHE_HIT, cached is not None)
+            if cached is not None:
+                return cached
+
+        # Queue behind the process-wide Gemini budget; 429s are retried with backoff.
+        # A hedge is a second attempt, so it takes its own place in the budget.
+        response = HEDGER.call(
+            lambda: gemini_limiter.call(
+                lambda: completion(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    timeout=deadline_for(route),
+                    **kwargs
+                ),
+                estimated_tokens=estimate_tokens(messages),
+            ),
+            key=(route, model),
+        )
+        span.record_usage(response)
+        text = _response_text(response, response_model)
+    model_router.record_call(span)
+
+    if CACHE_ENABLED and _accepts(validate, text):
+        response_cache.set(cache_key, model, text)
+    return text
 
-    # --- Stage 1: Goal Agent (Analyzer) - Decomposition ---
-    stage_1_prompt = f"""
+
+def _chunk_text(chunk) -> str:
+    # Streaming chunks follow the OpenAI delta format
+    delta = chunk['choices'][0]['delta']
+    content = delta.get('content') if isinstance(delta, dict) else getattr(delta, 'content', None)
+    return content or ""
+
+
+def _stream_complete(prompt: str, temperature: float):
+    """
+    Streaming variant of _complete: yields text chunks as they arrive.
+    A cache hit is yielded as a single chunk; a finished stream is cached in full.
+    Hedging races the time to the first chunk.
+    """
+    model = model_router.current_model()
+    route = model_router.current_route()
+    messages, kwargs, cache_key = _prepare_request(prompt, temperature, model=model)
+
+    with tracing.span("llm.stream", **{tracing.MODEL: model}) as span:
+        if CACHE_ENABLED:
+            cached = response_cache.get(cache_key)
+            span.set(tracing.CACHE_HIT, cached is not None)
+            if cached is not None:
+                yield cached
+                return
+
+        first, stream = HEDGER.call(
+            lambda: first_chunk(gemini_limiter.call(
+                lambda: completion(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    timeout=deadline_for(route),
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ),
+                estimated_tokens=estimate_tokens(messages),
+            )),
+            key=(route, model, "stream"),
+            on_discard=close_stream,
+        )
+
+        parts = []
+        for chunk in itertools.chain([first] if first is not None else [], stream):
+            text = _chunk_text(chunk)
+            if text:
+                span.first_token()
+                parts.append(text)
+                yield text
+            span.record_usage(chunk)  # The last chunk carries the usage totals
+    model_router.record_call(span)
+
+    if CACHE_ENABLED:
+        response_cache.set(cache_key, model, "".join(parts))
+
+
+# --- Stage Prompts ---
+
+def build_stage_1_prompt(feature_goal: str) -> str:
+    return f"""
     You are the Goal Decomposition Analyst. Your goal is to analyze the complex feature goal provided and break it down into a structured list of 7-8 atomic user needs/problems. Focus on mitigating ambiguity.
     
     FEATURE GOAL: "{feature_goal}"
     
     Your output MUST be ONLY a JSON list of strings, where each string is a clear user need starting with 'As a user, I want...'. Do NOT include any other text.
     """
-    
-    try:
-        response_s1 = completion(
-            model=GEMINI_MODEL_ID,
-            messages=[{"role": "user", "content": stage_1_prompt}],
-            temperature=0.3
-        )
-        # LiteLLM returns a standard OpenAI-style response object
-        response_text = response_s1['choices'][0]['message']['content']
-        
-        # Attempt to parse the JSON list of stories
-        stories_json_str = re.search(r'\[.*\]', response_text, re.DOTALL).group(0)
-        user_needs_list = json.loads(stories_json_str)
-        
-    except Exception as e:
-        return {"error": f"Stage 1 (Decomposition) Failed: {e}"}
-
-
-    # --- Stage 2: Feature Agent (Generator) - Specification and Diagram ---
-    stage_2_prompt = f"""
+
+
+def build_stage_2_prompt(user_needs_list: list) -> str:
+    return f"""
     You are the Technical Specification Writer and Visual Planner. Your task is to generate a COMPLETE software specification document in detailed Markdown format based on the following user needs.
     
     USER NEEDS (from Analyst): {user_needs_list}
@@ -82,20 +208,10 @@ def run_specgen_pipeline(feature_goal: str) -> dict:
     
     CRITICAL: Include a section titled '## 4. Feature Flow Diagram' containing a single Mermaid syntax block (e.g., '```mermaid\nflowchart TD\n... \n```') that visually represents the core user journey or system logic for this feature.
     """
-    
-    try:
-        response_s2 = completion(
-            model=GEMINI_MODEL_ID,
-            messages=[{"role": "user", "content": stage_2_prompt}],
-            temperature=0.2
-        )
-        spec_draft_markdown = response_s2['choices'][0]['message']['content']
-    except Exception as e:
-        return {"error": f"Stage 2 (Generation) Failed: {e}"}
 
 
-    # --- Stage 3: Validation Agent (Critic) - Audit and Final JSON ---
-    stage_3_prompt = f"""
+def build_stage_3_prompt(spec_draft_markdown: str) -> str:
+    return f"""
     You are the Senior QA Lead and Specification Auditor. Your goal is to critically review the specification draft provided below against four standards: Testability, Consistency, Completeness, and Clean Markdown/Mermaid Format.
     
     SPECIFICATION DRAFT TO AUDIT:
@@ -108,24 +224,460 @@ def run_specgen_pipeline(feature_goal: str) -> dict:
     Your final response MUST be ONLY a single JSON object that strictly adheres to the provided Specification JSON schema. Do not include any text outside the JSON block.
     """
 
-    try:
-        # Use LiteLLM's structured output capability
-        response_s3 = completion(
-            model=GEMINI_MODEL_ID,
-            messages=[{"role": "user", "content": stage_3_prompt}],
-            response_model=Specification, # This forces the JSON schema
-            temperature=0.1
+
+def build_stage_3_review_prompt(spec_draft_markdown: str) -> str:
+    return f"""
+    You are the Senior QA Lead and Specification Auditor. Your goal is to critically review the specification draft provided below against four standards: Testability, Consistency, Completeness, and Clean Markdown/Mermaid Format.
+    
+    Every section of the draft is marked with its id, e.g. [S2].
+    
+    SPECIFICATION DRAFT TO AUDIT:
+    ---
+    {annotate_sections(spec_draft_markdown)}
+    ---
+    
+    Perform your audit. Do NOT rewrite the document. For each section that has flaws, add a patch with its section id and the complete corrected body of that section (without the heading). Leave correct sections out. To add a missing section, use the id "new" and start the replacement with its '## ' heading.
+    
+    Your final response MUST be ONLY a single JSON object that strictly adheres to the provided SpecReview JSON schema. Do not include any text outside the JSON block.
+    """
+
+
+def build_section_audit_prompt(section_id: str, heading: str, body: str, user_needs) -> str:
+    return f"""
+    You are the Senior QA Lead and Specification Auditor. Audit ONE section of a specification draft against three standards: Testability, Consistency, and Clean Markdown/Mermaid Format. The other sections are audited separately.
+    
+    USER NEEDS (from Analyst): {user_needs}
+    
+    SECTION [{section_id}] {heading}:
+    ---
+    {body}
+    ---
+    
+    If the section has flaws, put its complete corrected body (without the heading) in "replacement"; otherwise leave "replacement" empty.
+    
+    Your final response MUST be ONLY a single JSON object that strictly adheres to the provided SectionAudit JSON schema. Do not include any text outside the JSON block.
+    """
+
+
+def parse_stage_1_output(response_text: str) -> list:
+    # Attempt to parse the JSON list of stories
+    return parse_json(response_text, "[")
+
+
+def parse_stage_3_output(response_text: str) -> str:
+    # Validate the final JSON, repairing it instead of failing the whole run
+    return repair_specification(response_text).model_dump_json()
+
+
+def parse_stage_3_review(response_text: str, state: dict) -> str:
+    return stage_3_output(repair_specification(response_text, response_model=SpecReview), state)
+
+
+def stage_3_output(parsed, state: dict) -> str:
+    """Stage 3 JSON from its validated model (a Specification, or a SpecReview applied to the draft)."""
+    if isinstance(parsed, SpecReview):
+        # Apply the reviewer's patches to the Stage 2 draft; stories come from Stage 1
+        spec = review_to_spec(parsed, state["stage_2"], stories=state["stage_1"], feature_goal=state["feature_goal"])
+        return Specification.model_validate(spec).model_dump_json()
+    return parsed.model_dump_json()
+
+
+# --- Structured Output Repair ---
+# Invalid final JSON is fixed in place rather than by rerunning the pipeline:
+# json_extract's local repairs first, then a short LLM call that only sees
+# the broken output and the validation errors.
+REPAIR_MAX_ATTEMPTS = int(os.getenv("SPECGEN_REPAIR_ATTEMPTS", "2"))
+
+
+def build_repair_prompt(broken_output: str, errors: str) -> str:
+    return f"""
+    You are a JSON Repair Tool. The output below was meant to be a single JSON object for the required schema, but it failed validation.
+
+    ---VALIDATION ERRORS---
+    {errors}
+
+    ---BROKEN OUTPUT---
+    {broken_output}
+
+    Return ONLY the corrected JSON object. Keep all existing content; change only what is needed to fix the errors listed above.
+    """
+
+
+def _validation_errors(error: Exception) -> str:
+    if hasattr(error, "errors"):
+        # Pydantic ValidationError: one line per failing field
+        return "\n".join(
+            f"- {'.'.join(str(part) for part in e['loc']) or '(root)'}: {e['msg']}" for e in error.errors()
         )
-        
-        # LiteLLM returns the parsed object, not raw text
-        final_spec_object = response_s3.model_dump_json()
+    return f"- {error}"
+
+
+def repair_specification(raw_output: str, response_model=Specification, max_attempts: int = REPAIR_MAX_ATTEMPTS):
+    """
+    Parses agent output into response_model. Output that still fails after
+    the local repairs is sent back to the model with its errors, at most
+    max_attempts times; the last error is raised when attempts run out.
+    """
+    text = raw_output
+    with tracing.span("repair") as span:
+        for attempt in range(max_attempts + 1):
+            try:
+                return parse_specification(text, response_model)
+            except ValueError as e:
+                # json.JSONDecodeError and pydantic's ValidationError are both ValueErrors
+                if attempt == max_attempts:
+                    raise
+                span.add("specgen.repair_attempts")
+                text = _complete(
+                    build_repair_prompt(text, _validation_errors(e)),
+                    temperature=0.0,
+                    response_model=response_model,
+                    validate=lambda repaired: parse_specification(repaired, response_model),
+                )
 
-    except Exception as e:
-        return {"error": f"Stage 3 (Validation/JSON Output) Failed: {e}"}
 
+def finish_section_review(state: dict, audits: dict) -> str:
+    # Merge the per-section verdicts into the Stage 3 Specification JSON
+    spec = merge_section_audits(state["stage_2"], audits, stories=state["stage_1"], feature_goal=state["feature_goal"])
+    return Specification.model_validate(spec).model_dump_json()
+
+
+# --- Stage Definitions (name, error label) ---
+# Checkpoints are stored under these names, in pipeline order.
+PIPELINE_STAGES = [
+    ("stage_1", "Stage 1 (Decomposition)"),
+    ("stage_2", "Stage 2 (Generation)"),
+    ("stage_3", "Stage 3 (Validation/JSON Output)"),
+]
+
+
+def stage_request(stage: str, state: dict):
+    """
+    Returns (prompt, temperature, response_model, parser) for one stage given the
+    accumulated pipeline state. Shared by the sync and async engines.
+    """
+    if stage == "stage_1":
+        # --- Stage 1: Goal Agent (Analyzer) - Decomposition ---
+        return build_stage_1_prompt(state["feature_goal"]), 0.3, None, parse_stage_1_output
+
+    if stage == "stage_2":
+        # --- Stage 2: Feature Agent (Generator) - Specification and Diagram ---
+        return build_stage_2_prompt(state["stage_1"]), 0.2, None, None
+
+    # --- Stage 3: Validation Agent (Critic) - Audit and Final JSON ---
+    # Use LiteLLM's structured output capability (response_model forces the JSON schema)
+    if PATCH_REVIEW:
+        # Patch mode: the critic returns only corrected sections, not the whole SRS
+        return (build_stage_3_review_prompt(state["stage_2"]), 0.1, SpecReview,
+                lambda text: parse_stage_3_review(text, state))
+    return build_stage_3_prompt(state["stage_2"]), 0.1, Specification, parse_stage_3_output
+
+
+def stage_validator(response_model, parser):
+    """
+    What a stage's raw answer must pass to be cached: the local schema parse
+    for structured stages (their parsers may make repair calls), else the parser.
+    """
+    if response_model is not None:
+        return lambda text: parse_specification(text, response_model)
+    return parser
+
+
+def _run_stage(stage: str, state: dict):
+    """Runs a single stage against the accumulated pipeline state and returns its output."""
+    prompt, temperature, response_model, parser = stage_request(stage, state)
+    text = _complete(prompt, temperature=temperature, response_model=response_model,
+                     validate=stage_validator(response_model, parser))
+    return parser(text) if parser else text
+
+
+# --- Stage 2 Section Fan-out (optional) ---
+SECTION_TEMPERATURE = 0.2
+
+
+def section_requests(state: dict) -> list:
+    """(section key, prompt) for every independent SRS section, drafted from the Stage 1 stories."""
+    return [
+        (key, build_section_prompt(heading, instruction, state["stage_1"]))
+        for key, heading, instruction in SPEC_SECTIONS
+    ]
+
+
+def _draft_section(key: str, prompt: str) -> str:
+    with tracing.span(f"section.{key}"):
+        return _complete(prompt, SECTION_TEMPERATURE)
+
+
+def _run_section_fanout(state: dict) -> str:
+    """Stage 2 with one concurrent call per section, merged in document order."""
+    requests = section_requests(state)
+    with ThreadPoolExecutor(max_workers=len(requests)) as pool:
+        # Each call runs in a copy of this context so its spans nest under the stage
+        futures = {
+            key: pool.submit(contextvars.copy_context().run, _draft_section, key, prompt)
+            for key, prompt in requests
+        }
+        return merge_sections({key: future.result() for key, future in futures.items()})
+
+
+# --- Pipelined Stage 3 (optional) ---
+# Each Stage 2 section is audited as soon as the stream has passed it.
+AUDIT_TEMPERATURE = 0.1
+
+
+def _audit_section(routing: RunRouting, index: int, heading: str, body: str, user_needs) -> SectionAudit:
+    # Stage 3 work on Stage 3's model, running alongside Stage 2
+    section_id = f"S{index}"
+    with routing.stage(f"stage_3.{section_id}", model=routing.model_for("stage_3"), overlapped=True), \
+            tracing.span(f"audit.{section_id}", heading=heading):
+        text = _complete(build_section_audit_prompt(section_id, heading, body, user_needs),
+                         temperature=AUDIT_TEMPERATURE, response_model=SectionAudit,
+                         validate=stage_validator(SectionAudit, None))
+        return repair_specification(text, response_model=SectionAudit)
+
+
+class _PipelinedReview:
+    """Section audits started while Stage 2 is still being written."""
+
+    def __init__(self, state: dict, routing: RunRouting):
+        self.state = state
+        self.routing = routing
+        self.cutter = SectionCutter()
+        self.pool = ThreadPoolExecutor(max_workers=len(SPEC_SECTIONS) + 1)
+        self.futures = {}
+        # Captured before streaming starts, so audit spans nest under Stage 2 and not the stream call
+        self.context = contextvars.copy_context()
+
+    def _submit(self, sections: list):
+        for index, heading, body in sections:
+            if heading is None:
+                continue  # The title before the first section has nothing to audit
+            self.futures[index] = self.pool.submit(
+                self.context.copy().run, _audit_section, self.routing, index, heading, body, self.state["stage_1"]
+            )
+
+    def feed(self, text: str):
+        self._submit(self.cutter.feed(text))
+
+    def close(self):
+        """The draft is complete: audit its last section."""
+        self._submit(self.cutter.finish())
+
+    def cancel(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def result(self) -> str:
+        """Wait for every audit and merge them into the Stage 3 output."""
+        audits = {}
+        for index, future in self.futures.items():
+            try:
+                audits[index] = future.result()
+            except Exception:
+                audits[index] = None  # Reported in the critique; the draft section is kept
+        self.pool.shutdown()
+        return finish_section_review(self.state, audits)
+
+
+def build_result(run_id: str, state: dict, routing: RunRouting = None) -> dict:
     # --- Final Output Synthesis ---
-    return {
-        "final_json_str": final_spec_object,
-        "raw_stories": user_needs_list,
-        "raw_spec_draft": spec_draft_markdown
-    }
\ No newline at end of file
+    result = {
+        "final_json_str": state["stage_3"],
+        "raw_stories": state["stage_1"],
+        "raw_spec_draft": state["stage_2"],
+        "run_id": run_id,
+    }
+    if routing is not None:
+        result["routing"] = routing.summary()
+    return result
+
+
+# --- Escalation ---
+# A 'Needs Refinement' verdict reruns the pipeline from the first escalated
+# stage on the stronger model (see model_router), once per run.
+
+def validation_status(state: dict) -> str:
+    try:
+        return json.loads(state["stage_3"]).get("validation_status", "")
+    except (KeyError, ValueError, AttributeError):
+        return ""
+
+
+def begin_escalation(state: dict, routing: RunRouting) -> dict:
+    """
+    Decide whether the finished run escalates. If so, drop the stages to
+    rerun from state and return them (the first attempt); otherwise {}.
+    """
+    stages = [stage for stage, _ in PIPELINE_STAGES]
+    escalated = [stages.index(stage) for stage in routing.router.escalate if stage in stages]
+    if not escalated or not routing.escalate(validation_status(state)):
+        return {}
+    return {stage: state.pop(stage) for stage in stages[min(escalated):]}
+
+
+def end_escalation(state: dict, routing: RunRouting, first_attempt: dict, error: dict = None):
+    """After a failed escalation, keep the first attempt rather than lose the run."""
+    if error:
+        state.update(first_attempt)
+        routing.reason += f"; escalation failed, first attempt kept ({error['error']})"
+
+
+def _iter_stages(run_id: str, state: dict, stream: bool = False, parallel_sections: bool = PARALLEL_SECTIONS,
+                 pipelined_review: bool = PIPELINED_REVIEW):
+    """
+    Runs every stage that has no checkpoint yet, checkpointing each output
+    as soon as it is produced so a later failure never repays earlier stages.
+
+    Yields progress events: {"type": "stage"} when a stage starts,
+    {"type": "chunk"} for streamed Stage 2 Markdown (stream=True only),
+    {"type": "escalation"} before stages are rerun on a stronger model
+    (Stage 2 then starts over), and a final {"type": "result"} carrying the
+    same dict run_specgen_pipeline returns, including its "routing".
+    With parallel_sections, Stage 2 is drafted section by section concurrently
+    and streamed as one chunk once merged. With pipelined_review, Stage 3
+    audits each Stage 2 section as soon as it is complete (see spec_patch).
+    """
+    routing = RunRouting()
+    with tracing.span("pipeline", trace_id=run_id, run_id=run_id):
+        error = yield from _iter_pending_stages(run_id, state, routing, stream, parallel_sections, pipelined_review)
+        first_attempt = {} if error else begin_escalation(state, routing)
+        if first_attempt:
+            yield {"type": "escalation", "reason": routing.reason, "model": routing.router.escalation_model}
+            with tracing.span("escalation", reason=routing.reason):
+                retry_error = yield from _iter_pending_stages(run_id, state, routing, stream, parallel_sections,
+                                                              pipelined_review)
+            end_escalation(state, routing, first_attempt, retry_error)
+            if retry_error:
+                for stage, output in first_attempt.items():
+                    db.save_checkpoint(run_id, stage, output)
+
+        if error:
+            yield {"type": "result", "result": dict(error, routing=routing.summary())}
+        else:
+            # Checkpoints only serve resume_specgen_pipeline(); the result carries every stage
+            db.delete_checkpoints(run_id)
+            yield {"type": "result", "result": build_result(run_id, state, routing)}
+
+
+def _iter_stage_2(state: dict, stream: bool, parallel_sections: bool, on_text=None):
+    """
+    Stage 2 output, yielding chunk events when streaming. on_text sees the
+    Markdown as it is produced (the model is streamed for it even when the
+    caller does not stream).
+    """
+    if parallel_sections:
+        text = _run_section_fanout(state)
+        if on_text:
+            on_text(text)
+        if stream:
+            yield {"type": "chunk", "stage": "stage_2", "text": text}
+        return text
+    if not stream and on_text is None:
+        return _run_stage("stage_2", state)
+
+    prompt, temperature, _, _ = stage_request("stage_2", state)
+    parts = []
+    for text in _stream_complete(prompt, temperature=temperature):
+        parts.append(text)
+        if on_text:
+            on_text(text)
+        if stream:
+            yield {"type": "chunk", "stage": "stage_2", "text": text}
+    return "".join(parts)
+
+
+def _iter_pending_stages(run_id: str, state: dict, routing: RunRouting, stream: bool, parallel_sections: bool,
+                         pipelined_review: bool):
+    """Stage loop of _iter_stages; returns the error result of a failed stage, or None."""
+    review = None
+    for stage, label in PIPELINE_STAGES:
+        if stage in state:
+            continue
+        yield {"type": "stage", "stage": stage, "label": label}
+        with routing.stage(stage) as model, tracing.span(stage, label=label, **{tracing.MODEL: model}) as span:
+            try:
+                if stage == "stage_2":
+                    review = _PipelinedReview(state, routing) if pipelined_review else None
+                    state[stage] = yield from _iter_stage_2(state, stream, parallel_sections, review and review.feed)
+                    if review:
+                        review.close()
+                elif stage == "stage_3" and review is not None:
+                    # Only the audits still running when Stage 2 ended are waited for here
+                    span.set("specgen.pipelined_review", True)
+                    state[stage] = review.result()
+                else:
+                    state[stage] = _run_stage(stage, state)
+            except Exception as e:
+                if review:
+                    review.cancel()
+                span.fail(e)
+                return {"error": f"{label} Failed: {e}", "run_id": run_id, "failed_stage": stage}
+        db.save_checkpoint(run_id, stage, state[stage])
+    return None
+
+
+def _execute_stages(run_id: str, state: dict, parallel_sections: bool = PARALLEL_SECTIONS,
+                    pipelined_review: bool = PIPELINED_REVIEW) -> dict:
+    for event in _iter_stages(run_id, state, parallel_sections=parallel_sections, pipelined_review=pipelined_review):
+        if event["type"] == "result":
+            return event["result"]
+
+
+# --- 1. Master Orchestration Function (Now using LiteLLM Completion) ---
+
+def run_specgen_pipeline(feature_goal: str, run_id: str = None, parallel_sections: bool = PARALLEL_SECTIONS,
+                         pipelined_review: bool = PIPELINED_REVIEW) -> dict:
+    """
+    Executes the three-stage multi-agent pipeline using sequential LiteLLM API calls.
+    Each stage output is checkpointed under run_id until the run completes; pass
+    the returned run_id to resume_specgen_pipeline() to retry after a failure. parallel_sections drafts
+    the Stage 2 sections concurrently (see spec_sections); pipelined_review
+    audits each section while Stage 2 is still running (see spec_patch).
+    """
+    
+    if not feature_goal:
+        return {"error": "Input feature goal cannot be empty."}
+
+    run_id = run_id or uuid.uuid4().hex
+    db.save_checkpoint(run_id, "goal", feature_goal)
+
+    return _execute_stages(run_id, {"feature_goal": feature_goal}, parallel_sections, pipelined_review)
+
+
+# --- 2. Resume a Failed Run ---
+
+def resume_specgen_pipeline(run_id: str, parallel_sections: bool = PARALLEL_SECTIONS,
+                            pipelined_review: bool = PIPELINED_REVIEW) -> dict:
+    """
+    Restarts a previous run from the first stage without a checkpoint.
+    A Stage 3 failure therefore costs one LLM call to retry instead of three
+    (a whole-draft review: section audits only overlap a Stage 2 being written).
+    """
+    checkpoints = db.get_checkpoints(run_id)
+
+    if "goal" not in checkpoints:
+        return {"error": f"No pipeline run found for run_id '{run_id}'.", "run_id": run_id}
+
+    state = {"feature_goal": checkpoints.pop("goal")}
+    state.update(checkpoints)
+
+    return _execute_stages(run_id, state, parallel_sections, pipelined_review)
+
+
+# --- 3. Streaming Variant ---
+
+def stream_specgen_pipeline(feature_goal: str, run_id: str = None, parallel_sections: bool = PARALLEL_SECTIONS,
+                            pipelined_review: bool = PIPELINED_REVIEW):
+    """
+    Generator version of run_specgen_pipeline. Stage 2 Markdown is yielded in
+    chunks as Gemini produces it, so a UI can render the draft progressively;
+    the last event is {"type": "result", "result": <pipeline result dict>}.
+    """
+    if not feature_goal:
+        yield {"type": "result", "result": {"error": "Input feature goal cannot be empty."}}
+        return
+
+    run_id = run_id or uuid.uuid4().hex
+    db.save_checkpoint(run_id, "goal", feature_goal)
+
+    yield from _iter_stages(run_id, {"feature_goal": feature_goal}, stream=True, parallel_sections=parallel_sections,
+                            pipelined_review=pipelined_review)
@@ -0,0 +1,41 @@
+import pytest
+
+from json_extract import JSONExtractionError, parse_json
+
+
+def test_bare_object():
+    assert parse_json('{"a": 1}') == {"a": 1}
+
+
+def test_largest_value_wins_over_brackets_in_prose():
+    text = 'Use {feature} here:\n```json\n{"a": [1, 2], "b": "x"}\n```\nThanks for {anything}.'
+    assert parse_json(text, "{") == {"a": [1, 2], "b": "x"}
+
+
+def test_trailing_comma_is_repaired():
+    assert parse_json('{"a": [1, 2,],}') == {"a": [1, 2]}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a":1}\n\nNote: the template uses { for placeholders', {"a": 1}),
+    ('{"a":1}\n\nNote: the template uses {', {"a": 1}),
+    ('stories [draft\n["a", "b"]', ["a", "b"]),
+    ('Scores [1, 2 and 3 are rough\n{"a": 1}', {"a": 1}),
+])
+def test_stray_unclosed_bracket_in_prose(text, expected):
+    assert parse_json(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    '{"a": 1, "b": "cut off he',
+    'Here you go:\n```json\n{\n  "a": [1, 2',
+    '{"a": 1}\n{"b": [1, 2',
+])
+def test_truncated_output_raises(text):
+    with pytest.raises(JSONExtractionError, match="truncated"):
+        parse_json(text)
+
+
+def test_no_json():
+    with pytest.raises(JSONExtractionError, match="No valid JSON"):
+        parse_json("no json at all")
@@ -0,0 +1,361 @@
+"""
+Per-stage tracing for SpecGen AI.
+
+Every pipeline stage, CrewAI task and LLM call runs inside a span that
+records wall time and, for LLM calls, time to first token, prompt and
+completion tokens, estimated cost, cache hits, rate-limit retries and hedges.
+Finished traces are written to the trace_spans table in specgen.db and can
+be exported as OpenTelemetry (OTLP/JSON) for any OTel-compatible viewer.
+
+Usage:
+    python tracing.py stats                       # p50/p95/p99 per stage, last 24h
+    python tracing.py export -o trace.json        # OTLP/JSON export
+
+Set SPECGEN_TRACING_DISABLED=1 to stop writing spans.
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import argparse
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import db
+
+TRACING_ENABLED = os.getenv("SPECGEN_TRACING_DISABLED", "").lower() not in ("1", "true", "yes")
+SERVICE_NAME = "specgen"
+
+# USD per million tokens for models without a list price below (Gemini 2.5 Flash by default)
+INPUT_COST_PER_MILLION = float(os.getenv("SPECGEN_INPUT_COST_PER_M", "0.30"))
+OUTPUT_COST_PER_MILLION = float(os.getenv("SPECGEN_OUTPUT_COST_PER_M", "2.50"))
+# (input, output) USD per million tokens by model name, provider prefix dropped
+MODEL_COSTS_PER_MILLION = {
+    "gemini-2.5-pro": (1.25, 10.00),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+}
+
+# Attribute keys (OpenTelemetry GenAI conventions where one exists)
+MODEL = "gen_ai.request.model"
+INPUT_TOKENS = "gen_ai.usage.input_tokens"
+OUTPUT_TOKENS = "gen_ai.usage.output_tokens"
+TTFT_MS = "specgen.ttft_ms"
+CACHE_HIT = "specgen.cache_hit"
+RETRIES = "specgen.retries"
+QUEUED_MS = "specgen.queued_ms"
+COST_USD = "specgen.cost_usd"
+# Estimated prompt tokens of a crew task, with and without context trimming
+PROMPT_ESTIMATE = "specgen.prompt_tokens"
+UNTRIMMED_ESTIMATE = "specgen.prompt_tokens_untrimmed"
+SHARED_PREFIX_TOKENS = "specgen.prefix_tokens"
+# Hedged LLM calls: whether a duplicate was fired, and whether it answered first
+HEDGED = "specgen.hedged"
+HEDGE_WON = "specgen.hedge_won"
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+_current = ContextVar("specgen_span", default=None)
+
+
+def token_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD cost of one call at the model's list price."""
+    input_cost, output_cost = MODEL_COSTS_PER_MILLION.get(
+        (model or "").rsplit("/", 1)[-1], (INPUT_COST_PER_MILLION, OUTPUT_COST_PER_MILLION)
+    )
+    return (prompt_tokens * input_cost + completion_tokens * output_cost) / 1e6
+
+
+# ----------------------------------
+# Spans
+# ----------------------------------
+class Span:
+    """One timed operation. Attributes are plain JSON values."""
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, attributes: dict = None, start_ns: int = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.status = STATUS_OK
+        self._perf_start = time.perf_counter()
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def add(self, key: str, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def first_token(self):
+        """Mark the first streamed token (only the first call counts)."""
+        if TTFT_MS not in self.attributes:
+            self.attributes[TTFT_MS] = round((time.perf_counter() - self._perf_start) * 1000, 1)
+
+    def record_usage(self, response):
+        """Token counts and cost from an OpenAI-style response or usage object, if it has them."""
+        usage = getattr(response, "usage", None)
+        if usage is None and isinstance(response, dict):
+            usage = response.get("usage")
+        if usage is None:
+            usage = response
+
+        def read(field):
+            value = usage.get(field) if isinstance(usage, dict) else getattr(usage, field, None)
+            return value if isinstance(value, int) else None
+
+        prompt_tokens, completion_tokens = read("prompt_tokens"), read("completion_tokens")
+        if prompt_tokens is None and completion_tokens is None:
+            return
+        self.add(INPUT_TOKENS, prompt_tokens or 0)
+        self.add(OUTPUT_TOKENS, completion_tokens or 0)
+        cost = token_cost(self.attributes.get(MODEL), prompt_tokens or 0, completion_tokens or 0)
+        self.set(COST_USD, round(self.attributes.get(COST_USD, 0.0) + cost, 8))
+
+    def fail(self, error: BaseException):
+        self.status = STATUS_ERROR
+        self.attributes["error.type"] = type(error).__name__
+        self.attributes["error.message"] = str(error)[:500]
+
+    def record_child(self, name: str, start_ns: int, end_ns: int = None, **attributes):
+        """Record a finished child span after the fact (work timed by someone else's callbacks)."""
+        child = Span(name, self.trace_id, self.span_id, attributes, start_ns=start_ns)
+        child.end(end_ns)
+        return child
+
+    def end(self, end_ns: int = None):
+        if self.end_ns is None:
+            self.end_ns = end_ns or time.time_ns()
+            _recorder.finish(self)
+
+    def row(self) -> tuple:
+        return (self.span_id, self.trace_id, self.parent_id, self.name,
+                self.start_ns, self.end_ns, self.status, self.attributes)
+
+
+class _NullSpan:
+    """Stand-in returned by current_span() outside any trace."""
+
+    def set(self, key, value):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+    def first_token(self):
+        pass
+
+    def record_usage(self, response):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+# ----------------------------------
+# Recorder
+# ----------------------------------
+class _Recorder:
+    """
+    Buffers the spans of each open trace and writes them in one transaction
+    when the root span ends; spans that finish after their root are written
+    on their own. Storage errors are swallowed: tracing never fails a run.
+    """
+
+    def __init__(self):
+        self._open = {}   # trace_id -> finished spans waiting for the root
+        self._lock = threading.Lock()
+
+    def start_trace(self, trace_id: str):
+        with self._lock:
+            self._open.setdefault(trace_id, [])
+
+    def finish(self, span: Span):
+        with self._lock:
+            pending = self._open.get(span.trace_id)
+            if pending is not None and span.parent_id is not None:
+                pending.append(span.row())
+                return
+            rows = (self._open.pop(span.trace_id, None) or []) + [span.row()]
+        if TRACING_ENABLED:
+            try:
+                db.save_spans(rows)
+            except Exception:
+                pass
+
+
+_recorder = _Recorder()
+
+
+def current_span():
+    """The innermost active span, or a no-op span when nothing is being traced."""
+    return _current.get() or NULL_SPAN
+
+
+@contextmanager
+def span(name: str, trace_id: str = None, **attributes):
+    """
+    Time the enclosed block as a child of the active span (or as a new trace).
+    Exceptions mark the span as failed and propagate unchanged.
+    """
+    parent = _current.get()
+    if parent is not None:
+        current = Span(name, parent.trace_id, parent.span_id, attributes)
+    else:
+        current = Span(name, trace_id or uuid.uuid4().hex, None, attributes)
+        _recorder.start_trace(current.trace_id)
+
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            current.fail(e)
+        raise
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # A generator holding the span was closed from another context
+            _current.set(parent)
+        current.end()
+
+
+# ----------------------------------
+# Stage Statistics
+# ----------------------------------
+def _percentile(sorted_values: list, fraction: float):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def stage_stats(since_seconds: float = 24 * 3600) -> list:
+    """
+    One dict per span name and model seen in the window (so routed stages
+    can be compared model by model): count, errors, p50/p95/p99 wall time,
+    p50 time to first token, mean tokens, cache hit rate, retries, hedges
+    fired and won, and total cost. Sorted by p95, slowest first.
+    """
+    since_ns = time.time_ns() - int(since_seconds * 1e9)
+    groups = {}
+    for row in db.get_spans(since_ns=since_ns):
+        groups.setdefault((row["name"], row["attributes"].get(MODEL)), []).append(row)
+
+    stats = []
+    for (name, model), rows in groups.items():
+        durations = sorted((row["end_ns"] - row["start_ns"]) / 1e6 for row in rows)
+        ttfts = sorted(row["attributes"][TTFT_MS] for row in rows if TTFT_MS in row["attributes"])
+        cache_flags = [row["attributes"][CACHE_HIT] for row in rows if CACHE_HIT in row["attributes"]]
+        hedge_flags = [row["attributes"][HEDGED] for row in rows if HEDGED in row["attributes"]]
+
+        def total(key):
+            return sum(row["attributes"].get(key, 0) for row in rows)
+
+        stats.append({
+            "name": name,
+            "model": model,
+            "count": len(rows),
+            "errors": sum(row["status"] == STATUS_ERROR for row in rows),
+            "p50_ms": round(_percentile(durations, 0.50), 1),
+            "p95_ms": round(_percentile(durations, 0.95), 1),
+            "p99_ms": round(_percentile(durations, 0.99), 1),
+            "ttft_p50_ms": _percentile(ttfts, 0.50),
+            "avg_input_tokens": round(total(INPUT_TOKENS) / len(rows)),
+            "avg_output_tokens": round(total(OUTPUT_TOKENS) / len(rows)),
+            "cache_hit_rate": round(sum(cache_flags) / len(cache_flags), 2) if cache_flags else None,
+            "retries": total(RETRIES),
+            # Share of hedge-eligible calls that fired a duplicate, and duplicates that answered first
+            "hedge_rate": round(sum(hedge_flags) / len(hedge_flags), 3) if hedge_flags else None,
+            "hedge_wins": total(HEDGE_WON),
+            "cost_usd": round(total(COST_USD), 4),
+        })
+    return sorted(stats, key=lambda s: s["p95_ms"], reverse=True)
+
+
+# ----------------------------------
+# OpenTelemetry (OTLP/JSON) Export
+# ----------------------------------
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(row: dict) -> dict:
+    span_json = {
+        "traceId": row["trace_id"],
+        "spanId": row["span_id"],
+        "name": row["name"],
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(row["start_ns"]),
+        "endTimeUnixNano": str(row["end_ns"]),
+        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in row["attributes"].items()],
+        "status": {"code": 2, "message": row["attributes"].get("error.message", "")}
+        if row["status"] == STATUS_ERROR else {"code": 1},
+    }
+    if row["parent_id"]:
+        span_json["parentSpanId"] = row["parent_id"]
+    return span_json
+
+
+def export_otlp(trace_id: str = None, since_seconds: float = None) -> dict:
+    """Stored spans as an OTLP/JSON ExportTraceServiceRequest (one trace, a time window, or all)."""
+    since_ns = time.time_ns() - int(since_seconds * 1e9) if since_seconds else None
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "specgen.tracing"},
+                "spans": [_otlp_span(row) for row in db.get_spans(trace_id=trace_id, since_ns=since_ns)],
+            }],
+        }]
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and export SpecGen traces.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    stats_cmd = sub.add_parser("stats", help="p50/p95/p99 per stage")
+    stats_cmd.add_argument("--hours", type=float, default=24)
+    export_cmd = sub.add_parser("export", help="OTLP/JSON export")
+    export_cmd.add_argument("-o", "--output", default="-")
+    export_cmd.add_argument("--trace", default=None, help="Only this trace id (a job id for app runs)")
+    export_cmd.add_argument("--hours", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    db.init_db()
+    if args.command == "stats":
+        print(f"{'span':<28}{'model':<32}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'tokens in/out':>16}{'cache':>7}{'retries':>9}{'hedged/won':>12}{'cost $':>9}")
+        for s in stage_stats(args.hours * 3600):
+            cache = f"{s['cache_hit_rate']:.0%}" if s["cache_hit_rate"] is not None else "-"
+            tokens = f"{s['avg_input_tokens']}/{s['avg_output_tokens']}"
+            hedges = f"{s['hedge_rate']:.0%}/{s['hedge_wins']}" if s["hedge_rate"] is not None else "-"
+            print(f"{s['name']:<28}{s['model'] or '-':<32}{s['count']:>7}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{tokens:>16}{cache:>7}{s['retries']:>9}{hedges:>12}{s['cost_usd']:>9}")
+        return 0
+
+    payload = json.dumps(export_otlp(args.trace, args.hours * 3600 if args.hours else None))
+    if args.output == "-":
+        print(payload)
+    else:
+        with open(args.output, "w") as f:
+            f.write(payload)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())